@@ -0,0 +1,140 @@
+"""
+本地假服务：模拟 OpenAI 兼容的 LLM / TTS / STT / Embedding 接口
+用于离线压测，可以调延迟、吐字速度、音频大小和错误率
+
+单独启动:
+    python -m bench.fake_server --port 9100 --latency-ms 300 --token-rate 40
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+REPLIES = [
+    "哼，你又来找我聊天了！今天过得怎么样？要不要我陪你摸会儿鱼？",
+    "好啦好啦，我知道了。不过你刚才说的那件事，我可是记下来了哦。",
+    "屏幕前的你看起来有点累。休息一下吧，喝口水，伸个懒腰！",
+]
+
+
+class FakeSettings:
+    def __init__(self, latency_ms=300, token_rate=40.0, audio_kb=24, error_rate=0.0, embed_dim=1024):
+        self.latency_ms = latency_ms      # 首包延迟
+        self.token_rate = token_rate      # LLM 每秒吐多少个 token (这里按字符算)
+        self.audio_kb = audio_kb          # TTS 返回的音频大小
+        self.error_rate = error_rate      # 随机返回 500 的概率
+        self.embed_dim = embed_dim
+
+
+def create_app(settings: FakeSettings) -> FastAPI:
+    app = FastAPI()
+
+    async def delay():
+        await asyncio.sleep(settings.latency_ms / 1000)
+
+    def should_fail():
+        return random.random() < settings.error_rate
+
+    def fail():
+        return JSONResponse({"error": {"message": "fake upstream error"}}, status_code=500)
+
+    def build_answer():
+        return json.dumps({
+            "thought": "用户在和我聊天，随便回应一下。",
+            "emotion": random.choice(["happy", "neutral", "bored"]),
+            "reply": random.choice(REPLIES),
+            "memory_operation": {"new_facts": None, "new_episode": None, "is_silence_requested": False}
+        }, ensure_ascii=False)
+
+    @app.post("/v1/chat/completions")
+    async def chat(request: Request):
+        body = await request.json()
+        await delay()
+        if should_fail():
+            return fail()
+        answer = build_answer()
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        model = body.get("model", "fake")
+
+        if not body.get("stream"):
+            await asyncio.sleep(len(answer) / settings.token_rate)
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 100, "completion_tokens": len(answer), "total_tokens": 100 + len(answer)}
+            }
+
+        async def events():
+            step = 4
+            for i in range(0, len(answer), step):
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": answer[i:i + step]}, "finish_reason": None}]
+                }
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                await asyncio.sleep(step / settings.token_rate)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v1/audio/speech")
+    async def speech(request: Request):
+        await request.body()
+        await delay()
+        if should_fail():
+            return fail()
+        return Response(os.urandom(settings.audio_kb * 1024), media_type="audio/mpeg")
+
+    @app.post("/v1/audio/transcriptions")
+    async def transcriptions(request: Request):
+        await request.body()
+        await delay()
+        if should_fail():
+            return fail()
+        return {"text": random.choice(["你好呀", "今天好累", "帮我看看屏幕"])}
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        await delay()
+        if should_fail():
+            return fail()
+        inputs = body.get("input")
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        data = []
+        for i, text in enumerate(inputs):
+            rng = random.Random(text)
+            data.append({"object": "embedding", "index": i, "embedding": [rng.uniform(-1, 1) for _ in range(settings.embed_dim)]})
+        return {"object": "list", "data": data, "model": body.get("model"), "usage": {"prompt_tokens": 0, "total_tokens": 0}}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地假 OpenAI 兼容服务")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--token-rate", type=float, default=40)
+    parser.add_argument("--audio-kb", type=int, default=24)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    import uvicorn
+    settings = FakeSettings(args.latency_ms, args.token_rate, args.audio_kb, args.error_rate)
+    uvicorn.run(create_app(settings), host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
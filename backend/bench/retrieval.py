@@ -0,0 +1,148 @@
+"""
+长期记忆检索压测：合成一个大记忆库，对比 纯向量 (原来的 top3) 和 混合检索 的召回率与查询耗时
+
+    cd backend
+    python -m bench.retrieval --episodes 100000 --queries 300
+
+Embedding 用字二元组哈希投影 + 噪声代替真实模型 (不联网)，
+查询是对目标记忆的改写 (人名 + 地点 + 活动)，看目标能不能进前 K 条
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import zlib
+
+import chromadb
+import numpy as np
+
+from bench.run import BACKEND_DIR, git_commit, summarize
+from retrieval import HybridRetriever
+
+SURNAME = "小阿老大"
+GIVEN = "橘花明月星雨风云琳杰涛静宇轩晨阳柚桃糖果豆乐"
+PLACES = ["公园", "商场", "图书馆", "咖啡店", "电影院", "海边", "山上", "学校", "公司", "火锅店",
+          "游乐园", "博物馆", "菜市场", "体育馆", "网吧", "奶茶店", "医院", "车站", "夜市", "书店"]
+ACTIVITIES = ["散步", "吃火锅", "看电影", "打羽毛球", "写代码", "拍照", "买衣服", "喝奶茶", "复习考试",
+              "唱歌", "打游戏", "看展览", "跑步", "钓鱼", "做蛋糕", "听演唱会", "吵架", "聊人生", "逛街", "加班"]
+FEELINGS = ["特别开心", "有点累", "很无聊", "笑到肚子疼", "有点难过", "超级满足", "气死了", "还挺放松"]
+
+
+def make_episodes(n: int, rng: random.Random, now: float):
+    names = [s + g for s in SURNAME for g in GIVEN]
+    episodes = []
+    for i in range(n):
+        name, place, act = rng.choice(names), rng.choice(PLACES), rng.choice(ACTIVITIES)
+        text = f"用户和{name}去{place}{act}，{rng.choice(FEELINGS)}"
+        ts = now - rng.uniform(0, 730) * 86400
+        episodes.append({
+            "id": f"ep{i}",
+            "text": text,
+            "query": f"还记得我跟{name}在{place}{act}那次吗",
+            "meta": {"timestamp": ts, "date": time.strftime("%Y-%m-%d", time.localtime(ts))},
+        })
+    return episodes
+
+
+def fake_embed(texts, dim: int, noise: float, rng: np.random.Generator):
+    """字二元组哈希到固定维度，加噪声模拟模型的不完美，最后归一化"""
+    out = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for i in range(len(text) - 1):
+            out[row, zlib.crc32(text[i:i + 2].encode()) % dim] += 1.0
+    out += rng.normal(0, noise, out.shape).astype(np.float32)
+    out /= np.linalg.norm(out, axis=1, keepdims=True) + 1e-9
+    return out.tolist()
+
+
+async def run_queries(retriever, collection, queries, dim, noise, np_rng, k):
+    vector_hits = hybrid_hits = keyword_hits = 0
+    vector_ms, hybrid_ms, keyword_ms = [], [], []
+    await retriever.ensure_loaded()
+    for ep in queries:
+        vec = fake_embed([ep["query"]], dim, noise, np_rng)[0]
+
+        started = time.perf_counter()
+        res = await asyncio.to_thread(collection.query, query_embeddings=[vec], n_results=k)
+        vector_ms.append((time.perf_counter() - started) * 1000)
+        vector_hits += ep["id"] in res["ids"][0]
+
+        started = time.perf_counter()
+        ranked = await retriever.search(ep["query"], vec, k)
+        hybrid_ms.append((time.perf_counter() - started) * 1000)
+        hybrid_hits += ep["id"] in [r["id"] for r in ranked]
+
+        started = time.perf_counter()
+        ranked = await retriever.search(ep["query"], None, k)
+        keyword_ms.append((time.perf_counter() - started) * 1000)
+        keyword_hits += ep["id"] in [r["id"] for r in ranked]
+
+    n = len(queries)
+    return {
+        "vector_only": {"recall": round(vector_hits / n, 3), "latency_ms": summarize(vector_ms)},
+        "keyword_only": {"recall": round(keyword_hits / n, 3), "latency_ms": summarize(keyword_ms)},
+        "hybrid": {"recall": round(hybrid_hits / n, 3), "latency_ms": summarize(hybrid_ms)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="长期记忆检索压测")
+    parser.add_argument("--episodes", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--k", type=int, default=3, help="召回率按前 K 条算")
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--noise", type=float, default=0.15, help="假 embedding 的噪声强度")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default=os.path.join(BACKEND_DIR, "bench_results"))
+    args = parser.parse_args()
+
+    rng, np_rng = random.Random(args.seed), np.random.default_rng(args.seed)
+    now = time.time()
+    workdir = tempfile.mkdtemp(prefix="neuro_retrieval_")
+    try:
+        print(f"🧪 生成 {args.episodes} 条合成记忆...")
+        episodes = make_episodes(args.episodes, rng, now)
+        collection = chromadb.PersistentClient(path=workdir).get_or_create_collection("episodes")
+
+        started = time.perf_counter()
+        batch = 5000
+        for i in range(0, len(episodes), batch):
+            chunk = episodes[i:i + batch]
+            collection.add(
+                ids=[ep["id"] for ep in chunk],
+                documents=[ep["text"] for ep in chunk],
+                metadatas=[ep["meta"] for ep in chunk],
+                embeddings=fake_embed([ep["text"] for ep in chunk], args.dim, args.noise, np_rng),
+            )
+        insert_s = time.perf_counter() - started
+
+        retriever = HybridRetriever(collection)
+        started = time.perf_counter()
+        asyncio.run(retriever.ensure_loaded())
+        index_s = time.perf_counter() - started
+
+        queries = rng.sample(episodes, min(args.queries, len(episodes)))
+        result = asyncio.run(run_queries(retriever, collection, queries, args.dim, args.noise, np_rng, args.k))
+        result.update({"insert_s": round(insert_s, 1), "keyword_index_build_s": round(index_s, 1)})
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {"commit": git_commit(), "time": time.strftime("%Y-%m-%d %H:%M:%S"), "params": vars(args), "result": result}
+    os.makedirs(args.out, exist_ok=True)
+    out_path = os.path.join(args.out, f"retrieval_{report['commit'] or 'nogit'}_{int(time.time())}.json")
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    for name in ("vector_only", "keyword_only", "hybrid"):
+        item = result[name]
+        print(f"   {name:13s} recall@{args.k}: {item['recall']:.3f}  耗时: {item['latency_ms']}")
+    print(f"   写入 {result['insert_s']}s, 关键词索引构建 {result['keyword_index_build_s']}s")
+    print(f"   结果已保存: {out_path}")
+
+
+if __name__ == "__main__":
+    main()
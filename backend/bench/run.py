@@ -0,0 +1,316 @@
+"""
+离线压测：起本地假服务 + 真实后端，用脚本化的会话打 /ws
+
+    cd backend
+    python -m bench.run --sessions 8 --latency-ms 300 --token-rate 40
+    python -m bench.run --sessions 8 --compare bench_results/上一次.json
+    python -m bench.run --sessions 300 --latency-ms 500   # 几百个独立用户的多会话压测
+
+输出：首句音频时间 (TTFA)、整轮耗时、并发吞吐、后端内存增长，结果存成 JSON
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import websockets
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_SCRIPT = [
+    {"text": "你好呀，今天过得怎么样？"},
+    {"idle": 2},
+    {"audio_kb": 32},
+    {"text": "帮我记住，我最喜欢的动物是猫"},
+    {"idle": 1},
+    {"text": "你还记得我喜欢什么吗？"},
+]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_http(url: str, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1)
+            return
+        except Exception:
+            time.sleep(0.2)
+    raise RuntimeError(f"服务没有在 {timeout}s 内启动: {url}")
+
+
+def read_rss_mb(pid: int):
+    """后端进程常驻内存 (MB)"""
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss / 1024 / 1024
+    except ImportError:
+        pass
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))], 1)
+
+
+def summarize(values):
+    return {
+        "count": len(values),
+        "p50": percentile(values, 0.5),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+        "max": round(max(values), 1) if values else None,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+    except Exception:
+        return None
+
+
+async def run_turn(ws, packet, timeout: float, binary: bytes = None):
+    """发一个输入，等到本轮结束 (state_update -> idle)"""
+    started = time.perf_counter()
+    first_audio = None
+    chunks = 0
+    await ws.send(json.dumps(packet))
+    if binary is not None:
+        await ws.send(binary)
+    seen_thinking = False
+    while True:
+        raw = await asyncio.wait_for(ws.recv(), timeout=timeout)
+        if isinstance(raw, bytes):
+            continue
+        msg = json.loads(raw)
+        if msg["type"] == "audio_chunk":
+            chunks += 1
+            if first_audio is None:
+                first_audio = (time.perf_counter() - started) * 1000
+        elif msg["type"] == "state_update":
+            state = msg["payload"]["state"]
+            if state == "thinking":
+                seen_thinking = True
+            elif state == "idle" and seen_thinking:
+                break
+    return {"ttfa_ms": first_audio, "turn_ms": (time.perf_counter() - started) * 1000, "chunks": chunks}
+
+
+async def run_session(url: str, script: list, timeout: float, results: list, errors: list, binary: bool = False):
+    try:
+        async with websockets.connect(url, max_size=None) as ws:
+            for step in script:
+                if "idle" in step:
+                    await asyncio.sleep(step["idle"])
+                    continue
+                raw_audio = None
+                if "text" in step:
+                    packet = {"type": "text_input", "payload": {"text": step["text"]}}
+                    kind = "text"
+                elif binary:
+                    raw_audio = os.urandom(step["audio_kb"] * 1024)
+                    packet = {"type": "audio_input", "payload": {"format": "audio/webm", "binary": True}}
+                    kind = "audio"
+                else:
+                    audio = base64.b64encode(os.urandom(step["audio_kb"] * 1024)).decode()
+                    packet = {"type": "audio_input", "payload": {"audio_base64": audio, "format": "audio/webm"}}
+                    kind = "audio"
+                turn = await run_turn(ws, packet, timeout, raw_audio)
+                turn["kind"] = kind
+                results.append(turn)
+    except Exception as e:
+        errors.append(repr(e))
+
+
+async def fetch_stage_metrics(url: str):
+    """借用后端的 metrics 消息，拿各阶段耗时分布"""
+    try:
+        async with websockets.connect(url, max_size=None) as ws:
+            await ws.send(json.dumps({"type": "metrics"}))
+            while True:
+                msg = json.loads(await asyncio.wait_for(ws.recv(), timeout=5))
+                if msg["type"] == "metrics":
+                    return msg["payload"]["stages"]
+    except Exception as e:
+        print(f"⚠️ 拿不到后端阶段统计: {e}")
+        return None
+
+
+async def drive(url: str, pid: int, sessions: int, script: list, timeout: float, binary: bool = False,
+                shared_user: bool = False):
+    results, errors, rss = [], [], []
+
+    async def sample_rss():
+        while True:
+            value = read_rss_mb(pid)
+            if value is not None:
+                rss.append(value)
+            await asyncio.sleep(0.5)
+
+    sampler = asyncio.create_task(sample_rss())
+    started = time.perf_counter()
+    def session_url(i):
+        # 默认每个连接一个独立用户，测多会话扩展性
+        params = [f"user={'bench' if shared_user else f'bench-{i}'}"]
+        if binary:
+            params.append("audio=binary")
+        return f"{url}?{'&'.join(params)}"
+
+    await asyncio.gather(*(
+        run_session(session_url(i), script, timeout, results, errors, binary) for i in range(sessions)
+    ))
+    wall = time.perf_counter() - started
+    sampler.cancel()
+    stages = await fetch_stage_metrics(url)
+
+    return {
+        "wall_s": round(wall, 2),
+        "turns": len(results),
+        "turns_per_s": round(len(results) / wall, 3) if wall else None,
+        "errors": errors,
+        "ttfa_ms": summarize([r["ttfa_ms"] for r in results if r["ttfa_ms"] is not None]),
+        "turn_ms": summarize([r["turn_ms"] for r in results]),
+        "turn_ms_by_kind": {
+            kind: summarize([r["turn_ms"] for r in results if r["kind"] == kind])
+            for kind in sorted({r["kind"] for r in results})
+        },
+        "rss_mb": {
+            "start": round(rss[0], 1) if rss else None,
+            "peak": round(max(rss), 1) if rss else None,
+            "end": round(rss[-1], 1) if rss else None,
+            "growth": round(rss[-1] - rss[0], 1) if rss else None,
+        },
+        "stages": stages,
+    }
+
+
+def compare(current: dict, previous_path: str):
+    with open(previous_path, encoding="utf-8") as f:
+        previous = json.load(f)
+    print(f"\n📊 对比 {previous.get('commit')} -> {current.get('commit')}")
+    for metric in ("ttfa_ms", "turn_ms"):
+        for q in ("p50", "p95", "p99"):
+            old = previous["result"][metric].get(q)
+            new = current["result"][metric].get(q)
+            if old and new:
+                print(f"   {metric} {q}: {old} -> {new} ({(new - old) / old * 100:+.1f}%)")
+    old_tp, new_tp = previous["result"]["turns_per_s"], current["result"]["turns_per_s"]
+    print(f"   turns/s: {old_tp} -> {new_tp}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="桌宠后端离线压测")
+    parser.add_argument("--sessions", type=int, default=4, help="并发 WebSocket 数")
+    parser.add_argument("--script", help="会话脚本 JSON 文件 (默认内置脚本)")
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--token-rate", type=float, default=40)
+    parser.add_argument("--audio-kb", type=int, default=24)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--binary", action="store_true", help="用二进制音频帧协议")
+    parser.add_argument("--shared-user", action="store_true", help="所有连接共用一个用户 id")
+    parser.add_argument("--turn-timeout", type=float, default=60)
+    parser.add_argument("--out", default=os.path.join(BACKEND_DIR, "bench_results"))
+    parser.add_argument("--compare", help="和之前的结果 JSON 对比")
+    parser.add_argument("--env", action="append", default=[], help="额外传给后端的环境变量 KEY=VALUE")
+    args = parser.parse_args()
+
+    script = DEFAULT_SCRIPT
+    if args.script:
+        with open(args.script, encoding="utf-8") as f:
+            script = json.load(f)
+
+    fake_port, backend_port = free_port(), free_port()
+    fake_base = f"http://127.0.0.1:{fake_port}/v1"
+    workdir = tempfile.mkdtemp(prefix="neuro_bench_")  # 记忆库/缓存都落在临时目录
+
+    env = dict(os.environ)
+    env.update({
+        "LLM_API_KEY": "fake", "LLM_BASE_URL": fake_base, "LLM_MODEL": "fake-llm",
+        "PROFILE_LLM_KEY": "fake", "PROFILE_LLM_BASE": fake_base,
+        "SILICON_API_KEY": "fake", "SILICON_BASE_URL": fake_base,
+        "TTS_MODEL": "fake-tts", "TTS_VOICE": "fake-tts:anna", "STT_MODEL": "fake-stt",
+        "TTS_CACHE_DIR": os.path.join(workdir, "tts_cache"),
+        "SESSION_DIR": os.path.join(workdir, "sessions"),
+        "FACTS_DIR": os.path.join(workdir, "user_facts"),
+        "FACTS_DB_PATH": os.path.join(workdir, "user_facts.db"),
+        "CONSOLIDATION_ARCHIVE_DIR": os.path.join(workdir, "episode_archive"),
+        "EPISODE_JOURNAL_DIR": os.path.join(workdir, "episode_journal"),
+        "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embedding_cache.db"),
+    })
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+
+    procs = []
+    try:
+        procs.append(subprocess.Popen(
+            [sys.executable, "-m", "bench.fake_server", "--port", str(fake_port),
+             "--latency-ms", str(args.latency_ms), "--token-rate", str(args.token_rate),
+             "--audio-kb", str(args.audio_kb), "--error-rate", str(args.error_rate)],
+            cwd=BACKEND_DIR
+        ))
+        backend = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", BACKEND_DIR,
+             "--host", "127.0.0.1", "--port", str(backend_port), "--log-level", "warning"],
+            cwd=workdir, env=env
+        )
+        procs.append(backend)
+        wait_http(f"http://127.0.0.1:{backend_port}/metrics")
+        print(f"🚀 压测开始: {args.sessions} 个并发会话, 假服务延迟 {args.latency_ms}ms")
+
+        result = asyncio.run(drive(
+            f"ws://127.0.0.1:{backend_port}/ws", backend.pid, args.sessions, script, args.turn_timeout, args.binary,
+            args.shared_user
+        ))
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            proc.wait(timeout=10)
+
+    report = {
+        "commit": git_commit(),
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "params": vars(args),
+        "script": script,
+        "result": result,
+    }
+    os.makedirs(args.out, exist_ok=True)
+    out_path = os.path.join(args.out, f"{report['commit'] or 'nogit'}_{int(time.time())}.json")
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(f"✅ 完成 {result['turns']} 轮, {result['turns_per_s']} 轮/秒, 错误 {len(result['errors'])} 个")
+    print(f"   TTFA: {result['ttfa_ms']}")
+    print(f"   整轮: {result['turn_ms']}")
+    print(f"   内存: {result['rss_mb']}")
+    print(f"   结果已保存: {out_path}")
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from config import Config
+
+
+def normalize_text(text: str) -> str:
+    """统一全半角、去掉多余空白，让同一句话命中同一个 key"""
+    text = unicodedata.normalize("NFKC", text or "")
+    return " ".join(text.split())
+
+
+class AudioCache:
+    """
+    TTS 音频缓存 (内容寻址)
+    key = hash(规范化文本 + 情绪 + 音色 + 模型)
+    - 热层：内存 LRU，按条数限制
+    - 冷层：磁盘 mp3 文件，按总大小做 LRU 淘汰
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int, hot_items: int = 64):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hot_items = hot_items
+        self.hot = OrderedDict()      # key -> bytes
+        self.index = OrderedDict()    # key -> 文件大小，按最近使用排序
+        self.total_bytes = 0
+        self.stats = {"hot_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        # 启动时按修改时间恢复 LRU 顺序
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".mp3"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, name[:-4], st.st_size))
+        for _, key, size in sorted(entries):
+            self.index[key] = size
+            self.total_bytes += size
+
+    @staticmethod
+    def make_key(text: str, emotion: str) -> str:
+        raw = "\x1f".join([normalize_text(text), emotion or "", Config.TTS_VOICE or "", Config.TTS_MODEL or ""])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.mp3")
+
+    def _remember_hot(self, key: str, data: bytes):
+        self.hot[key] = data
+        self.hot.move_to_end(key)
+        while len(self.hot) > self.hot_items:
+            self.hot.popitem(last=False)
+
+    def get(self, key: str):
+        with self._lock:
+            data = self.hot.get(key)
+            if data is not None:
+                self.hot.move_to_end(key)
+                if key in self.index:
+                    self.index.move_to_end(key)
+                self.stats["hot_hits"] += 1
+                return data
+            if key not in self.index:
+                self.stats["misses"] += 1
+                return None
+        try:
+            path = self._path(key)
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # 刷新 LRU 时间
+        except OSError:
+            with self._lock:
+                self.total_bytes -= self.index.pop(key, 0)
+                self.stats["misses"] += 1
+            return None
+        with self._lock:
+            if key in self.index:
+                self.index.move_to_end(key)
+            self._remember_hot(key, data)
+            self.stats["disk_hits"] += 1
+        return data
+
+    def put(self, key: str, data: bytes):
+        if not data:
+            return
+        # 先写临时文件再改名，避免半截文件
+        path = self._path(key)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️ TTS 缓存写入失败: {e}")
+            return
+        with self._lock:
+            self.total_bytes -= self.index.pop(key, 0)
+            self.index[key] = len(data)
+            self.total_bytes += len(data)
+            self._remember_hot(key, data)
+            self._evict()
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and len(self.index) > 1:
+            key, size = self.index.popitem(last=False)
+            self.total_bytes -= size
+            self.hot.pop(key, None)
+            self.stats["evictions"] += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                **self.stats,
+                "entries": len(self.index),
+                "bytes": self.total_bytes,
+                "hot_entries": len(self.hot),
+            }
+
+
+class EmbeddingCache:
+    """
+    向量缓存
+    key = hash(规范化文本 + 模型名)，向量以 float32 字节存进 SQLite
+    - 热层：内存 LRU
+    - 冷层：SQLite，按条数上限淘汰最久未使用的
+    """
+
+    def __init__(self, db_path: str, max_entries: int, hot_items: int = 256):
+        self.max_entries = max_entries
+        self.hot_items = hot_items
+        self.hot = OrderedDict()      # key -> list[float]
+        self.stats = {"hot_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, dim INTEGER, vec BLOB, last_used REAL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)")
+        self.db.commit()
+        # 条数在内存里维护，写入时不用每次 COUNT 整张表
+        self.entries = self.db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def make_key(text: str, model: str) -> str:
+        # 大小写、首尾标点不同的输入当成同一句
+        norm = normalize_text(text).casefold().strip("。！？!?，,.~～… ")
+        return hashlib.sha256(f"{model}\x1f{norm}".encode("utf-8")).hexdigest()
+
+    def _remember_hot(self, key: str, vec: list):
+        self.hot[key] = vec
+        self.hot.move_to_end(key)
+        while len(self.hot) > self.hot_items:
+            self.hot.popitem(last=False)
+
+    def get_many(self, keys: list):
+        """批量查询，返回 {key: vector}，没命中的不在结果里"""
+        found = {}
+        with self._lock:
+            cold = []
+            for key in keys:
+                vec = self.hot.get(key)
+                if vec is not None:
+                    self.hot.move_to_end(key)
+                    self.stats["hot_hits"] += 1
+                    found[key] = vec
+                else:
+                    cold.append(key)
+            if cold:
+                marks = ",".join("?" * len(cold))
+                rows = self.db.execute(
+                    f"SELECT key, vec FROM embeddings WHERE key IN ({marks})", cold
+                ).fetchall()
+                now = time.time()
+                for key, blob in rows:
+                    vec = array("f", blob).tolist()
+                    found[key] = vec
+                    self._remember_hot(key, vec)
+                    self.stats["disk_hits"] += 1
+                self.db.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key, _ in rows]
+                )
+                self.db.commit()
+                self.stats["misses"] += len(cold) - len(rows)
+        return found
+
+    def put_many(self, items: dict):
+        """items: {key: vector}"""
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            keys = list(items)
+            marks = ",".join("?" * len(keys))
+            existing = self.db.execute(f"SELECT COUNT(*) FROM embeddings WHERE key IN ({marks})", keys).fetchone()[0]
+            self.db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, dim, vec, last_used) VALUES (?, ?, ?, ?)",
+                [(key, len(vec), array("f", vec).tobytes(), now) for key, vec in items.items()]
+            )
+            for key, vec in items.items():
+                self._remember_hot(key, vec)
+            self.entries += len(keys) - existing
+            if self.entries > self.max_entries:
+                self._evict()
+            self.db.commit()
+
+    def _evict(self):
+        overflow = self.entries - self.max_entries
+        deleted = self.db.execute(
+            "DELETE FROM embeddings WHERE key IN "
+            "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)", (overflow,)
+        ).rowcount
+        self.entries -= deleted
+        self.stats["evictions"] += deleted
+
+    def get_stats(self):
+        with self._lock:
+            return {**self.stats, "entries": self.entries, "hot_entries": len(self.hot)}
+
+
+# 两个缓存都在第一次用到时才创建 (只导入模块不会建目录 / 数据库)
+_tts_cache = None
+_embedding_cache = None
+_init_lock = threading.Lock()
+
+def get_tts_cache() -> AudioCache:
+    global _tts_cache
+    with _init_lock:
+        if _tts_cache is None:
+            _tts_cache = AudioCache(
+                cache_dir=Config.TTS_CACHE_DIR,
+                max_bytes=Config.TTS_CACHE_MAX_MB * 1024 * 1024,
+                hot_items=Config.TTS_CACHE_HOT_ITEMS,
+            )
+        return _tts_cache
+
+def get_embedding_cache() -> EmbeddingCache:
+    global _embedding_cache
+    with _init_lock:
+        if _embedding_cache is None:
+            _embedding_cache = EmbeddingCache(
+                db_path=Config.EMBEDDING_CACHE_PATH,
+                max_entries=Config.EMBEDDING_CACHE_MAX_ENTRIES,
+            )
+        return _embedding_cache
@@ -0,0 +1,107 @@
+import base64
+import io
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+from config import Config
+from metrics import metrics
+
+
+class ScreenCapturer:
+    """
+    截图子系统 (独立的工作线程，状态只在这个线程里读写)
+    - 缩小后的画面按格子算平均灰度，和上次编码的那一帧比，没变就直接复用编码好的图
+    - 每个不同的画面只编码一次
+    - CAPTURE_REGION: screen 全屏 / window 只截当前窗口 / changes 只发变化的区域
+      (缓存的始终是整屏，画面没变时复用的是整屏而不是上次的局部)
+    """
+
+    def __init__(self, grab=None):
+        # grab: 无参、返回一张 PIL 图的截屏函数；默认用 pyautogui (用到时才导入，测试可以换成假的)
+        self.grab = grab or self._screenshot
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="capture")
+        self.last_tiles = None     # 上次编码那一帧的格子灰度
+        self.last_encoded = None   # 上次编码好的整屏 Base64
+
+    @staticmethod
+    def _active_window():
+        """当前窗口的 (left, top, width, height)；拿不到 (非 Windows / 最小化) 就返回 None"""
+        try:
+            import pyautogui
+            win = pyautogui.getActiveWindow()
+        except Exception:
+            return None
+        if not win or win.width <= 0 or win.height <= 0:
+            return None
+        left, top = max(0, win.left), max(0, win.top)
+        return left, top, win.width - (left - win.left), win.height - (top - win.top)
+
+    def _screenshot(self):
+        import pyautogui
+        region = self._active_window() if Config.CAPTURE_REGION == "window" else None
+        return pyautogui.screenshot(region=region) if region else pyautogui.screenshot()
+
+    @staticmethod
+    def _shrink(image, max_width: int):
+        if image.width <= max_width:
+            return image
+        height = max(1, int(image.height * max_width / image.width))
+        # 大幅缩小时先整数倍降采样再插值，比默认的 BICUBIC 全图插值快得多
+        return image.resize((max_width, height), Image.BILINEAR, reducing_gap=2.0)
+
+    @staticmethod
+    def _tiles(image):
+        """每个 CAPTURE_TILE 见方的格子的平均灰度 (二维数组)"""
+        gray = np.asarray(image.convert("L"), dtype=np.float32)
+        t = Config.CAPTURE_TILE
+        h, w = gray.shape[0] // t * t, gray.shape[1] // t * t
+        if not h or not w:
+            return gray.mean(keepdims=True)
+        return gray[:h, :w].reshape(h // t, t, w // t, t).mean(axis=(1, 3))
+
+    @staticmethod
+    def _crop_changes(shot, small, changed):
+        """按变化的格子在原图上裁出一块 (多留一格边)，变化太大就还用整屏"""
+        rows, cols = np.nonzero(changed)
+        if (rows.max() - rows.min() + 1) * (cols.max() - cols.min() + 1) > changed.size * 0.6:
+            return small
+        t = Config.CAPTURE_TILE * shot.width / small.width   # 换算回原图像素
+        box = (
+            max(0, int((cols.min() - 1) * t)),
+            max(0, int((rows.min() - 1) * t)),
+            min(shot.width, int((cols.max() + 2) * t)),
+            min(shot.height, int((rows.max() + 2) * t)),
+        )
+        return ScreenCapturer._shrink(shot.crop(box), Config.CAPTURE_MAX_WIDTH)
+
+    def capture(self):
+        """截一帧，返回 JPEG 的 Base64；画面没变时返回上次的结果"""
+        with metrics.span("screenshot_capture"):
+            shot = self.grab()
+            small = self._shrink(shot, Config.CAPTURE_MAX_WIDTH)
+            tiles = self._tiles(small)
+
+        changed = None
+        if self.last_tiles is not None and self.last_tiles.shape == tiles.shape:
+            changed = np.abs(tiles - self.last_tiles) > Config.CAPTURE_DIFF_THRESHOLD
+            if not changed.any():
+                metrics.incr("screenshot_reused")
+                return self.last_encoded
+
+        with metrics.span("screenshot_encode"):
+            encoded = self._encode(small)
+            self.last_tiles, self.last_encoded = tiles, encoded
+            if Config.CAPTURE_REGION == "changes" and changed is not None:
+                region = self._crop_changes(shot, small, changed)
+                if region is not small:
+                    return self._encode(region)
+        return encoded
+
+    @staticmethod
+    def _encode(image) -> str:
+        buffered = io.BytesIO()
+        image.convert("RGB").save(buffered, format="JPEG", quality=Config.CAPTURE_JPEG_QUALITY)
+        return base64.b64encode(buffered.getvalue()).decode("utf-8")
+
+
+screen_capturer = ScreenCapturer()
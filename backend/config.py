@@ -12,6 +12,7 @@ class Config:
     # Profile / Intent
     PROFILE_KEY = os.getenv("PROFILE_LLM_KEY")
     PROFILE_BASE = os.getenv("PROFILE_LLM_BASE")
+    PROFILE_MODEL = os.getenv("PROFILE_LLM_MODEL", "deepseek-chat")
 
     # SiliconFlow (TTS/STT)
     SILICON_KEY = os.getenv("SILICON_API_KEY")
@@ -20,5 +21,125 @@ class Config:
     TTS_VOICE = os.getenv("TTS_VOICE")
     STT_MODEL = os.getenv("STT_MODEL", "FunAudioLLM/SenseVoiceSmall")
 
+    # 语音识别后端: remote (SiliconFlow) / local (sherpa-onnx + SenseVoice，离线 CPU)
+    STT_BACKEND = os.getenv("STT_BACKEND", "remote")
+    LOCAL_STT_MODEL_DIR = os.getenv("LOCAL_STT_MODEL_DIR", "./models/sense-voice")
+    LOCAL_STT_THREADS = int(os.getenv("LOCAL_STT_THREADS", "2"))          # 单次解码用几个线程
+    LOCAL_STT_WORKERS = int(os.getenv("LOCAL_STT_WORKERS", "2"))          # 同时解码几路
+    STT_VAD_THRESHOLD = int(os.getenv("STT_VAD_THRESHOLD", "500"))        # 能量阈值 (16bit PCM 的 RMS)
+    STT_ENDPOINT_SILENCE_MS = int(os.getenv("STT_ENDPOINT_SILENCE_MS", "600"))  # 尾部静音多久算说完
+    STT_PARTIAL_INTERVAL_MS = int(os.getenv("STT_PARTIAL_INTERVAL_MS", "500"))  # 中间结果刷新间隔
+
+    # 推测执行：用户还在说话时，拿中间识别结果提前准备这一轮
+    # off / retrieval (只提前检索记忆) / full (连主脑回复和语音一起提前生成)
+    SPECULATIVE_MODE = os.getenv("SPECULATIVE_MODE", "off")
+    SPECULATIVE_MATCH_RATIO = float(os.getenv("SPECULATIVE_MATCH_RATIO", "0.85"))  # 低于这个相似度就作废重来
+    SPECULATIVE_MIN_CHARS = int(os.getenv("SPECULATIVE_MIN_CHARS", "4"))          # 稳定前缀太短不推测
+
+    # 截图 (看屏幕)
+    CAPTURE_REGION = os.getenv("CAPTURE_REGION", "screen")   # screen 全屏 / window 当前窗口 / changes 只截变化的区域
+    CAPTURE_MAX_WIDTH = int(os.getenv("CAPTURE_MAX_WIDTH", "640"))
+    CAPTURE_JPEG_QUALITY = int(os.getenv("CAPTURE_JPEG_QUALITY", "70"))
+    CAPTURE_TILE = int(os.getenv("CAPTURE_TILE", "32"))                              # 变化检测的格子大小 (缩小后的像素)
+    CAPTURE_DIFF_THRESHOLD = float(os.getenv("CAPTURE_DIFF_THRESHOLD", "6"))         # 格子平均灰度差超过这个算画面变了
+
+    # 本地意图识别 (勿扰 / 看屏幕 / 要不要检索 / 要不要调主脑)
+    INTENT_FASTPATH = os.getenv("INTENT_FASTPATH", "true").lower() == "true"      # 简单轮次直接用预置台词回复
+    INTENT_CONFIDENCE = float(os.getenv("INTENT_CONFIDENCE", "0.85"))             # 置信度够高才跳过主脑
+    INTENT_FASTPATH_MAX_CHARS = int(os.getenv("INTENT_FASTPATH_MAX_CHARS", "10")) # 超过这么长的句子一律交给主脑
+    INTENT_VISION_CONFIDENCE = float(os.getenv("INTENT_VISION_CONFIDENCE", "0.6"))
+    INTENT_TRAIN_PATH = os.getenv("INTENT_TRAIN_PATH", "")                        # 追加训练样本 JSON {"意图": ["句子", ...]}
+
+    # 流式回复：边生成边按句合成语音
+    STREAM_REPLY = os.getenv("STREAM_REPLY", "true").lower() == "true"
+
+    # 主动发言预生成：空闲时提前把台词和语音准备好，到点直接播
+    PROACTIVE_POOL_SIZE = int(os.getenv("PROACTIVE_POOL_SIZE", "1"))           # 候选条数，0 = 关闭 (播一条历史就变了，多备也会作废)
+    PROACTIVE_PREFILL_LEAD = float(os.getenv("PROACTIVE_PREFILL_LEAD", "20"))  # 到期前多少秒开始准备
+    PROACTIVE_POOL_TTL = float(os.getenv("PROACTIVE_POOL_TTL", "900"))         # 候选放多久作废 (秒)
+
+    # TTS 音频缓存
+    TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "./tts_cache")
+    TTS_CACHE_MAX_MB = int(os.getenv("TTS_CACHE_MAX_MB", "200"))
+    TTS_CACHE_HOT_ITEMS = int(os.getenv("TTS_CACHE_HOT_ITEMS", "64"))
+
+    # Embedding
+    EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "Qwen/Qwen3-Embedding-8B")
+    EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+    EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache.db")
+    EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "50000"))
+    # 向量化后端: remote (上面的模型) / local (onnxruntime 跑 int8 小模型，离线 CPU)
+    # 换后端或换模型后，记忆库会在第一次打开时整体重新向量化
+    EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "remote")
+    LOCAL_EMBEDDING_MODEL_DIR = os.getenv("LOCAL_EMBEDDING_MODEL_DIR", "./models/bge-small-zh-v1.5")
+    LOCAL_EMBEDDING_THREADS = int(os.getenv("LOCAL_EMBEDDING_THREADS", "2"))   # 单批推理的线程数
+    LOCAL_EMBEDDING_WORKERS = int(os.getenv("LOCAL_EMBEDDING_WORKERS", "2"))   # 同时推理几批
+    LOCAL_EMBEDDING_MAX_TOKENS = int(os.getenv("LOCAL_EMBEDDING_MAX_TOKENS", "256"))
+    LOCAL_EMBEDDING_POOLING = os.getenv("LOCAL_EMBEDDING_POOLING", "cls")      # bge 用 cls，e5 用 mean
+
+    # 经历的后台写入队列
+    EPISODE_JOURNAL_DIR = os.getenv("EPISODE_JOURNAL_DIR", "./episode_journal")      # 还没写进库的经历先记在这
+    EPISODE_BATCH_SIZE = int(os.getenv("EPISODE_BATCH_SIZE", "16"))                   # 攒够这么多立刻写
+    EPISODE_FLUSH_INTERVAL = float(os.getenv("EPISODE_FLUSH_INTERVAL", "2.0"))        # 否则最多等这么久 (秒)
+    EPISODE_DEDUP_THRESHOLD = float(os.getenv("EPISODE_DEDUP_THRESHOLD", "0.95"))     # 和最近经历的余弦相似度超过就跳过
+    EPISODE_DEDUP_WINDOW = int(os.getenv("EPISODE_DEDUP_WINDOW", "200"))              # 和最近多少条比
+
+    # 多用户会话
+    SESSION_DIR = os.getenv("SESSION_DIR", "./sessions")           # 闲置会话存盘位置
+    SESSION_IDLE_TIMEOUT = int(os.getenv("SESSION_IDLE_TIMEOUT", "600"))
+    FACTS_DIR = os.getenv("FACTS_DIR", "./user_facts")             # 老版本非 default 用户的事实文件 (启动时导入)
+    FACTS_DB_PATH = os.getenv("FACTS_DB_PATH", "./user_facts.db")  # 事实库 (SQLite，所有用户共用)
+
+    # 上下文 token 预算
+    CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))   # 整个 prompt
+    HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))   # 短期历史，超出折叠进摘要
+    HISTORY_COMPACT_RATIO = float(os.getenv("HISTORY_COMPACT_RATIO", "0.6"))  # 超预算时一次折叠到预算的这个比例
+    FACTS_TOKEN_BUDGET = int(os.getenv("FACTS_TOKEN_BUDGET", "400"))        # 用户事实 (固定放进系统提示)
+    FACTS_EXTRA_TOKEN_BUDGET = int(os.getenv("FACTS_EXTRA_TOKEN_BUDGET", "150"))  # 预算外但和本轮相关的事实
+    SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", LLM_MODEL)                   # 生成滚动摘要用的模型
+
+    # 长期记忆检索 (向量 + BM25 关键词，RRF 融合后按新旧衰减)
+    RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "3"))                  # 最终放进提示词几条
+    RETRIEVAL_VECTOR_POOL = int(os.getenv("RETRIEVAL_VECTOR_POOL", "30"))      # 向量召回候选数
+    RETRIEVAL_KEYWORD_POOL = int(os.getenv("RETRIEVAL_KEYWORD_POOL", "30"))    # 关键词召回候选数
+    RETRIEVAL_RRF_K = int(os.getenv("RETRIEVAL_RRF_K", "60"))
+    RETRIEVAL_HALF_LIFE_DAYS = float(os.getenv("RETRIEVAL_HALF_LIFE_DAYS", "30"))
+    RETRIEVAL_RECENCY_WEIGHT = float(os.getenv("RETRIEVAL_RECENCY_WEIGHT", "0.3"))  # 时间衰减占多大比重
+
+    # 经历整理 (空闲时把旧经历按周合并成摘要，集合不再无限变大)
+    CONSOLIDATION_ENABLED = os.getenv("CONSOLIDATION_ENABLED", "true").lower() == "true"
+    CONSOLIDATION_INTERVAL_HOURS = float(os.getenv("CONSOLIDATION_INTERVAL_HOURS", "24"))  # 两次整理至少隔多久
+    CONSOLIDATION_MIN_AGE_DAYS = int(os.getenv("CONSOLIDATION_MIN_AGE_DAYS", "14"))      # 比这更早的经历才整理
+    CONSOLIDATION_MIN_GROUP = int(os.getenv("CONSOLIDATION_MIN_GROUP", "3"))             # 一周不到这么多条就不合并
+    CONSOLIDATION_MAX_GROUP = int(os.getenv("CONSOLIDATION_MAX_GROUP", "40"))            # 一次最多合并多少条 (控制摘要输入长度)
+    CONSOLIDATION_ARCHIVE_DIR = os.getenv("CONSOLIDATION_ARCHIVE_DIR", "./episode_archive")  # 被合并的原始经历存这；留空则直接删除
+
+    # 主脑路由 (多个 OpenAI 兼容后端，按实时延迟 / 出错率挑)
+    # JSON 列表: [{"name", "base_url", "model", "api_key" 或 "api_key_env", "vision": true, "cheap": true}]
+    # 留空 = LLM_* (主脑，能看图) + PROFILE_LLM_* (DeepSeek，便宜，主动发言优先用)
+    LLM_BACKENDS = os.getenv("LLM_BACKENDS", "")
+    LLM_ROUTER_EWMA_ALPHA = float(os.getenv("LLM_ROUTER_EWMA_ALPHA", "0.3"))
+    LLM_ROUTER_PRIOR_MS = float(os.getenv("LLM_ROUTER_PRIOR_MS", "3000"))           # 还没测过的后端按这个延迟估
+    LLM_ROUTER_ERROR_PENALTY = float(os.getenv("LLM_ROUTER_ERROR_PENALTY", "4"))    # 出错率对分数的放大倍数
+    LLM_FAILOVER_SHARE = float(os.getenv("LLM_FAILOVER_SHARE", "0.6"))              # 还有备选时一个后端最多占剩余时间预算的比例
+
+    # 网络 (共用连接池 / 每类接口的超时 / 重试 / 熔断 / 对冲请求)
+    HTTP2 = os.getenv("HTTP2", "true").lower() == "true"                          # 需要装 h2 (httpx[http2])
+    HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+    HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+    HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "120"))       # 空闲长连接保留多久 (秒)
+    HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+    TIMEOUT_LLM = float(os.getenv("TIMEOUT_LLM", "30"))                           # 各类接口一次调用的总预算 (秒，含重试)
+    TIMEOUT_SUMMARY = float(os.getenv("TIMEOUT_SUMMARY", "60"))
+    TIMEOUT_TTS = float(os.getenv("TIMEOUT_TTS", "15"))
+    TIMEOUT_STT = float(os.getenv("TIMEOUT_STT", "20"))
+    TIMEOUT_EMBEDDING = float(os.getenv("TIMEOUT_EMBEDDING", "15"))
+    RETRY_MAX = int(os.getenv("RETRY_MAX", "2"))
+    RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.3"))                # 退避基数 (秒)，每次翻倍再加抖动
+    CIRCUIT_FAILURES = int(os.getenv("CIRCUIT_FAILURES", "5"))                    # 连续失败多少次熔断
+    CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))       # 熔断多久后放一个请求试探
+    HEDGE_LLM_AFTER = float(os.getenv("HEDGE_LLM_AFTER", "0"))                    # 主脑等这么久没回来就再发一份 (秒，0 关闭)
+    HEDGE_TTS_AFTER = float(os.getenv("HEDGE_TTS_AFTER", "0"))                    # TTS 同上
+
     # Proxy
     PROXY = os.getenv("PROXY_URL")
\ No newline at end of file
@@ -0,0 +1,173 @@
+"""
+经历整理：把旧的零碎经历按周合并成一条摘要经历，原始经历归档后从库里删掉
+空闲时由主动发言的调度顺带触发 (见 main.py on_proactive_due)，也可以手动跑：
+
+    cd backend
+    python consolidation.py --user default
+"""
+import asyncio
+import datetime
+import hashlib
+import json
+import os
+import random
+import statistics
+import time
+from config import Config
+from services import AIService
+from embeddings import embed_text
+from retrieval import episode_time
+from metrics import metrics
+
+SUMMARY_KIND = "summary"   # 摘要经历的 meta.kind，不会再被合并
+CONSOLIDATED_KEY = "consolidated_at"   # 集合元数据里记录上次整理的时间，重启后不会马上又整理一遍
+
+
+def week_groups(entries: list, now: float):
+    """
+    把够旧的经历按自然周 (ISO 周) 分组，返回 [[(时间, (id, 文本, 元数据))]]
+    一周太多的切成几块，太少的不合并
+    """
+    cutoff = now - Config.CONSOLIDATION_MIN_AGE_DAYS * 86400
+    weeks = {}
+    for entry in entries:
+        meta = entry[2]
+        if meta.get("kind") == SUMMARY_KIND:
+            continue
+        ts = episode_time(meta)
+        if not ts or ts > cutoff:
+            continue
+        year, week, _ = datetime.date.fromtimestamp(ts).isocalendar()
+        weeks.setdefault((year, week), []).append((ts, entry))
+
+    groups = []
+    size = Config.CONSOLIDATION_MAX_GROUP
+    for key in sorted(weeks):
+        items = sorted(weeks[key], key=lambda x: x[0])
+        for i in range(0, len(items), size):
+            chunk = items[i:i + size]
+            if len(chunk) >= Config.CONSOLIDATION_MIN_GROUP:
+                groups.append(chunk)
+    return groups
+
+
+def _archive(path: str, entries: list, summary_id: str):
+    now = time.time()
+    with open(path, "a", encoding="utf-8") as f:
+        for doc_id, text, meta in entries:
+            record = {"id": doc_id, "text": text, "meta": meta, "summary_id": summary_id, "archived_at": now}
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+async def _probe_latency(retriever, probes: list):
+    """用几条固定的查询测一下混合检索耗时 (中位数，毫秒)"""
+    samples = []
+    for text, vec in probes:
+        started = time.perf_counter()
+        await retriever.search(text, vec)
+        samples.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(samples), 1) if samples else None
+
+
+async def _snapshot(memory, probes: list):
+    return {
+        "episodes": await asyncio.to_thread(memory.episodic_col.count),
+        "query_ms": await _probe_latency(memory.retriever, probes),
+    }
+
+
+async def _mark_consolidated(memory, now: float):
+    col = memory.episodic_col
+    metadata = {**(col.metadata or {}), CONSOLIDATED_KEY: now}
+    await asyncio.to_thread(col.modify, metadata=metadata)
+    memory.last_consolidation = now
+
+
+async def consolidate(memory, now: float = None) -> dict:
+    """
+    整理一个用户的经历库，返回报告 {"merged", "removed", "before", "after"}
+    顺序：归档原文 -> 写摘要 -> 删原文；中途退出的话下次会把同一批重新合并成同一个 id，不会丢也不会重复
+    """
+    now = now or time.time()
+    await memory.ready()
+    await _mark_consolidated(memory, now)
+    if not memory.vectors_ok:
+        return {"skipped": "向量不可用"}
+    retriever, col = memory.retriever, memory.episodic_col
+    await retriever.ensure_loaded()
+
+    entries = await asyncio.to_thread(retriever.index.entries)
+    groups = week_groups(entries, now)
+    if not groups:
+        return {"merged": 0, "removed": 0}
+
+    # 前后用同一组查询对比耗时
+    sample = random.sample(entries, min(5, len(entries)))
+    probes = [(text, await embed_text(text)) for _, text, _ in sample]
+    before = await _snapshot(memory, probes)
+
+    archive_path = None
+    if Config.CONSOLIDATION_ARCHIVE_DIR:
+        os.makedirs(Config.CONSOLIDATION_ARCHIVE_DIR, exist_ok=True)
+        archive_path = os.path.join(Config.CONSOLIDATION_ARCHIVE_DIR, f"{memory.user_id}.jsonl")
+
+    merged = removed = 0
+    with metrics.span("consolidation"):
+        for chunk in groups:
+            group = [entry for _, entry in chunk]
+            ids = [doc_id for doc_id, _, _ in group]
+            first = datetime.date.fromtimestamp(chunk[0][0]).isoformat()
+            last = datetime.date.fromtimestamp(chunk[-1][0]).isoformat()
+            period = first if first == last else f"{first}~{last}"
+            try:
+                summary = await AIService.summarize_episodes(
+                    period, [(meta.get("date", ""), text) for _, text, meta in group]
+                )
+                vec = await embed_text(summary)
+                if not vec:
+                    raise ValueError("摘要向量化失败")
+            except Exception as e:
+                print(f"⚠️ 经历整理跳过 {period}: {e}")
+                metrics.incr("consolidation_failures")
+                continue
+
+            summary_id = "summary_" + hashlib.sha1("|".join(sorted(ids)).encode()).hexdigest()[:16]
+            meta = {"timestamp": chunk[-1][0], "date": period, "kind": SUMMARY_KIND, "sources": len(ids)}
+            if archive_path:
+                await asyncio.to_thread(_archive, archive_path, group, summary_id)
+            await asyncio.to_thread(col.upsert, ids=[summary_id], documents=[summary], metadatas=[meta], embeddings=[vec])
+            await asyncio.to_thread(retriever.add, [summary_id], [summary], [meta])
+            await asyncio.to_thread(col.delete, ids=ids)
+            await asyncio.to_thread(retriever.remove, ids)
+            merged += 1
+            removed += len(ids)
+
+    await asyncio.to_thread(retriever.compact)
+    after = await _snapshot(memory, probes)
+    metrics.incr("episodes_consolidated", removed)
+    print(f"🗜️ 经历整理完成 ({memory.user_id}): 合并 {removed} 条为 {merged} 条摘要，"
+          f"记忆 {before['episodes']} -> {after['episodes']} 条，检索 {before['query_ms']}ms -> {after['query_ms']}ms")
+    return {"merged": merged, "removed": removed, "before": before, "after": after}
+
+
+if __name__ == "__main__":
+    import argparse
+    from memory import MemorySystem
+
+    parser = argparse.ArgumentParser(description="经历整理 (按周合并旧经历)")
+    parser.add_argument("--user", default="default")
+    parser.add_argument("--min-age-days", type=int, default=None, help="覆盖 CONSOLIDATION_MIN_AGE_DAYS")
+    args = parser.parse_args()
+    if args.min_age_days is not None:
+        Config.CONSOLIDATION_MIN_AGE_DAYS = args.min_age_days
+
+    async def run():
+        memory = MemorySystem(args.user)
+        try:
+            print(json.dumps(await consolidate(memory), ensure_ascii=False, indent=2))
+        finally:
+            await memory.close()
+
+    asyncio.run(run())
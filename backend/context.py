@@ -0,0 +1,144 @@
+import asyncio
+import json
+from config import Config
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    # 没装 tiktoken 时粗略估算：中文约 1 字 1 token，英文约 4 字符 1 token
+    _encoding = None
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return (len(text) - ascii_chars) + ascii_chars // 4 + 1
+
+
+def count_message_tokens(message: dict) -> int:
+    content = message.get("content")
+    if isinstance(content, list):
+        # 多模态消息只算文字部分
+        content = " ".join(part.get("text", "") for part in content if part.get("type") == "text")
+    return count_tokens(content) + 4   # 每条消息的角色/分隔开销
+
+
+def _bigrams(text: str) -> set:
+    text = "".join(str(text).split()).lower()
+    return {text[i:i + 2] for i in range(len(text) - 1)} or {text}
+
+
+def select_relevant_facts(facts: dict, query: str = None, token_budget: int = None,
+                          only_matching: bool = False) -> dict:
+    """
+    按相关度挑事实放进提示词
+    - 与当前输入有字符重叠的事实优先
+    - 其余事实按原顺序补齐，直到用完 token 预算 (only_matching 时不补)
+    """
+    if not facts:
+        return {}
+    items = list(facts.items())
+    if query:
+        q = _bigrams(query)
+        scored = [(len(q & _bigrams(f"{k}{v}")), i) for i, (k, v) in enumerate(items)]
+        if only_matching:
+            scored = [x for x in scored if x[0] > 0]
+        order = [i for _, i in sorted(scored, key=lambda x: (-x[0], x[1]))]
+    else:
+        order = list(range(len(items)))
+
+    budget = token_budget if token_budget is not None else Config.FACTS_TOKEN_BUDGET
+    picked, used = {}, 0
+    for i in order:
+        k, v = items[i]
+        cost = count_tokens(json.dumps({k: v}, ensure_ascii=False))
+        if used + cost > budget:
+            continue
+        picked[k] = v
+        used += cost
+    return picked
+
+
+class ContextWindow:
+    """
+    按 token 预算管理短期对话历史
+    - 历史超出预算时，一次把最旧的一大段折叠进滚动摘要 (后台生成，不占用回复时间)
+      折叠到预算的 HISTORY_COMPACT_RATIO 为止，之后好多轮历史只追加，prompt 前缀不变
+    - 拼消息时再按总预算裁一遍，保证不超
+    """
+
+    def __init__(self, summarizer, total_budget: int = None, history_budget: int = None):
+        self.summarizer = summarizer              # async (旧摘要, 待折叠消息) -> 新摘要
+        self.total_budget = total_budget or Config.CONTEXT_TOKEN_BUDGET
+        self.history_budget = history_budget or Config.HISTORY_TOKEN_BUDGET
+        self.summary = ""
+        self._pending = []                        # 已移出历史、还没并进摘要的消息
+        self._task = None
+
+    def compact(self, history: list) -> list:
+        """一轮结束后调用：超预算的旧消息移出历史并安排后台摘要，返回新的历史"""
+        history = list(history)
+        total = sum(count_message_tokens(m) for m in history)
+        if total <= self.history_budget:
+            return history
+        # 超了就一次裁到预算的一部分 (滞回)，而不是每轮挤掉一条；至少留最近两条，保证上下文连贯
+        target = self.history_budget * Config.HISTORY_COMPACT_RATIO
+        while len(history) > 2 and total > target:
+            oldest = history.pop(0)
+            total -= count_message_tokens(oldest)
+            self._pending.append(oldest)
+        if self._pending and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._summarize())
+        return history
+
+    async def _summarize(self):
+        while self._pending:
+            # 摘要成功之前消息一直留在 _pending 里：中途存盘 / 被取消也不会丢
+            batch = list(self._pending)
+            try:
+                summary = await self.summarizer(self.summary, batch)
+            except Exception as e:
+                print(f"⚠️ 对话摘要失败: {e}")
+                return
+            self.summary = summary
+            del self._pending[:len(batch)]
+            print(f"📝 对话摘要已更新 ({count_tokens(self.summary)} tokens)")
+
+    async def wait_summary(self, timeout: float):
+        """等后台摘要做完 (存盘前调用)；超时就算了，没并进去的还在 _pending 里"""
+        if self._task and not self._task.done():
+            await asyncio.wait([self._task], timeout=timeout)
+
+    def fit(self, system_msg: dict, history: list, current_msg: dict):
+        """
+        拼出最终 messages：系统提示 + 尽量多的最近历史 + 当前输入
+        返回 (messages, token 统计)
+        """
+        fixed = count_message_tokens(system_msg) + count_message_tokens(current_msg)
+        remaining = self.total_budget - fixed
+        kept = []
+        for msg in reversed(history):
+            cost = count_message_tokens(msg)
+            if cost > remaining:
+                break
+            kept.insert(0, msg)
+            remaining -= cost
+        stats = {
+            "system": count_message_tokens(system_msg),
+            "history": sum(count_message_tokens(m) for m in kept),
+            "history_dropped": len(history) - len(kept),
+            "input": count_message_tokens(current_msg),
+        }
+        stats["total"] = stats["system"] + stats["history"] + stats["input"]
+        return [system_msg] + kept + [current_msg], stats
+
+    def to_state(self):
+        return {"summary": self.summary, "pending": list(self._pending)}
+
+    def load_state(self, state: dict):
+        self.summary = state.get("summary", "")
+        self._pending = list(state.get("pending", []))
@@ -0,0 +1,247 @@
+"""
+向量化后端 + 换模型时的记忆库迁移
+
+    cd backend
+    python embeddings.py --migrate      # 手动把所有记忆集合重新向量化到当前模型
+"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from config import Config
+from cache import get_embedding_cache
+from services import AIService
+from metrics import metrics
+
+MODEL_KEY = "embedding_model"   # 集合元数据里记录向量是哪个模型算的
+
+
+class EmbeddingBackend:
+    """向量化后端接口：子类只实现 _embed_batch，缓存/去重/分批在这里统一做"""
+    name = "base"
+    model_id = "base"   # 写进集合元数据；变了就要重新向量化
+
+    async def _embed_batch(self, texts: list) -> list:
+        raise NotImplementedError
+
+    async def embed(self, texts: list) -> list:
+        """
+        批量向量化，返回与 texts 一一对应的向量列表 (失败的位置为 None)
+        先查缓存，没命中的去重后分批并行计算
+        """
+        cache = get_embedding_cache()
+        keys = [cache.make_key(t, self.model_id) if t else None for t in texts]
+        found = await asyncio.to_thread(cache.get_many, [k for k in keys if k])
+
+        # 同一批里重复的文本只算一次
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key and key not in found and key not in missing:
+                missing[key] = text
+
+        if missing:
+            items = list(missing.items())
+            size = Config.EMBEDDING_BATCH_SIZE
+            batches = [items[i:i + size] for i in range(0, len(items), size)]
+            with metrics.span("embedding", self.model_id):
+                results = await asyncio.gather(
+                    *(self._embed_batch([text for _, text in batch]) for batch in batches),
+                    return_exceptions=True
+                )
+            fresh = {}
+            for batch, vectors in zip(batches, results):
+                if isinstance(vectors, BaseException):
+                    print(f"❌ 向量化失败 ({self.name}): {vectors}")
+                    metrics.incr("embedding_failures", len(batch))
+                    continue
+                for (key, _), vec in zip(batch, vectors):
+                    fresh[key] = vec
+            await asyncio.to_thread(cache.put_many, fresh)
+            found.update(fresh)
+
+        return [found.get(key) if key else None for key in keys]
+
+
+class RemoteEmbedding(EmbeddingBackend):
+    """SiliconFlow 远程模型 (原来的方式)"""
+    name = "remote"
+
+    def __init__(self):
+        # 沿用模型名当版本号，老集合和老缓存不用迁移
+        self.model_id = Config.EMBEDDING_MODEL
+
+    async def _embed_batch(self, texts: list) -> list:
+        return await AIService.embed_remote(texts)
+
+
+class LocalEmbedding(EmbeddingBackend):
+    """
+    本地 CPU 向量化：onnxruntime 跑 int8 量化的小模型 (如 bge-small-zh / multilingual-e5-small)，完全离线
+    模型目录里需要 model_quantized.onnx (或 model.onnx) 和 tokenizer.json
+    """
+    name = "local"
+
+    def __init__(self, model_dir: str, num_threads: int, workers: int):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model = os.path.join(model_dir, "model_quantized.onnx")
+        if not os.path.exists(model):
+            model = os.path.join(model_dir, "model.onnx")
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(model, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=Config.LOCAL_EMBEDDING_MAX_TOKENS)
+        self.tokenizer.enable_padding()
+
+        self.model_id = f"local:{os.path.basename(os.path.normpath(model_dir))}"
+        # 推理是纯 CPU 计算，独立线程池；onnxruntime 推理时会释放 GIL，多个批次可以并行
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embed")
+
+    def _infer(self, texts: list) -> list:
+        encodings = self.tokenizer.encode_batch(texts)
+        ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": ids, "attention_mask": mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(ids)
+        output = self.session.run(None, feeds)[0]
+        if output.ndim == 3:
+            if Config.LOCAL_EMBEDDING_POOLING == "cls":
+                output = output[:, 0]
+            else:
+                weights = mask[..., None].astype(np.float32)
+                output = (output * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+        output = output / np.clip(np.linalg.norm(output, axis=1, keepdims=True), 1e-9, None)
+        return output.astype(np.float32).tolist()
+
+    async def _embed_batch(self, texts: list) -> list:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._infer, texts)
+
+
+_backend = None
+
+def get_embedder() -> EmbeddingBackend:
+    """按配置选向量化后端；本地模型加载失败时退回远程"""
+    global _backend
+    if _backend is None:
+        if Config.EMBEDDING_BACKEND == "local":
+            try:
+                _backend = LocalEmbedding(
+                    Config.LOCAL_EMBEDDING_MODEL_DIR, Config.LOCAL_EMBEDDING_THREADS, Config.LOCAL_EMBEDDING_WORKERS
+                )
+                print(f"🧮 本地向量模型已加载: {_backend.model_id}")
+            except Exception as e:
+                print(f"⚠️ 本地向量模型加载失败，改用远程: {e}")
+        if _backend is None:
+            _backend = RemoteEmbedding()
+    return _backend
+
+
+async def embed_texts(texts: list) -> list:
+    return await get_embedder().embed(texts)
+
+
+async def embed_text(text: str):
+    if not text:
+        return None
+    return (await embed_texts([text]))[0]
+
+
+# === 换模型迁移 ===
+
+def collection_model(collection) -> str:
+    # 没有记录的老集合是远程模型建的
+    return (collection.metadata or {}).get(MODEL_KEY, Config.EMBEDDING_MODEL)
+
+
+async def open_collection(client, name: str):
+    """
+    打开记忆集合，保证里面的向量和当前模型一致
+    - 新集合：直接记录当前模型
+    - 模型变了：整体重新向量化 (见 migrate_collection)
+    """
+    backend = get_embedder()
+    names = {getattr(c, "name", c) for c in await asyncio.to_thread(client.list_collections)}
+    tmp_name = f"{name}__migrating"
+    if tmp_name in names:
+        if name in names:
+            # 上次迁移中途退出，原集合还在：丢掉半成品重来
+            await asyncio.to_thread(client.delete_collection, tmp_name)
+        else:
+            # 原集合已删、改名前退出：半成品其实已经完整
+            tmp = await asyncio.to_thread(client.get_collection, tmp_name)
+            await asyncio.to_thread(tmp.modify, name=name)
+            names.add(name)
+
+    if name not in names:
+        return await asyncio.to_thread(client.create_collection, name, metadata={MODEL_KEY: backend.model_id})
+
+    collection = await asyncio.to_thread(client.get_collection, name)
+    if not collection.metadata:
+        # 老集合补上模型记录，以后改 EMBEDDING_MODEL 才能发现
+        await asyncio.to_thread(collection.modify, metadata={MODEL_KEY: collection_model(collection)})
+    if collection_model(collection) != backend.model_id:
+        collection = await migrate_collection(client, collection, backend)
+    return collection
+
+
+async def migrate_collection(client, collection, backend: EmbeddingBackend, page: int = 500):
+    """
+    把集合里所有记忆用新模型重新向量化
+    向量维度可能变，不能原地 update：先写进临时集合，全部成功后删旧的、临时集合改回原名
+    """
+    name = collection.name
+    old_model = collection_model(collection)
+    total = await asyncio.to_thread(collection.count)
+    print(f"🔁 记忆库 {name} 需要重新向量化: {old_model} -> {backend.model_id} ({total} 条)")
+    metadata = {**(collection.metadata or {}), MODEL_KEY: backend.model_id}
+    tmp = await asyncio.to_thread(client.create_collection, f"{name}__migrating", metadata=metadata)
+
+    with metrics.span("embedding_migration", backend.model_id):
+        offset = 0
+        while True:
+            batch = await asyncio.to_thread(
+                collection.get, limit=page, offset=offset, include=["documents", "metadatas"]
+            )
+            if not batch["ids"]:
+                break
+            vectors = await backend.embed(batch["documents"])
+            if any(v is None for v in vectors):
+                await asyncio.to_thread(client.delete_collection, tmp.name)
+                raise RuntimeError(f"重新向量化失败 (第 {offset} 条附近)，保留旧集合")
+            await asyncio.to_thread(
+                tmp.add, ids=batch["ids"], documents=batch["documents"],
+                metadatas=batch["metadatas"], embeddings=vectors
+            )
+            offset += len(batch["ids"])
+            print(f"   ... {offset}/{total}")
+
+    await asyncio.to_thread(client.delete_collection, name)
+    await asyncio.to_thread(tmp.modify, name=name)
+    print(f"✅ 记忆库 {name} 迁移完成")
+    return await asyncio.to_thread(client.get_collection, name)
+
+
+async def migrate_all(client):
+    names = [getattr(c, "name", c) for c in await asyncio.to_thread(client.list_collections)]
+    for name in names:
+        if (name == "episodes" or name.startswith("episodes_")) and not name.endswith("__migrating"):
+            await open_collection(client, name)
+
+
+if __name__ == "__main__":
+    import argparse
+    from memory import get_chroma_client
+
+    parser = argparse.ArgumentParser(description="记忆库向量化迁移")
+    parser.add_argument("--migrate", action="store_true", help="把所有记忆集合迁移到当前 EMBEDDING_BACKEND 的模型")
+    args = parser.parse_args()
+    if args.migrate:
+        asyncio.run(migrate_all(get_chroma_client()))
+    else:
+        parser.print_help()
@@ -0,0 +1,161 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from config import Config
+
+
+def fact_topic(key: str) -> str:
+    """事实的话题：key 里有分隔符 (如 "宠物.名字" / "pet_name") 取第一段，否则就是 key 本身"""
+    return re.split(r"[./:：_\s]", str(key).strip(), maxsplit=1)[0] or str(key)
+
+
+class FactStore:
+    """
+    用户事实库 (SQLite WAL，所有用户共用一个库)
+    - facts: 每个 key 的当前值，按 key 单条更新，不再整文件重写
+    - fact_history: 每次变化的版本记录 (值 + 时间)
+    - 按 key / 话题有索引，拼提示词时可以只取需要的
+    写操作都是同步的，调用方放到线程池里跑
+    """
+
+    def __init__(self, db_path: str):
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS facts (
+                user_id TEXT, key TEXT, value TEXT, topic TEXT,
+                version INTEGER, created_at REAL, updated_at REAL,
+                PRIMARY KEY (user_id, key)
+            );
+            CREATE INDEX IF NOT EXISTS idx_facts_topic ON facts(user_id, topic);
+            CREATE TABLE IF NOT EXISTS fact_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT, key TEXT, value TEXT, version INTEGER, changed_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_history_key ON fact_history(user_id, key, version);
+            CREATE TABLE IF NOT EXISTS imports (
+                user_id TEXT, path TEXT, imported_at REAL,
+                PRIMARY KEY (user_id, path)
+            );
+        """)
+        self.db.commit()
+
+    def load(self, user_id: str) -> dict:
+        """一个用户的全部事实，按第一次出现的顺序 (拼提示词时顺序稳定)"""
+        with self._lock:
+            rows = self.db.execute(
+                "SELECT key, value FROM facts WHERE user_id = ? ORDER BY created_at, rowid", (user_id,)
+            ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def upsert(self, user_id: str, facts: dict, now: float = None) -> int:
+        """逐条更新，值没变的不记新版本；返回实际变化的条数"""
+        now = now or time.time()
+        changed = 0
+        with self._lock, self.db:
+            for key, value in facts.items():
+                key = str(key)
+                encoded = json.dumps(value, ensure_ascii=False)
+                row = self.db.execute(
+                    "SELECT value, version FROM facts WHERE user_id = ? AND key = ?", (user_id, key)
+                ).fetchone()
+                if row and row[0] == encoded:
+                    continue
+                version = row[1] + 1 if row else 1
+                if row:
+                    self.db.execute(
+                        "UPDATE facts SET value = ?, version = ?, updated_at = ? WHERE user_id = ? AND key = ?",
+                        (encoded, version, now, user_id, key)
+                    )
+                else:
+                    self.db.execute(
+                        "INSERT INTO facts (user_id, key, value, topic, version, created_at, updated_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (user_id, key, encoded, fact_topic(key), version, now, now)
+                    )
+                self.db.execute(
+                    "INSERT INTO fact_history (user_id, key, value, version, changed_at) VALUES (?, ?, ?, ?, ?)",
+                    (user_id, key, encoded, version, now)
+                )
+                changed += 1
+        return changed
+
+    def get(self, user_id: str, keys: list) -> dict:
+        if not keys:
+            return {}
+        marks = ",".join("?" * len(keys))
+        with self._lock:
+            rows = self.db.execute(
+                f"SELECT key, value FROM facts WHERE user_id = ? AND key IN ({marks})", (user_id, *keys)
+            ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def by_topic(self, user_id: str, topic: str) -> dict:
+        with self._lock:
+            rows = self.db.execute(
+                "SELECT key, value FROM facts WHERE user_id = ? AND topic = ? ORDER BY created_at",
+                (user_id, topic)
+            ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def history(self, user_id: str, key: str) -> list:
+        """某个事实的所有版本 [{"version", "value", "changed_at"}]，从旧到新"""
+        with self._lock:
+            rows = self.db.execute(
+                "SELECT version, value, changed_at FROM fact_history WHERE user_id = ? AND key = ? ORDER BY version",
+                (user_id, key)
+            ).fetchall()
+        return [{"version": v, "value": json.loads(value), "changed_at": t} for v, value, t in rows]
+
+    def import_json(self, user_id: str, path: str) -> int:
+        """
+        一次性导入老的 JSON 事实文件
+        导入过的记在 imports 表里，不会重复导入；原文件不动 (可能是仓库里跟踪的文件)
+        """
+        if not os.path.exists(path):
+            return 0
+        source = os.path.abspath(path)
+        with self._lock:
+            done = self.db.execute(
+                "SELECT 1 FROM imports WHERE user_id = ? AND path = ?", (user_id, source)
+            ).fetchone()
+        if done:
+            return 0
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                facts = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ 事实文件读取失败，跳过导入 {path}: {e}")
+            return 0
+        # 按原文件顺序给一个递增时间，保证导入后顺序不变
+        base = os.path.getmtime(path)
+        with self._lock:
+            exists = self.db.execute("SELECT 1 FROM facts WHERE user_id = ? LIMIT 1", (user_id,)).fetchone()
+        count = 0
+        if not exists:
+            for i, (key, value) in enumerate((facts or {}).items()):
+                count += self.upsert(user_id, {key: value}, now=base + i * 1e-3)
+        with self._lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO imports VALUES (?, ?, ?)", (user_id, source, time.time()))
+        print(f"📥 事实文件已导入 {path}: {count} 条")
+        return count
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_fact_store() -> FactStore:
+    """第一次用到时才打开库 (只导入模块不会在源码目录里建文件)"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = FactStore(Config.FACTS_DB_PATH)
+        return _store
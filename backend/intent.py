@@ -0,0 +1,179 @@
+"""
+本地意图识别 (纯 CPU，毫秒级)：字 n-gram 朴素贝叶斯
+决定这一轮：要不要开/关勿扰、要不要截图、要不要检索长期记忆、要不要调主脑
+简单的轮次 (闭嘴 / 你好 / 谢谢 / 拜拜) 直接用预置台词回复，语音启动时就合成好放进缓存
+"""
+import json
+import math
+import os
+import random
+import re
+from collections import Counter
+from config import Config
+
+# 训练样本：每类几十句，够区分这几种短句；可以用 INTENT_TRAIN_PATH 追加
+EXAMPLES = {
+    "silence": [
+        "闭嘴", "闭嘴吧", "安静", "安静点", "安静一下", "别吵", "别吵了", "别说话", "不要说话", "你别说了",
+        "我在忙", "我要忙了", "我要工作了", "我要学习了", "别打扰我", "不要打扰我", "让我静静", "先别说话",
+        "嘘", "吵死了", "好吵", "你好吵", "少说两句", "shut up", "be quiet", "我开会呢", "我要睡觉了别吵",
+    ],
+    "wake": [
+        "我回来了", "忙完了", "我忙完了", "可以说话了", "你可以说话了", "陪我聊聊", "出来聊天", "在吗",
+        "你还在吗", "醒醒", "别睡了", "我下班了", "开完会了", "理理我", "说点什么", "来聊天吧",
+    ],
+    "greeting": [
+        "你好", "你好呀", "您好", "嗨", "哈喽", "hello", "hi", "早", "早啊", "早上好", "中午好", "下午好",
+        "晚上好", "早安", "哟", "嘿", "在不在", "好久不见",
+    ],
+    "thanks": [
+        "谢谢", "谢谢你", "谢啦", "多谢", "感谢", "辛苦了", "thanks", "thank you", "thx", "谢谢宝", "爱你", "你真好",
+    ],
+    "bye": [
+        "再见", "拜拜", "拜", "晚安", "我走了", "我先走了", "我去睡了", "睡了", "下次聊", "回头聊", "bye",
+        "good night", "88", "溜了", "先下了",
+    ],
+    "ack": [
+        "好的", "好", "嗯", "嗯嗯", "哦", "哦哦", "行", "可以", "ok", "okk", "收到", "知道了", "哈哈",
+        "哈哈哈", "哈哈哈哈", "对", "对啊", "是的", "嘿嘿", "呵呵", "6", "666", "牛", "确实", "好吧",
+    ],
+    "vision": [
+        "你看看", "看看我的屏幕", "看看屏幕", "帮我看看这个", "帮我看下这个报错", "你看这个", "看一下这个",
+        "截图", "截个图", "截屏看看", "屏幕上是什么", "我屏幕上有什么", "这个页面怎么样", "这张图怎么样",
+        "我现在在干嘛", "猜猜我在看什么", "看我写的代码", "这个界面好看吗", "这个图片什么样", "你能看到吗",
+        "look at my screen", "what's on my screen", "看看这个photo", "这个image是什么", "帮我瞅瞅",
+    ],
+    "chat": [
+        "今天好累啊", "我昨天看了个电影", "你觉得我该怎么办", "明天要考试了好紧张", "我想吃火锅",
+        "你喜欢什么颜色", "给我讲个笑话", "我今天被老板骂了", "周末去哪玩比较好", "你知道我叫什么吗",
+        "还记得我上次说的吗", "我朋友小明今天生日", "最近在学吉他", "我养了一只猫", "今天天气怎么样",
+        "推荐一首歌", "你是谁", "你会做什么", "我有点难过", "帮我想个名字", "为什么天是蓝的",
+        "我刚跑完步", "晚饭吃什么好", "你觉得这个想法怎么样", "我跟女朋友吵架了", "明天几点起床",
+        "上次那家店叫什么来着", "这周好忙", "考试考砸了", "我升职了", "我看了一部很好看的电视剧",
+        "你说人为什么要上班", "我不想写作业", "今天遇到一件怪事", "陪我聊聊工作的事", "我在想要不要辞职",
+        "你看我多厉害", "这是什么", "你看我新买的衣服", "我想看看电影", "这是什么意思",
+        # 否定 / 反话：字面上像闭嘴、谢谢，其实要接着聊
+        "不要闭嘴", "别闭嘴", "你别闭嘴", "我没让你闭嘴", "谁让你闭嘴了", "我不想安静", "不用安静",
+        "不是让你别说话", "我不忙", "不谢我", "谢什么谢", "不想说再见", "还不想睡",
+        # 复合句：客套话后面跟着要记住的事
+        "谢谢我叫李雷", "谢谢你帮我记住生日", "闭嘴我说我是秦始皇", "你好我叫小红", "晚安我明天要考试",
+        "好的我明天早上八点开会", "拜拜我去上海出差了", "嗨我换工作了",
+    ],
+}
+
+# 简单轮次直接回复的预置台词 (文本, 情绪)
+CANNED = {
+    "silence": [("好好好，我闭嘴，有事叫我～", "neutral"), ("行吧，我安静待着。", "bored"), ("收到，静音模式启动。", "neutral")],
+    "wake": [("终于想起我了？说吧说吧。", "happy"), ("我一直在呢，聊什么？", "happy"), ("回来啦！刚才可无聊死了。", "happy")],
+    "greeting": [("哟，你来啦！", "happy"), ("嗨～今天过得怎么样？", "happy"), ("你好呀，找我有事？", "happy")],
+    "thanks": [("不客气，记得请我吃好吃的。", "happy"), ("小事一桩～", "happy"), ("哼，知道我的好就行。", "happy")],
+    "bye": [("拜拜，早点回来哦。", "neutral"), ("去吧去吧，我会想你的……才怪。", "happy"), ("晚安，做个好梦。", "neutral")],
+}
+
+NO_LLM = set(CANNED)           # 这些意图置信度够高时不调主脑
+NO_RETRIEVAL = NO_LLM | {"ack"}  # 这些意图不需要检索长期记忆
+
+# 明确要看屏幕的说法；光有"你看""这是什么"不截图
+_SCREEN_CUES = re.compile(r"屏幕|截图|截屏|截个图|截张图|画面|界面|页面|窗口|报错|代码|图片|这张图|看看|看一下|看下|瞅瞅|screen")
+_PUNCT = re.compile(r"[\s,，.。!！?？~～…、;；:：\"'“”‘’()（）\[\]【】]+")
+
+
+def normalize(text: str) -> str:
+    return _PUNCT.sub("", (text or "").lower())
+
+
+def ngrams(text: str) -> list:
+    t = normalize(text)
+    return [t[i:i + n] for n in (1, 2, 3) for i in range(len(t) - n + 1)]
+
+
+class IntentClassifier:
+    """多分类朴素贝叶斯 (字 1~3 gram)，训练几百句几毫秒，分类一句几十微秒"""
+    ALPHA = 0.5
+
+    def __init__(self, examples: dict):
+        self.counts = {label: Counter() for label in examples}
+        self.totals = {}
+        docs = {label: len(texts) for label, texts in examples.items()}
+        for label, texts in examples.items():
+            for text in texts:
+                self.counts[label].update(ngrams(text))
+            self.totals[label] = sum(self.counts[label].values())
+        self.vocab = set().union(*self.counts.values())
+        n = sum(docs.values())
+        self.priors = {label: math.log(docs[label] / n) for label in examples}
+        # 和训练样本一字不差的直接定类
+        self.exact = {normalize(text): label for label, texts in examples.items() for text in texts}
+        self.bigrams = {label: {g for g in counts if len(g) == 2} for label, counts in self.counts.items()}
+
+    def known(self, text: str, label: str) -> bool:
+        """这句话的每个相邻字对都在这一类的样本里出现过 (没有多出来的内容)"""
+        t = normalize(text)
+        if len(t) < 2:
+            return bool(t) and self.counts[label][t] > 0
+        return all(t[i:i + 2] in self.bigrams[label] for i in range(len(t) - 1))
+
+    def probs(self, text: str) -> dict:
+        grams = [g for g in ngrams(text) if g in self.vocab]   # 没见过的字不参与
+        v = len(self.vocab)
+        logp = {}
+        for label, counts in self.counts.items():
+            denom = math.log(self.totals[label] + self.ALPHA * v)
+            logp[label] = self.priors[label] + sum(math.log(counts[g] + self.ALPHA) - denom for g in grams)
+        top = max(logp.values())
+        exp = {label: math.exp(lp - top) for label, lp in logp.items()}
+        z = sum(exp.values())
+        return {label: p / z for label, p in exp.items()}
+
+    def classify(self, text: str) -> dict:
+        """
+        返回 {"action", "confidence", "vision", "retrieval", "llm"}
+        action: silence / wake / greeting / thanks / bye / ack / vision / chat
+        """
+        norm = normalize(text)
+        probs = self.probs(text)
+        action = max(probs, key=probs.get)
+        confidence = probs[action]
+        exact = self.exact.get(norm)
+        if exact:
+            action, confidence = exact, 1.0
+        short = len(norm) <= Config.INTENT_FASTPATH_MAX_CHARS
+        confident = confidence >= Config.INTENT_CONFIDENCE
+        if exact:
+            vision = exact == "vision"
+        else:
+            vision = probs.get("vision", 0.0) >= Config.INTENT_VISION_CONFIDENCE and bool(_SCREEN_CUES.search(norm))
+        # 只有几乎原样的客套话才不调主脑："不要闭嘴""谢谢，我叫李雷"里有别的内容，交给主脑
+        near_exact = exact is not None or (short and self.known(norm, action))
+        fast = Config.INTENT_FASTPATH and action in NO_LLM and near_exact and confident
+        return {
+            "action": action,
+            "confidence": round(confidence, 3),
+            "vision": vision,
+            "retrieval": not (action in NO_RETRIEVAL and short and confident),
+            "llm": not fast,
+        }
+
+
+def _load_examples() -> dict:
+    examples = {label: list(texts) for label, texts in EXAMPLES.items()}
+    path = Config.INTENT_TRAIN_PATH
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for label, texts in json.load(f).items():
+                examples.setdefault(label, []).extend(texts)
+    return examples
+
+
+classifier = IntentClassifier(_load_examples())
+
+
+def canned_reply(action: str, last: str = None):
+    """挑一句预置台词，尽量不和上一句重复"""
+    options = CANNED[action]
+    choices = [o for o in options if o[0] != last] or options
+    return random.choice(choices)
+
+
+def all_canned() -> list:
+    return [phrase for options in CANNED.values() for phrase in options]
@@ -1,16 +1,55 @@
 import asyncio
+import base64
+import functools
 import json
 import time
 import datetime
-import random
+import uuid
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse
 from services import AIService
 from memory import MemorySystem
 from tools import ToolBox
+from config import Config
+from streaming import JsonFieldStreamer, SentenceSplitter
+from metrics import metrics
+from sessions import SessionManager
+from scheduler import scheduler
+from context import ContextWindow
+from stt import get_stt_backend, SpeechStream
+from speculation import Speculation
+from intent import canned_reply, all_canned
+from proactive import ProactivePool
+import transport
 app = FastAPI()
 
+# 固定的系统提示词 (人设 / JSON 格式 / 规则)，必须保持字节不变才能命中 prompt 缓存
+STATIC_SYSTEM_PROMPT = """
+你叫 Neuro，一个可爱毒舌的 AI 桌宠。
+每条用户消息开头括号里是系统附带的当前时间和检索到的记忆，不是用户说的话。
+
+【记忆权限已授权】
+请针对用户的输入，返回一个 JSON 对象（严格遵守 JSON 格式）：
+{
+    "thought": "内心独白。分析用户意图，检查是否与已知事实冲突。",
+    "emotion": "happy/neutral/bored/angry",
+    "reply": "给用户的回复。口语化，符合人设。",
+    "memory_operation": {
+        "new_facts": { "key": "value" } 或 null,
+        "new_episode": "事件摘要" 或 null,
+        "is_silence_requested": true/false
+    }
+}
+
+规则：
+1. 除非用户明确陈述新的事实，否则不要瞎编 `new_facts`。
+2. 如果用户说胡话（如我是秦始皇），在 reply 里拆穿，不要更新记忆。
+
+"""
+
 class NeuroBrain:
-    def __init__(self):
+    def __init__(self, user_id: str = "default"):
+        self.user_id = user_id
         # 状态机
         self.state = "idle"          # idle, thinking, speaking
         self.last_interaction = time.time() #自己上次发言的时间
@@ -19,12 +58,44 @@ class NeuroBrain:
         self.is_dnd_mode = False     # 勿扰模式
         self.current_threshold = 40              # 当前的等待阈值（会变大）
         self.max_threshold = 3600                # 上限（比如1小时）
-        self.memory = MemorySystem()
-        self.history = []            # 短期对话历史 (滑动窗口)
+        self.memory = MemorySystem(user_id)
+        self.history = []            # 短期对话历史 (按 token 预算裁剪)
+        self.context = ContextWindow(AIService.summarize_dialogue)  # 超出预算的旧对话折叠成摘要
+        self.on_activity = None      # 有动静时的回调 (调度器据此改期主动发言)
+        self.proactive_pool = ProactivePool()   # 空闲时预生成的主动发言
+
+    # 闲置会话存盘 / 恢复用
+    def to_state(self):
+        return {
+            "history": self.history,
+            "is_dnd_mode": self.is_dnd_mode,
+            "current_threshold": self.current_threshold,
+            "last_interaction": self.last_interaction,
+            "last_user_input_time": self.last_user_input_time,
+            "context": self.context.to_state(),
+        }
+
+    async def close(self):
+        # 会话释放 / 进程退出前，把后台队列里的经历写完
+        self.proactive_pool.cancel()
+        await self.memory.close()
+
+    def load_state(self, state: dict):
+        self.history = state.get("history", [])
+        self.is_dnd_mode = state.get("is_dnd_mode", False)
+        self.current_threshold = state.get("current_threshold", self.boredom_threshold)
+        self.last_interaction = state.get("last_interaction", time.time())
+        self.last_user_input_time = state.get("last_user_input_time", time.time())
+        self.context.load_state(state.get("context", {}))
 
     def update_activity(self):
 
         self.last_interaction = time.time()
+        if self.on_activity:
+            self.on_activity()
+    def next_proactive_time(self):
+        # 主动发言的到期时间：上次动静 + 当前等待阈值 (每次主动发言后翻倍)
+        return self.last_interaction + self.current_threshold
     def reset_boredom_time(self):
         self.last_user_input_time=time.time()
         self.current_threshold=self.boredom_threshold
@@ -35,118 +106,328 @@ class NeuroBrain:
             self.current_threshold=self.max_threshold
         print(f"下次主动对话将在{self.current_threshold}s后进行")
 
-    async def build_system_prompt(self,user_input:str=None):
+    async def build_prompt(self, user_input: str = None, retrieve: bool = True, recalled: list = None):
+        """
+        拼提示词，按变化频率分层，让前缀尽量字节级不变 (命中服务端 prompt 缓存)：
+        1. 系统消息 = 固定人设/JSON 格式/规则 + 缓慢变化的 事实
+        2. 短期历史 (只追加，折叠时才整段变)
+        3. 本轮易变内容 (时间、更早的聊天摘要、检索到的往事、临时补充的事实) 放进最后一条 user 消息
+           摘要在历史折叠后的下一轮才更新，放这里不会再让前缀多失效一次
+        retrieve=False 时不检索长期记忆 (意图识别判断用不上，比如"好的""哈哈")
+        recalled: 主动发言抽到的回忆先记在这里，不马上算作想起过 (见 memory.get_longmemory_context)
+        返回 (系统消息, 本轮易变内容)
+        """
         now_str = datetime.datetime.now().strftime("%Y年%m月%d日 %H:%M")
-        known_facts = self.memory.get_fact_context()
-        longmemory=await self.memory.get_longmemory_context(user_input)
+        # 事实序列化和长期记忆检索并行
+        (stable_facts, extra_facts), longmemory = await asyncio.gather(
+            asyncio.to_thread(self.memory.get_fact_blocks, user_input),
+            self.memory.get_longmemory_context(user_input, recalled) if retrieve else asyncio.sleep(0, "")
+        )
+        slow_block = f"已知用户事实: {stable_facts}\n"
 
-        return {
-            "role": "system",
-            "content": f"""
-            你叫 Neuro，一个可爱毒舌的 AI 桌宠。
-            当前时间: {now_str}。
-            
-            【记忆权限已授权】
-            已知用户事实: {known_facts}
-            {longmemory}
-            请针对用户的输入，返回一个 JSON 对象（严格遵守 JSON 格式）：
-            {{
-                "thought": "内心独白。分析用户意图，检查是否与已知事实冲突。",
-                "reply": "给用户的回复。口语化，符合人设。",
-                "emotion": "happy/neutral/bored/angry",
-                "memory_operation": {{
-                    "new_facts": {{ "key": "value" }} 或 null, 
-                    "new_episode": "事件摘要" 或 null,
-                    "is_silence_requested": true/false
-                }}
-            }}
-            
-            规则：
-            1. 除非用户明确陈述新的事实，否则不要瞎编 `new_facts`。
-            2. 如果用户说胡话（如我是秦始皇），在 reply 里拆穿，不要更新记忆。
-            """
-        }
+        turn_context = f"(当前时间: {now_str}"
+        if self.context.summary:
+            turn_context += f"\n【更早的聊天摘要】{self.context.summary}"
+        if extra_facts:
+            turn_context += f"\n与本条相关的用户事实: {extra_facts}"
+        turn_context += f"{longmemory})\n"
+
+        return {"role": "system", "content": STATIC_SYSTEM_PROMPT + slow_block}, turn_context
+
+# 每个 client id 一个独立的 NeuroBrain，API 客户端全进程共用
+session_manager = SessionManager(NeuroBrain, Config.SESSION_DIR, Config.SESSION_IDLE_TIMEOUT)
+
+# 常用兜底台词，启动时预先合成进 TTS 缓存
+WARMUP_PHRASES = [
+    ("（大脑短路中...）", "dizzy"),
+    ("（发呆中...）", "neutral"),
+]
 
-brain = NeuroBrain()
+@app.on_event("startup")
+async def warmup():
+    asyncio.create_task(AIService.warmup_connections())
+    # 兜底台词 + 意图快速通道的预置台词，都提前合成好
+    asyncio.create_task(AIService.warmup_tts(WARMUP_PHRASES + all_canned()))
+    asyncio.create_task(session_manager.run_sweeper())
+
+@app.on_event("shutdown")
+async def save_sessions():
+    await session_manager.save_all()
+    await AIService.close()
+
+# === 监控 ===
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus 文本格式的各阶段耗时 + 缓存命中"""
+    gauges = {}
+    for name, stats in AIService.get_cache_stats().items():
+        for k, v in stats.items():
+            gauges[f"{name}_cache_{k}"] = v
+    gauges["sessions_active"] = len(session_manager.sessions)
+    gauges["scheduler_pending"] = len(scheduler)
+    for name, stats in AIService.get_llm_stats().items():
+        for k, v in stats.items():
+            gauges[f"llm_{name}_{k}"] = v
+    for name, breaker in transport.breakers.items():
+        gauges[f"circuit_open_{name}"] = int(breaker.is_open)
+    gauges["episodes_pending"] = sum(len(s.brain.memory.writer.pending) for s in session_manager.sessions.values())
+    counters = metrics.snapshot()["counters"]
+    decided = counters.get("speculation_hit", 0) + counters.get("speculation_miss", 0)
+    if decided:
+        gauges["speculation_win_rate"] = round(counters.get("speculation_hit", 0) / decided, 3)
+    return PlainTextResponse(metrics.render_prometheus(gauges), media_type="text/plain; version=0.0.4")
 
 # === WebSocket 路由 ===
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
-    print("⚡ 连接建立")
+    # 连接时协商音频协议: ws://.../ws?audio=binary 用二进制帧，否则走 JSON + Base64
+    binary_audio = websocket.query_params.get("audio") == "binary"
+    send_lock = asyncio.Lock()
     
     # 定义发送助手
-    async def send_to_frontend(type_str, payload):
+    async def send_to_frontend(type_str, payload, audio: bytes = None):
+        """
+        audio 不为空时：
+        - 二进制模式：先发 JSON 控制帧 (binary=true)，紧跟一帧原始音频
+        - 兼容模式：音频转 Base64 放进 payload.audio_base64
+        """
         try:
-            await websocket.send_json({"type": type_str, "payload": payload})
+            with metrics.span("ws_send"):
+                # 控制帧和二进制帧必须连着发，不能被别的消息插队
+                async with send_lock:
+                    if audio and binary_audio:
+                        await websocket.send_json({"type": type_str, "payload": {**payload, "binary": True}})
+                        await websocket.send_bytes(audio)
+                    else:
+                        if audio:
+                            payload["audio_base64"] = base64.b64encode(audio).decode("utf-8")
+                        await websocket.send_json({"type": type_str, "payload": payload})
         except: pass
 
-    # 启动主动意识循环 (后台任务)
-    loop_task = asyncio.create_task(game_loop(websocket, send_to_frontend))
+    # 按 client id 取会话: ws://.../ws?user=xxx，不传就是 default
+    session = await session_manager.attach(websocket.query_params.get("user"), send_to_frontend)
+    brain = session.brain
+    send_all = session.broadcast
+    print(f"⚡ 连接建立 (用户: {session.session_id}, 音频协议: {'binary' if binary_audio else 'base64'})")
+    # 告诉前端语音怎么发：本地识别能边说边出结果才值得流式发 PCM，否则还是录完整段 WebM 上传
+    await send_to_frontend("capabilities", {"stt_streaming": get_stt_backend().partials})
+
+    # 向调度器登记主动发言 (每个会话一个，同一用户多开窗口不会重复触发)
+    if brain.on_activity is None:
+        arm_proactive(session)
 
+    pending_packet = None  # 等待后续二进制帧的控制包
+    speech_stream = None   # 流式语音 (audio_stream_start 之后的裸 PCM 帧)
+    partial_task = None
+    speculation = None     # 边说边提前准备这一轮
     try:
         while True:
-            data = await websocket.receive_text()
-            packet = json.loads(data)
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+
+            if message.get("bytes") is not None:
+                if pending_packet is None:
+                    if speech_stream is None:
+                        print("⚠️ 收到没有控制帧的二进制数据，已丢弃")
+                        continue
+                    if speech_stream.feed(message["bytes"]):
+                        # 尾部静音够长：说完了，立刻出最终结果进主流程
+                        if partial_task:
+                            partial_task.cancel()
+                        # 当场标记结束：finish_speech 可能还在等上一轮收尾，
+                        # 这期间后面的静音帧 / audio_stream_end 不能再开一轮把它打断
+                        speech_stream.finished = True
+                        start_turn(session, "voice",
+                                   functools.partial(finish_speech, brain, speech_stream, speculation=speculation))
+                    elif not speech_stream.finished and speech_stream.partial_due() and get_stt_backend().partials \
+                            and (partial_task is None or partial_task.done()):
+                        partial_task = asyncio.create_task(
+                            send_partial_transcript(speech_stream, send_all, speculation)
+                        )
+                    continue
+                packet, pending_packet = pending_packet, None
+                packet["payload"]["audio"] = message["bytes"]
+            else:
+                packet = json.loads(message["text"])
+                if packet.get("payload", {}).get("binary"):
+                    pending_packet = packet
+                    continue
             
             # 收到消息第一件事：刷新活跃时间
             brain.update_activity()
 
+            # 每一轮都在独立 task 里跑，接收循环不被阻塞；新输入会打断还在进行的上一轮
             if packet["type"] == "text_input":
                 text = packet["payload"]["text"]
-                # 把发送函数传进去
-                await handle_user_input(text, send_to_frontend)
+                start_turn(session, "text", functools.partial(handle_user_input, brain, text))
 
             elif packet["type"] == "audio_input":
-                # 语音 -> 文字
-                audio_b64 = packet["payload"]["audio_base64"]
-                text = await AIService.speech_to_text(audio_b64)
-                if text:
-                    # 回显给前端看
-                    await send_to_frontend("text_input", {"text": text})
-                    await handle_user_input(text, send_to_frontend)
+                payload = packet["payload"]
+                audio = payload.get("audio") or payload.get("audio_base64")
+                start_turn(session, "voice", functools.partial(transcribe_and_handle, brain, audio))
+
+            elif packet["type"] == "audio_stream_start":
+                speech_stream = SpeechStream(packet.get("payload", {}).get("sample_rate", 16000))
+                if speculation:
+                    speculation.cancel()
+                speculation = None
+                if Config.SPECULATIVE_MODE != "off":
+                    respond = None
+                    if Config.SPECULATIVE_MODE == "full":
+                        respond = lambda partial, prepared: speculate_reply(brain, partial, prepared)
+                    speculation = Speculation(lambda partial: speculate_prompt(brain, partial), respond)
+
+            elif packet["type"] == "audio_stream_end":
+                # 用户松开按键：还没判定说完的话，就以现在为准
+                stream, speech_stream = speech_stream, None
+                if partial_task:
+                    partial_task.cancel()
+                if stream and not stream.finished:
+                    start_turn(session, "voice",
+                               functools.partial(finish_speech, brain, stream, speculation=speculation))
+
+            elif packet["type"] == "metrics":
+                await send_to_frontend("metrics", metrics.snapshot())
 
             elif packet["type"] == "interrupt":
                 print("🛑 用户打断")
-                brain.state = "idle"
-                # 这里不处理逻辑，单纯重置状态，等待下一次输入
+                turn_id = session.turn_id
+                if cancel_turn(session):
+                    await send_all("canceled", {"turn_id": turn_id})
 
     except WebSocketDisconnect:
-        print("🔌 连接断开")
-        loop_task.cancel()
+        print(f"🔌 连接断开 (用户: {session.session_id})")
     except Exception as e:
         print(f"❌ Main Loop Error: {e}")
+    finally:
+        if partial_task:
+            partial_task.cancel()
+        if speculation:
+            speculation.cancel()
+        session_manager.detach(session, send_to_frontend)
+        # 这个用户的窗口全关了，就不再主动说话
+        if not session.senders:
+            disarm_proactive(session)
+
+# === 轮次调度 (可打断) ===
+
+def start_turn(session, kind: str, run):
+    """
+    开一轮新的对话 task，先打断正在进行的上一轮
+    run(send_func) 是这一轮的协程，send_func 发出的消息都带上 turn_id，前端据此丢弃被打断轮次的音频
+    """
+    previous = session.turn_task if cancel_turn(session) else None
+    # 新的一轮会改变上下文，还在跑的预生成做完也用不上
+    session.brain.proactive_pool.cancel()
+    turn_id = uuid.uuid4().hex[:8]
+    send_func = turn_sender(session.broadcast, turn_id)
+
+    async def runner():
+        if previous:
+            # 等上一轮收尾 (状态复位等) 完再开始，避免两轮交错
+            await asyncio.wait([previous])
+        handle = metrics.start_turn(kind)
+        try:
+            await run(send_func)
+        except asyncio.CancelledError:
+            session.brain.state = "idle"
+            raise
+        finally:
+            metrics.end_turn(handle)
+
+    session.turn_id, session.turn_kind = turn_id, kind
+    session.turn_task = asyncio.create_task(runner())
+    return session.turn_task
+
+def cancel_turn(session) -> bool:
+    """打断正在进行的一轮：取消 task，底层 LLM/TTS 请求随之取消。返回是否真的打断了"""
+    task = session.turn_task
+    if task is None or task.done():
+        return False
+    cancelled_at = time.perf_counter()
+
+    def on_done(_):
+        # 取消延迟：从发出取消到这一轮真正停下
+        metrics.observe("cancel_latency", None, (time.perf_counter() - cancelled_at) * 1000)
+
+    task.add_done_callback(on_done)
+    task.cancel()
+    metrics.incr(f"turns_cancelled_{session.turn_kind}")
+    print(f"✂️ 打断第 {session.turn_id} 轮 ({session.turn_kind})")
+    return True
+
+def turn_sender(send_func, turn_id: str):
+    async def send(type_str, payload, audio: bytes = None):
+        await send_func(type_str, {**payload, "turn_id": turn_id}, audio=audio)
+    return send
 
 # === 核心逻辑 ===
 
-async def handle_user_input(text: str, send_func):
-    """处理用户输入的主流程"""
+async def transcribe_and_handle(brain: NeuroBrain, audio, send_func):
+    """整段录音：语音 -> 文字 -> 主流程"""
+    text = await get_stt_backend().transcribe(audio)
+    if text:
+        # 回显给前端看
+        await send_func("text_input", {"text": text})
+        await handle_user_input(brain, text, send_func)
+
+async def handle_user_input(brain: NeuroBrain, text: str, send_func, prepared: dict = None):
+    """
+    处理用户输入的主流程
+    prepared: 推测执行提前准备好的 提示词 / 主脑结果 (见 speculate_prompt / speculate_reply)
+    """
     brain.state = "thinking"
     await send_func("state_update", {"state": "thinking"})
     brain.reset_boredom_time()
     user_time_str = datetime.datetime.now().strftime("[%H:%M:%S]")
-    current_image_b64 = None
-    vision_keywords = ["看看", "截图", "什么样", "屏幕", "image", "photo"]
-    if any(k in text for k in vision_keywords):
-        print("📸 检测到视觉关键词，正在截图...")
-        current_image_b64 = ToolBox.capture_screen_base64()
+    # 本地意图识别 (毫秒级)：决定要不要截图 / 检索 / 调主脑
+    intent = AIService.analyze_intent(text)
+    need_vision = intent["vision"]
+    if prepared and prepared["history"] != history_marker(brain):
+        # 推测期间对话历史变了 (比如插进了一次主动发言)，结果不能用
+        metrics.incr("speculation_stale")
+        prepared = None
     try:
-       
-        sys_prompt = await brain.build_system_prompt(text)
+        if not intent["llm"]:
+            # 简单轮次 (闭嘴 / 你好 / 谢谢 ...)：预置台词 + 缓存好的语音，不检索也不调主脑
+            await canned_turn(brain, text, intent["action"], user_time_str, send_func)
+            return
+
+        # 截图 (线程池) 与 记忆检索/提示词拼装 并行，两者都就绪后再调主脑
+        screenshot_task = None
+        if need_vision:
+            print("📸 需要看屏幕，正在截图...")
+            screenshot_task = asyncio.create_task(ToolBox.capture_screen_base64_async())
+        if prepared:
+            sys_prompt, turn_context = prepared["prompt"]
+        else:
+            sys_prompt, turn_context = await brain.build_prompt(text, retrieve=intent["retrieval"])
+        current_image_b64 = await screenshot_task if screenshot_task else None
         current_msg_block = {
             "role": "user", 
-            "content": f"{user_time_str} {text}"
+            "content": f"{turn_context}{user_time_str} {text}"
         }
         
    
         if current_image_b64:
              current_msg_block["content"] += "\n(系统附图：当前屏幕截图)"
 
-        messages = [sys_prompt] + brain.history + [current_msg_block]
+        messages, token_stats = brain.context.fit(sys_prompt, brain.history, current_msg_block)
+        log_token_stats(token_stats)
         
         
         print("🧠 主脑思考中...")
-        result_json = await AIService.chat_with_neuro_brain(messages, image_base64=current_image_b64)
+        spoken = False
+        if prepared and prepared.get("result") and prepared["exact"] and not current_image_b64:
+            # 最终识别结果和推测的一字不差：主脑回复 (和语音缓存) 已经有了
+            print("🎯 命中推测结果，跳过主脑调用")
+            result_json = prepared["result"]
+        elif Config.STREAM_REPLY:
+            result_json, spoken = await stream_reply(brain, messages, send_func, image_base64=current_image_b64)
+        else:
+            result_json = await AIService.chat_with_neuro_brain(messages, image_base64=current_image_b64)
         
      
         reply = result_json.get("reply", "（发呆中...）")
@@ -158,7 +439,8 @@ async def handle_user_input(text: str, send_func):
 
         # 记忆更新
         if mem_op:
-            await brain.memory.execute_updates(mem_op)
+            # 落盘 (事实库提交 / 经历日志 fsync) 放后台，回复不等它
+            brain.memory.schedule_updates(mem_op, emotion)
             if mem_op.get("is_silence_requested"):
                 brain.is_dnd_mode = True
                 print("🔕 进入勿扰模式")
@@ -183,102 +465,339 @@ async def handle_user_input(text: str, send_func):
                 "content": f"{ai_time_str} {reply}"
             })
             
-        brain.history = brain.history[-10:] # 滑动窗口
+        brain.history = brain.context.compact(brain.history) # 超预算的旧对话折叠进摘要
 
-        # 说话
-        await send_reply(reply, emotion, send_func)
+        # 说话 (流式模式下已经边生成边播放了)
+        if not spoken:
+            await send_reply(brain, reply, emotion, send_func)
 
     except Exception as e:
         print(f"❌ Handle Error: {e}")
-        await send_func("state_update", {"state": "idle"})
     finally:
         brain.state = "idle"
         brain.update_activity()
+        # 告诉前端本轮结束 (压测脚本也靠它判断一轮的耗时)
+        await send_func("state_update", {"state": "idle"})
+
+async def canned_turn(brain: NeuroBrain, text: str, action: str, user_time_str: str, send_func):
+    last = brain.history[-1]["content"].split(" ", 1)[-1] if brain.history else None
+    reply, emotion = canned_reply(action, last)
+    print(f"⚡ 本地意图 {action}，直接回复: {reply}")
+    metrics.incr(f"intent_fastpath_{action}")
+    if action == "silence":
+        brain.is_dnd_mode = True
+        print("🔕 进入勿扰模式")
+    else:
+        # 和主脑那条路一样：用户主动说话就解除勿扰
+        brain.is_dnd_mode = False
+
+    ai_time_str = datetime.datetime.now().strftime("[%H:%M:%S]")
+    brain.history.append({"role": "user", "content": f"{user_time_str} {text}"})
+    brain.history.append({"role": "assistant", "content": f"{ai_time_str} {reply}"})
+    brain.history = brain.context.compact(brain.history)
+    await send_reply(brain, reply, emotion, send_func)
+
+async def send_partial_transcript(stream: SpeechStream, send_func, speculation: Speculation = None):
+    """说话过程中的中间识别结果：前端显示，同时喂给推测执行"""
+    text = await get_stt_backend().transcribe_pcm(stream.snapshot(), stream.sample_rate)
+    if text and not stream.finished:
+        await send_func("partial_transcript", {"text": text, "final": False})
+        if speculation:
+            speculation.on_partial(text)
+
+async def finish_speech(brain: NeuroBrain, stream: SpeechStream, send_func, speculation: Speculation = None):
+    """一段流式语音结束：整段识别出最终结果，直接进入主流程"""
+    stream.finished = True   # 之后的帧不再处理
+    try:
+        text = await get_stt_backend().transcribe_pcm(bytes(stream.pcm), stream.sample_rate)
+        await send_func("partial_transcript", {"text": text, "final": True})
+        prepared = None
+        if speculation and text:
+            prepared = await speculation.take(text)
+        if text:
+            await send_func("text_input", {"text": text})
+            await handle_user_input(brain, text, send_func, prepared)
+    finally:
+        if speculation:
+            speculation.cancel()
+
+def needs_vision(text: str) -> bool:
+    return AIService.analyze_intent(text)["vision"]
+
+def history_marker(brain: NeuroBrain):
+    # 历史只会追加或整体替换 (compact)，长度 + 最后一条足以判断有没有变
+    return len(brain.history), id(brain.history[-1]) if brain.history else None
+
+async def speculate_prompt(brain: NeuroBrain, text: str):
+    """
+    推测执行第一段：用中间识别结果提前做 记忆检索 + 拼提示词
+    被取消时底层的 API 请求一起取消
+    """
+    prepared = {"history": history_marker(brain)}
+    with metrics.span("speculation"):
+        prepared["prompt"] = await brain.build_prompt(text)
+    return prepared
+
+async def speculate_reply(brain: NeuroBrain, text: str, prepared: dict):
+    """
+    推测执行第二段 (SPECULATIVE_MODE=full)：提前调主脑 + 合成语音
+    只有最终识别结果和推测逐字相同时才会被用上，否则直接取消
+    """
+    if needs_vision(text):
+        return None
+    sys_prompt, turn_context = prepared["prompt"]
+    with metrics.span("speculation_reply"):
+        user_time_str = datetime.datetime.now().strftime("[%H:%M:%S]")
+        messages, _ = brain.context.fit(sys_prompt, brain.history, {
+            "role": "user",
+            "content": f"{turn_context}{user_time_str} {text}"
+        })
+        result = await AIService.chat_with_neuro_brain(messages, fallback=False)
+        # 顺便把回复合成好放进 TTS 缓存，命中时 send_reply 直接取
+        if result.get("reply"):
+            await AIService.text_to_speech(result["reply"], result.get("emotion", "neutral"))
+    return result
 
-async def send_reply(text: str, emotion: str, send_func):
-    #合成语音并发送
+def log_token_stats(stats: dict):
+    """每轮打印 prompt 的 token 构成，方便对比预算效果"""
+    metrics.incr("prompt_tokens", stats["total"])
+    print(f"📏 Prompt tokens: 共 {stats['total']} (系统 {stats['system']} / 历史 {stats['history']}"
+          f" / 输入 {stats['input']}，裁掉历史 {stats['history_dropped']} 条)")
+
+async def send_reply(brain: NeuroBrain, text: str, emotion: str, send_func, audio: bytes = None):
+    #合成语音并发送 (audio: 已经合成好的语音，直接发)
     brain.state = "speaking"
     # 调用 TTS
     estimated_duration = len(text) * 0.25 + 1.0
     brain.last_interaction = time.time() + estimated_duration
-    audio_b64 = await AIService.text_to_speech(text, emotion)
+    with metrics.span("send_reply"):
+        audio_bytes = audio or await AIService.text_to_speech(text, emotion)
+        metrics.mark("first_audio")
+        await send_func("audio_chunk", {
+            "text": text,
+            "expression": emotion,
+            "seq": 0
+        }, audio=audio_bytes)
+
+async def stream_reply(brain: NeuroBrain, messages: list, send_func, image_base64: str = None, kind: str = "user"):
+    """
+    流式说话：主脑边生成，边把 reply 按句切开送 TTS，
+    按顺序 (seq) 发出 audio_chunk。
+    返回 (完整的 result_json, 是否已经说出了内容)
+    """
+    streamer = JsonFieldStreamer(fields=("reply", "emotion"))
+    splitter = SentenceSplitter()
+    tts_queue = asyncio.Queue()
+    sender = asyncio.create_task(_send_audio_in_order(brain, tts_queue, send_func))
+    sentences = []
+    tts_tasks = []
+
+    def dispatch(sentence: str):
+        # 立刻开始合成，发送顺序由队列保证
+        emotion = streamer.values.get("emotion", "neutral")
+        task = asyncio.create_task(AIService.text_to_speech(sentence, emotion))
+        tts_tasks.append(task)
+        tts_queue.put_nowait((len(sentences), sentence, emotion, task))
+        sentences.append(sentence)
+
+    try:
+        async for delta in AIService.stream_neuro_brain(messages, image_base64=image_base64, kind=kind):
+            for field, piece in streamer.feed(delta):
+                if field == "reply":
+                    for sentence in splitter.feed(piece):
+                        dispatch(sentence)
+        for sentence in splitter.flush():
+            dispatch(sentence)
+        tts_queue.put_nowait(None)
+        await sender
+    except BaseException:
+        # 被打断 (或出错)：还没发出的句子连同正在合成的 TTS 请求一起取消
+        sender.cancel()
+        for task in tts_tasks:
+            task.cancel()
+        raise
+
+    result_json = streamer.result()
+    if sentences and not result_json.get("reply"):
+        result_json["reply"] = "".join(sentences)
+    return result_json, bool(sentences)
+
+async def _send_audio_in_order(brain: NeuroBrain, tts_queue: asyncio.Queue, send_func):
+    """按句子顺序等待 TTS 结果并发送"""
+    while True:
+        item = await tts_queue.get()
+        if item is None:
+            break
+        seq, sentence, emotion, task = item
+        audio_bytes = await task
+        if seq == 0:
+            brain.state = "speaking"
+            metrics.mark("first_audio")
+        # 每发一句，顺延预计说完的时间
+        brain.last_interaction = max(brain.last_interaction, time.time()) + len(sentence) * 0.25 + 0.5
+        await send_func("audio_chunk", {
+            "text": sentence,
+            "expression": emotion,
+            "seq": seq
+        }, audio=audio_bytes)
+
+# === 主动发言调度 ===
+
+def arm_proactive(session):
+    """会话有连接时登记主动发言；之后每次活动都会自动改期"""
+    session.brain.on_activity = lambda: schedule_proactive(session)
+    schedule_proactive(session)
+    print(f"🔄 自主意识启动 (用户: {session.session_id})")
+
+def disarm_proactive(session):
+    session.brain.on_activity = None
+    scheduler.cancel(session.session_id)
+    scheduler.cancel(f"{session.session_id}:prefill")
+    session.brain.proactive_pool.cancel()
+    # 没人听了：正在进行的主动发言也停掉 (用户输入的轮次让它跑完，记忆要落盘)
+    if session.turn_kind == "proactive":
+        cancel_turn(session)
+
+def schedule_proactive(session, not_before: float = 0):
+    deadline = max(session.brain.next_proactive_time(), not_before)
+    scheduler.schedule(session.session_id, deadline, lambda: on_proactive_due(session))
+    if Config.PROACTIVE_POOL_SIZE > 0:
+        # 到期前先在后台把要说的话准备好
+        prefill_at = max(time.time(), deadline - Config.PROACTIVE_PREFILL_LEAD)
+        scheduler.schedule(f"{session.session_id}:prefill", prefill_at, lambda: on_prefill_due(session))
+
+def proactive_context(brain: NeuroBrain):
+    """预生成的台词只在这些都没变时可用：对话历史、滚动摘要、勿扰状态"""
+    return history_marker(brain), brain.context.summary, brain.is_dnd_mode
+
+def on_prefill_due(session):
+    """空闲时开始预生成主动发言；忙或者没人听就算了，下次改期时再来"""
+    brain = session.brain
+    busy = brain.state != "idle" or (session.turn_task and not session.turn_task.done())
+    if busy or not session.senders or brain.is_dnd_mode:
+        return
+    if brain.proactive_pool.needs_fill(proactive_context(brain)):
+        brain.proactive_pool.start_fill(lambda: prefill_proactive(brain))
+
+def on_proactive_due(session):
+    """到期回调：条件满足就开一轮主动发言，否则改期"""
+    brain = session.brain
+    busy = brain.state != "idle" or (session.turn_task and not session.turn_task.done())
+    if not busy:
+        # 空闲时顺带整理旧经历 (有间隔限制，大多数时候直接返回)
+        brain.memory.start_consolidation()
+    if not session.senders or brain.is_dnd_mode:
+        # 勿扰模式下不再登记，等用户下次说话 (update_activity) 重新登记
+        return
+    now = time.time()
+    if busy or now < brain.next_proactive_time():
+        # 还在说话，或者期间有新动静：顺延到新的到期时间
+        schedule_proactive(session, not_before=now + 1)
+        return
+    start_turn(session, "proactive", functools.partial(proactive_turn, brain))
+
+async def proactive_messages(brain: NeuroBrain, recalled: list = None) -> list:
+    """主动发言的 prompt (当场生成和预生成共用)"""
+    sys_prompt, turn_context = await brain.build_prompt(recalled=recalled)
+    last_active_str = datetime.datetime.fromtimestamp(brain.last_user_input_time).strftime("%H:%M:%S")
+    trigger_content = f"""
+    (系统自动触发指令：
+    1. 用户当前处于静默状态。
+    2. 用户最后一次发言时间是：{last_active_str}。
+    3. 请对比【当前系统时间】与【最后发言时间】：
+       - 如果时间差很短（连续对话）：请顺着上文继续聊，不要打断话题。或者如果当前话题无聊，可以主动找话题
+       - 如果时间差很长（长久冷落）：可以参考【记忆信息】里的随机往事，或者吐槽太安静了，或者主动找话题聊天。
     
-    await send_func("audio_chunk", {
-        "text": text,
-        "audio_base64": audio_b64,
-        "expression": emotion
+    必须返回 JSON。)
+    """
+
+    msgs, token_stats = brain.context.fit(sys_prompt, brain.history, {
+        "role": "user", 
+        "content": turn_context + trigger_content
     })
+    log_token_stats(token_stats)
+    return msgs
 
-async def game_loop(ws, send_func):
-    """自主意识循环"""
-    print("🔄 自主意识启动")
+async def prefill_proactive(brain: NeuroBrain):
+    """
+    后台预生成主动发言，直到候选池满
+    每条都连语音一起合成好；生成期间上下文变了 (用户说话等) 就丢掉
+    """
+    pool = brain.proactive_pool
+    while pool.needs_fill(proactive_context(brain)):
+        context = proactive_context(brain)
+        recalled = []   # 抽到的回忆等这句真正播出去再记
+        with metrics.span("proactive_prefill"):
+            msgs = await proactive_messages(brain, recalled)
+            result = await AIService.chat_with_neuro_brain(msgs, kind="proactive", fallback=False)
+            reply = result.get("reply")
+            if not reply:
+                return
+            emotion = result.get("emotion", "neutral")
+            audio = await AIService.text_to_speech(reply, emotion)
+        if proactive_context(brain) != context:
+            metrics.incr("proactive_pool_stale")
+            return
+        pool.add(context, {"reply": reply, "emotion": emotion, "audio": audio, "recalled": recalled})
+        print(f"🗂️ 预生成主动发言: {reply}")
 
-    while True:
-        await asyncio.sleep(1)
-        now = time.time()
+async def proactive_turn(brain: NeuroBrain, send_func):
+    """一次主动发言"""
+    print("🥱 触发主动发言")
+    # 先看有没有预生成好的 (上下文变过的会被丢掉)
+    candidate = brain.proactive_pool.take(proactive_context(brain))
+    brain.increase_boredom_time()
+    brain.state = "thinking"
+    await send_func("state_update", {"state": "thinking"})
+    brain.update_activity() 
+    
+    try:
+        spoken = False
+        if candidate:
+            # 台词和语音都是现成的，直接播；这时才把用到的回忆算作想起过
+            result_json = candidate
+            for doc_id in candidate["recalled"]:
+                await brain.memory.mark_recalled(doc_id)
+        else:
+            msgs = await proactive_messages(brain)
+
+            # 调用主脑
+            print("🧠 主脑主动思考中...")
+            if Config.STREAM_REPLY:
+                result_json, spoken = await stream_reply(brain, msgs, send_func, kind="proactive")
+            else:
+                result_json = await AIService.chat_with_neuro_brain(msgs, kind="proactive")
         
-        if (not brain.is_dnd_mode) and \
-           (brain.state == "idle") and \
-           (now - brain.last_interaction > brain.boredom_threshold):
+        reply = result_json.get("reply")
+        emotion = result_json.get("emotion", "neutral")
+        
+        if reply:
+            print(f"💡 主动生成: {reply}")
             
-            print("🥱 触发主动发言")
-            brain.increase_boredom_time()
-            brain.state = "thinking"
-            await send_func("state_update", {"state": "thinking"})
-            brain.update_activity() 
+        
+            ai_time_str = datetime.datetime.now().strftime("[%H:%M:%S]")
             
-            try:
-                sys_prompt = await brain.build_system_prompt() 
-                last_active_str = datetime.datetime.fromtimestamp(brain.last_user_input_time).strftime("%H:%M:%S")
-                trigger_content = f"""
-                (系统自动触发指令：
-                1. 用户当前处于静默状态。
-                2. 用户最后一次发言时间是：{last_active_str}。
-                3. 请对比【当前系统时间】与【最后发言时间】：
-                   - 如果时间差很短（连续对话）：请顺着上文继续聊，不要打断话题。或者如果当前话题无聊，可以主动找话题
-                   - 如果时间差很长（长久冷落）：可以参考【记忆信息】里的随机往事，或者吐槽太安静了，或者主动找话题聊天。
-                
-                必须返回 JSON。)
-                """
-
-                msgs = [sys_prompt] + brain.history + [{
-                    "role": "user", 
-                    "content": trigger_content
-                }]
-                
-                # 调用主脑
-                print("🧠 主脑主动思考中...")
-                result_json = await AIService.chat_with_neuro_brain(msgs)
-                
-                reply = result_json.get("reply")
-                emotion = result_json.get("emotion", "neutral")
-                
-                if reply:
-                    print(f"💡 主动生成: {reply}")
-                    
-                
-                    ai_time_str = datetime.datetime.now().strftime("[%H:%M:%S]")
-                    
-                    brain.history.append({
-                        "role": "assistant", 
-                        "content": f"{ai_time_str} {reply}"
-                    })
-                 
-                    brain.history = brain.history[-10:] 
-                    # ==========================================
-
-                    await send_reply(reply, emotion, send_func)
-                    brain.state = "idle"
-                    await send_func("state_update", {"state": "idle"})
-                else:
-                    print("⚠️ 主动发言生成了空内容")
-                    brain.state = "idle"
-                    await send_func("state_update", {"state": "idle"})
-
-            except Exception as e:
-                print(f"❌ 主动发言失败: {e}")
-                brain.state = "idle"
-                await send_func("state_update", {"state": "idle"})
+            brain.history.append({
+                "role": "assistant", 
+                "content": f"{ai_time_str} {reply}"
+            })
+         
+            brain.history = brain.context.compact(brain.history)
+            # ==========================================
+
+            if not spoken:
+                await send_reply(brain, reply, emotion, send_func, audio=result_json.get("audio"))
+            brain.state = "idle"
+            await send_func("state_update", {"state": "idle"})
+        else:
+            print("⚠️ 主动发言生成了空内容")
+            brain.state = "idle"
+            await send_func("state_update", {"state": "idle"})
+
+    except Exception as e:
+        print(f"❌ 主动发言失败: {e}")
+        brain.state = "idle"
+        await send_func("state_update", {"state": "idle"})
 if __name__ == "__main__":
     import uvicorn
     # 启动服务器，监听 8000 端口
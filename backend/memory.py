@@ -1,113 +1,144 @@
+import asyncio
 import json
-import time
 import os
-import random
-import uuid
-import datetime
+import time
 import chromadb
-from chromadb.config import Settings
-from services import AIService
+from config import Config
+from metrics import traced
+from context import select_relevant_facts
+from retrieval import HybridRetriever
+from embeddings import embed_text, open_collection
+from writeback import EpisodeWriter
+from facts import get_fact_store
+from consolidation import CONSOLIDATED_KEY, consolidate
+
+# 整个进程共用一个 Chroma 客户端，各用户只是集合不同
+_chroma_client = None
+
+def get_chroma_client():
+    global _chroma_client
+    if _chroma_client is None:
+        _chroma_client = chromadb.PersistentClient(path="./memory_db")
+    return _chroma_client
 
 class MemorySystem:
-    def __init__(self):
+    def __init__(self, user_id: str = "default"):
+        # default 用户沿用原来的集合名和文件，老数据不用迁移
+        self.user_id = user_id
+        is_default = user_id == "default"
+
         # 1. 向量库 (存经历/对话片段)
-        self.chroma = chromadb.PersistentClient(path="./memory_db")
-        self.episodic_col = self.chroma.get_or_create_collection("episodes")
+        # 集合在第一次用到时才打开 (ready)：向量模型变了要先整体重新向量化
+        self.chroma = get_chroma_client()
+        self.collection_name = "episodes" if is_default else f"episodes_{user_id}"
+        self.episodic_col = None
+        self.retriever = None        # 关键词索引，随 execute_updates 同步
+        self.vectors_ok = True       # 向量和当前模型对不上 (迁移失败) 时只用关键词检索
+        self._ready_lock = asyncio.Lock()
+        # 新经历先进后台写入队列，日志按用户分文件
+        os.makedirs(Config.EPISODE_JOURNAL_DIR, exist_ok=True)
+        self.writer = EpisodeWriter(self, os.path.join(Config.EPISODE_JOURNAL_DIR, f"{user_id}.jsonl"))
+        # 旧经历按周合并 (空闲时后台跑)
+        self.consolidation_task = None
+        self.last_consolidation = None   # 集合打开时从元数据读出，None = 还不知道
+        # 主脑下达的记忆指令在后台执行，按顺序一条条来
+        self._update_tasks = set()
+        self._update_lock = asyncio.Lock()
         
-        # 2. 事实库 (存属性 JSON)
-        self.facts_path = "user_facts.json"
-        self.facts = self._load_facts()
-
-    def _load_facts(self):
-        if os.path.exists(self.facts_path):
-            with open(self.facts_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return {}
-
-    def _save_facts(self):
-        with open(self.facts_path, 'w', encoding='utf-8') as f:
-            json.dump(self.facts, f, ensure_ascii=False, indent=2)
-
-    def get_fact_context(self):
-        """提供给主脑的所有已知信息"""
-        facts_str = json.dumps(self.facts, ensure_ascii=False)
-        return facts_str
-    async def get_longmemory_context(self, user_text: str = None):
+        # 2. 事实库 (SQLite，按 key 更新并保留历史版本)
+        # 老版本的 JSON 文件第一次启动时导入一次
+        if is_default:
+            legacy_path = "user_facts.json"
+        else:
+            legacy_path = os.path.join(Config.FACTS_DIR, f"{user_id}.json")
+        fact_store = get_fact_store()
+        fact_store.import_json(user_id, legacy_path)
+        self.facts = fact_store.load(user_id)   # 内存副本，拼提示词用
+
+    def get_fact_blocks(self, user_text: str = None):
+        """
+        分两块提供事实，照顾 prompt 缓存：
+        - stable: 不看输入、顺序固定的事实 (放进系统提示，轮与轮之间不变)
+        - extra: 预算外、但和本轮输入相关的事实 (放进本轮消息)
+        """
+        stable = select_relevant_facts(self.facts)
+        rest = {k: v for k, v in self.facts.items() if k not in stable}
+        extra = {}
+        if user_text and rest:
+            extra = select_relevant_facts(rest, user_text, Config.FACTS_EXTRA_TOKEN_BUDGET, only_matching=True)
+        return (
+            json.dumps(stable, ensure_ascii=False),
+            json.dumps(extra, ensure_ascii=False) if extra else ""
+        )
+    async def ready(self):
+        if self.episodic_col is not None:
+            return
+        async with self._ready_lock:
+            if self.episodic_col is not None:
+                return
+            try:
+                col = await open_collection(self.chroma, self.collection_name)
+            except Exception as e:
+                print(f"⚠️ 记忆库向量迁移失败，暂时只用关键词检索: {e}")
+                self.vectors_ok = False
+                col = await asyncio.to_thread(self.chroma.get_or_create_collection, self.collection_name)
+            self.retriever = HybridRetriever(col)
+            self.last_consolidation = float((col.metadata or {}).get(CONSOLIDATED_KEY, 0.0))
+            self.episodic_col = col
+        self.writer.start()   # 上次没写完的经历 (从日志恢复的) 接着写
+
+    @traced("memory_retrieval")
+    async def get_longmemory_context(self, user_text: str = None, recalled: list = None):
+        """recalled: 传入列表时抽到的回忆只记进列表，等真正说出口再 mark_recalled (预生成的台词可能不用)"""
+        await self.ready()
         memory_str = "" 
         if user_text:
-            query_vec = await AIService.get_embedding(user_text)
-            if query_vec:
-                results = self.episodic_col.query(
-                    query_embeddings=[query_vec],
-                    n_results=3
-                )
-                if results['documents'] and results['documents'][0]:
-                    docs = results['documents'][0]
-                    metas = results['metadatas'][0]
-                    distances = results['distances'][0] 
-                    
-                    # 构建一个列表来处理排序
-                    ranked_memories = []
-                    now = datetime.datetime.now()
-                    
-                    for i, (doc, meta, dist) in enumerate(zip(docs, metas, distances)):
-                        # 基础分：将距离转化为相似度分数 (0~1之间)
-                        # 距离越小分越高，加1防止除零
-                        base_score = 1 / (1 + dist)      
-                        # 获取时间并计算天数差
-                        date_str = meta.get('date', '1970-01-01')
-                        try:
-                            mem_date = datetime.datetime.strptime(date_str, "%Y-%m-%d")
-                            days_diff = (now - mem_date).days
-                        except:
-                            days_diff = 9999   
-                        time_boost = 1.0
-                        if days_diff <= 3:
-                            time_boost = 1.2
-                        elif days_diff <= 30:
-                            time_boost = 1.1
-                            
-                        final_score = base_score * time_boost
-                        
-                        ranked_memories.append({
-                            "content": doc,
-                            "date": date_str,
-                            "score": final_score
-                        })
-                    
-                    # 按最终分数重新排序，取前3
-                    ranked_memories.sort(key=lambda x: x['score'], reverse=True)
-                    top_k = ranked_memories[:3]
-
-                    memory_str += "\n【关联往事】\n"
-                    for mem in top_k:
-                        print(f"记忆: {mem['content'][:10]}... | 原始分: {base_score:.3f} | 最终分: {mem['score']:.3f}")
-                        memory_str += f"- ({mem['date']}) {mem['content']}\n"
+            # 向量 + 关键词混合检索；embedding 失败时至少还有关键词
+            query_vec, _ = await asyncio.gather(
+                embed_text(user_text) if self.vectors_ok else asyncio.sleep(0),
+                self.retriever.ensure_loaded()
+            )
+            memories = await self.retriever.search(user_text, query_vec)
+            if memories:
+                memory_str += "\n【关联往事】\n"
+                for mem in memories:
+                    print(f"记忆: {mem['content'][:10]}... | 融合分: {mem['score']:.4f}")
+                    memory_str += f"- ({mem['date']}) {mem['content']}\n"
   
         else:
-       
-            total_count = self.episodic_col.count()
-            if total_count > 0:
-                random_offset = random.randint(0, total_count - 1)
-           
-                random_result = self.episodic_col.get(
-                    limit=1,
-                    offset=random_offset
-                )
-                
-                if random_result['documents']:
-                    doc = random_result['documents'][0]
-              
-                    meta = random_result['metadatas'][0] if random_result['metadatas'] else {}
-                    date_str = meta.get('date', '久远的回忆')
-                    
-                    memory_str += f"\n【突然想起】\n- ({date_str}) {doc}\n"
-                
+            # 主动发言：从内存里的回忆索引按权重抽一条，不用让 Chroma 数到随机偏移
+            await self.retriever.ensure_loaded()
+            doc_id = self.retriever.recall.sample()
+            entry = self.retriever.index.get(doc_id) if doc_id else None
+            if entry:
+                doc, meta = entry
+                date_str = meta.get('date', '久远的回忆')
+                memory_str += f"\n【突然想起】\n- ({date_str}) {doc}\n"
+                if recalled is None:
+                    await self.mark_recalled(doc_id)
+                else:
+                    recalled.append(doc_id)
+
         return memory_str
 
 
 
-    async def execute_updates(self, update_instruction: dict):
+    async def mark_recalled(self, doc_id: str):
+        """回忆次数写回元数据，重启后也不会总想起同几件事"""
+        entry = self.retriever.index.get(doc_id)
+        marked = self.retriever.recall.mark(doc_id) if entry else None
+        if not marked:
+            return
+        meta = entry[1]
+        recalls, now = marked
+        meta.update({"recalls": recalls, "last_recalled": now})
+        try:
+            await asyncio.to_thread(self.episodic_col.update, ids=[doc_id], metadatas=[meta])
+        except Exception as e:
+            print(f"⚠️ 回忆次数写回失败: {e}")
+
+    @traced("memory_update")
+    async def execute_updates(self, update_instruction: dict, emotion: str = None):
         """
         执行主脑下达的记忆指令
         update_instruction 结构:
@@ -115,28 +146,62 @@ class MemorySystem:
             "new_facts": {"key": "value"},  // 更新属性
             "new_episode": "今天发生了..."   // 存入经历
         }
+        emotion 是这一轮回复的情绪，跟经历一起存下来 (随机回忆时偏向情绪强烈的)
         """
      
         new_facts = update_instruction.get("new_facts")
         if new_facts:
             print(f"🧠 主脑决定更新事实: {new_facts}")
             self.facts.update(new_facts)
-            self._save_facts()
+            # 只写变化的 key，在线程池里做，不卡事件循环
+            await asyncio.to_thread(get_fact_store().upsert, self.user_id, dict(new_facts))
 
   
         new_episode = update_instruction.get("new_episode")
         if new_episode:
-            print(f"📅 主脑决定记录经历: {new_episode}")
-            vector = await AIService.get_embedding(new_episode)
-            if vector:
-                self.episodic_col.add(
-                    documents=[new_episode],
-                    embeddings=[vector],
-                    metadatas=[{
-                        "timestamp": time.time(),
-                        "date": datetime.datetime.now().strftime("%Y-%m-%d")
-                    }],
-                    ids=[str(uuid.uuid4())]
-                )
-                print(f"✅ 存入成功! 当前总记忆数: {self.episodic_col.count()}") 
-            
\ No newline at end of file
+            # 兼容一次给多条经历的情况；只入队，向量化和写库在后台批量做
+            episodes = new_episode if isinstance(new_episode, list) else [new_episode]
+            print(f"📅 主脑决定记录经历: {episodes}")
+            await self.writer.enqueue(episodes, emotion)
+
+    def schedule_updates(self, update_instruction: dict, emotion: str = None):
+        """回复路径上调用：不等落盘，指令在后台按顺序执行"""
+        task = asyncio.create_task(self._run_updates(update_instruction, emotion))
+        self._update_tasks.add(task)
+        task.add_done_callback(self._update_tasks.discard)
+        return task
+
+    async def _run_updates(self, update_instruction: dict, emotion: str = None):
+        async with self._update_lock:
+            try:
+                await self.execute_updates(update_instruction, emotion)
+            except Exception as e:
+                print(f"❌ 记忆更新失败: {e}")
+
+    def start_consolidation(self) -> bool:
+        """空闲时调用：离上次整理够久就在后台整理一次经历库"""
+        if not Config.CONSOLIDATION_ENABLED:
+            return False
+        if self.consolidation_task and not self.consolidation_task.done():
+            return False
+        if self.last_consolidation is None:
+            return False   # 集合还没打开过，不知道上次什么时候整理的
+        if time.time() - self.last_consolidation < Config.CONSOLIDATION_INTERVAL_HOURS * 3600:
+            return False
+        self.last_consolidation = time.time()
+        self.consolidation_task = asyncio.create_task(self._consolidate())
+        return True
+
+    async def _consolidate(self):
+        try:
+            await consolidate(self)
+        except Exception as e:
+            print(f"❌ 经历整理失败: {e}")
+
+    async def close(self):
+        if self.consolidation_task:
+            self.consolidation_task.cancel()
+        # 还没执行完的记忆指令先做完，经历才会进写入队列
+        if self._update_tasks:
+            await asyncio.wait(list(self._update_tasks), timeout=10)
+        await self.writer.close()
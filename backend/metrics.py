@@ -0,0 +1,191 @@
+import contextvars
+import functools
+import inspect
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+# 当前轮次 {"started": ..., "spans": [...]} (asyncio task 之间自动隔离)
+_current_turn = contextvars.ContextVar("current_turn", default=None)
+
+
+class Metrics:
+    """
+    轻量级耗时统计
+    - 每个 (阶段, 提供方) 保留最近 N 次耗时，按需算 p50/p95/p99
+    - 每一轮对话记录所有 span，方便看单轮时间花在哪
+    """
+
+    QUANTILES = (0.5, 0.95, 0.99)
+
+    def __init__(self, window: int = 1000, keep_turns: int = 50):
+        self.window = window
+        self.samples = {}                       # (stage, provider) -> deque[ms]
+        self.totals = {}                        # (stage, provider) -> [count, sum_ms, errors]
+        self.counters = {}                      # name -> int
+        self.recent_turns = deque(maxlen=keep_turns)
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, provider: str, ms: float, error: bool = False):
+        key = (stage, provider or "local")
+        with self._lock:
+            if key not in self.samples:
+                self.samples[key] = deque(maxlen=self.window)
+                self.totals[key] = [0, 0.0, 0]
+            self.samples[key].append(ms)
+            total = self.totals[key]
+            total[0] += 1
+            total[1] += ms
+            if error:
+                total[2] += 1
+        turn = _current_turn.get()
+        if turn is not None:
+            turn["spans"].append({"stage": stage, "provider": key[1], "ms": round(ms, 1), "error": error})
+
+    def incr(self, name: str, value: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    @staticmethod
+    def _quantile(sorted_vals, q):
+        if not sorted_vals:
+            return 0.0
+        idx = min(len(sorted_vals) - 1, int(round(q * (len(sorted_vals) - 1))))
+        return sorted_vals[idx]
+
+    def snapshot(self):
+        """各阶段的分位数统计 + 最近一轮的 span"""
+        with self._lock:
+            stages = []
+            for (stage, provider), vals in self.samples.items():
+                ordered = sorted(vals)
+                count, sum_ms, errors = self.totals[(stage, provider)]
+                stages.append({
+                    "stage": stage,
+                    "provider": provider,
+                    "count": count,
+                    "errors": errors,
+                    "sum_ms": round(sum_ms, 1),
+                    **{f"p{int(q * 100)}": round(self._quantile(ordered, q), 1) for q in self.QUANTILES},
+                })
+            return {
+                "stages": stages,
+                "counters": dict(self.counters),
+                "last_turn": self.recent_turns[-1] if self.recent_turns else None,
+            }
+
+    def render_prometheus(self, extra_gauges: dict = None):
+        """输出 Prometheus 文本格式"""
+        snap = self.snapshot()
+        lines = [
+            "# HELP neuro_stage_latency_ms Per-stage latency in milliseconds",
+            "# TYPE neuro_stage_latency_ms summary",
+        ]
+        for item in snap["stages"]:
+            labels = f'stage="{item["stage"]}",provider="{_escape(item["provider"])}"'
+            for q in self.QUANTILES:
+                lines.append(f'neuro_stage_latency_ms{{{labels},quantile="{q}"}} {item[f"p{int(q * 100)}"]}')
+            lines.append(f"neuro_stage_latency_ms_sum{{{labels}}} {item['sum_ms']}")
+            lines.append(f"neuro_stage_latency_ms_count{{{labels}}} {item['count']}")
+        lines.append("# TYPE neuro_stage_errors_total counter")
+        for item in snap["stages"]:
+            labels = f'stage="{item["stage"]}",provider="{_escape(item["provider"])}"'
+            lines.append(f"neuro_stage_errors_total{{{labels}}} {item['errors']}")
+        for name, value in snap["counters"].items():
+            lines.append(f"# TYPE neuro_{name}_total counter")
+            lines.append(f"neuro_{name}_total {value}")
+        for name, value in (extra_gauges or {}).items():
+            lines.append(f"# TYPE neuro_{name} gauge")
+            lines.append(f"neuro_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    # === 单轮追踪 ===
+    def start_turn(self, kind: str = "user"):
+        """开始记录一轮对话，返回交给 end_turn 的句柄"""
+        turn_id = uuid.uuid4().hex[:8]
+        started = time.perf_counter()
+        token = _current_turn.set({"started": started, "spans": []})
+        return turn_id, token, started, kind
+
+    def mark(self, stage: str):
+        """记录从本轮开始到现在的耗时 (比如首句音频发出)"""
+        turn = _current_turn.get()
+        if turn is not None:
+            self.observe(stage, None, (time.perf_counter() - turn["started"]) * 1000)
+
+    def end_turn(self, handle):
+        turn_id, token, started, kind = handle
+        turn = _current_turn.get()
+        spans = turn["spans"] if turn else []
+        _current_turn.reset(token)
+        total_ms = (time.perf_counter() - started) * 1000
+        self.observe(f"turn_{kind}", None, total_ms)
+        self.recent_turns.append({"turn_id": turn_id, "kind": kind, "total_ms": round(total_ms, 1), "spans": spans})
+        summary = " | ".join(f"{s['stage']} {s['ms']:.0f}ms" for s in spans)
+        print(f"⏱️ 本轮耗时 {total_ms:.0f}ms: {summary}")
+
+    @contextmanager
+    def span(self, stage: str, provider: str = None):
+        started = time.perf_counter()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.observe(stage, provider, (time.perf_counter() - started) * 1000, error)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+metrics = Metrics()
+
+
+def traced(stage: str, provider=None):
+    """
+    给函数加耗时统计，支持 同步 / async / async 生成器
+    provider 可以是字符串，也可以是无参函数 (运行时才读配置)
+    async 生成器额外记录首包时间 (<stage>_first)
+    """
+    def resolve():
+        return provider() if callable(provider) else provider
+
+    def decorator(func):
+        if inspect.isasyncgenfunction(func):
+            @functools.wraps(func)
+            async def gen_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                first = True
+                error = False
+                try:
+                    async for item in func(*args, **kwargs):
+                        if first:
+                            metrics.observe(f"{stage}_first", resolve(), (time.perf_counter() - started) * 1000)
+                            first = False
+                        yield item
+                except BaseException:
+                    error = True
+                    raise
+                finally:
+                    metrics.observe(stage, resolve(), (time.perf_counter() - started) * 1000, error)
+            return gen_wrapper
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with metrics.span(stage, resolve()):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def sync_wrapper(*args, **kwargs):
+            with metrics.span(stage, resolve()):
+                return func(*args, **kwargs)
+        return sync_wrapper
+
+    return decorator
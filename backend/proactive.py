@@ -0,0 +1,58 @@
+import asyncio
+import time
+from config import Config
+from metrics import metrics
+
+
+class ProactivePool:
+    """
+    预先生成好的主动发言 (台词 + 情绪 + 合成好的语音，都存在候选里)
+    - 每条候选记下生成时的对话上下文标记 (context key)，上下文一变就作废
+    - 放太久的也作废 (里面可能提到了"刚才"之类的时间)
+    - 后台填充任务同一时间只跑一个
+    """
+
+    def __init__(self):
+        self.candidates = []   # [(context key, 生成时间, {"reply", "emotion", "audio", "recalled"})]
+        self.task = None
+
+    def valid(self, key) -> list:
+        now = time.time()
+        kept = [c for c in self.candidates if c[0] == key and now - c[1] < Config.PROACTIVE_POOL_TTL]
+        if len(kept) != len(self.candidates):
+            metrics.incr("proactive_pool_invalidated", len(self.candidates) - len(kept))
+            self.candidates = kept
+        return kept
+
+    def needs_fill(self, key) -> bool:
+        return len(self.valid(key)) < Config.PROACTIVE_POOL_SIZE
+
+    def add(self, key, candidate: dict):
+        self.candidates.append((key, time.time(), candidate))
+
+    def take(self, key):
+        """取一条还有效的候选 (先进先出)，没有就返回 None"""
+        kept = self.valid(key)
+        if not kept:
+            metrics.incr("proactive_pool_miss")
+            return None
+        self.candidates.remove(kept[0])
+        metrics.incr("proactive_pool_hit")
+        return kept[0][2]
+
+    def start_fill(self, fill) -> bool:
+        """fill: 无参、返回协程的填充函数；已经在填就不重复开"""
+        if self.task and not self.task.done():
+            return False
+        self.task = asyncio.create_task(self._run(fill))
+        return True
+
+    async def _run(self, fill):
+        try:
+            await fill()
+        except Exception as e:
+            print(f"⚠️ 主动发言预生成失败: {e}")
+
+    def cancel(self):
+        if self.task and not self.task.done():
+            self.task.cancel()
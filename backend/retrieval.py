@@ -0,0 +1,362 @@
+import asyncio
+import datetime
+import heapq
+import math
+import random
+import re
+import threading
+import time
+from array import array
+from config import Config
+from metrics import metrics
+
+try:
+    import jieba
+    jieba.setLogLevel(60)
+except ImportError:
+    # 没装 jieba 就按字二元组切，中文短句效果也还行
+    jieba = None
+
+_WORD = re.compile(r"[a-z0-9]+|[一-鿿]+")
+
+
+def tokenize(text: str) -> list:
+    """中文用 jieba 搜索模式 (或字二元组)，英文数字按词"""
+    tokens = []
+    for piece in _WORD.findall((text or "").lower()):
+        if not "一" <= piece[0] <= "鿿":
+            tokens.append(piece)
+        elif jieba is not None:
+            tokens.extend(w for w in jieba.lcut_for_search(piece) if w.strip())
+        elif len(piece) == 1:
+            tokens.append(piece)
+        else:
+            tokens.extend(piece[i:i + 2] for i in range(len(piece) - 1))
+    return tokens
+
+
+def episode_time(meta: dict) -> float:
+    """记忆发生时间：优先 timestamp，老数据只有 date"""
+    meta = meta or {}
+    if meta.get("timestamp"):
+        return float(meta["timestamp"])
+    try:
+        return datetime.datetime.strptime(meta.get("date", ""), "%Y-%m-%d").timestamp()
+    except ValueError:
+        return 0.0
+
+
+class KeywordIndex:
+    """
+    内存里的 BM25 倒排索引
+    - 倒排表用 array 存 (文档序号, 词频)，10 万条记忆也只占几十 MB
+    - 删除只打标记，不重排倒排表
+    """
+    K1 = 1.2
+    B = 0.75
+    MAX_DF_RATIO = 0.5
+    MIN_DOCS_FOR_DF_CUTOFF = 1000   # 记忆少的时候不跳词，不然新用户几乎什么都搜不到
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.ids = []                 # 序号 -> 记忆 id
+        self.pos = {}                 # 记忆 id -> 序号
+        self.docs = []                # 序号 -> (文本, 元数据)
+        self.lengths = array("I")
+        self.alive = bytearray()
+        self.postings = {}            # 词 -> (array 序号, array 词频)
+        self.total_len = 0
+
+    def __len__(self):
+        return len(self.pos)
+
+    def add(self, ids, docs, metas):
+        with self._lock:
+            for doc_id, doc, meta in zip(ids, docs, metas):
+                if doc_id in self.pos or not doc:
+                    continue
+                idx = len(self.ids)
+                tokens = tokenize(doc)
+                self.ids.append(doc_id)
+                self.pos[doc_id] = idx
+                self.docs.append((doc, meta or {}))
+                self.lengths.append(len(tokens))
+                self.alive.append(1)
+                self.total_len += len(tokens)
+                tf = {}
+                for tok in tokens:
+                    tf[tok] = tf.get(tok, 0) + 1
+                for tok, n in tf.items():
+                    posting = self.postings.get(tok)
+                    if posting is None:
+                        posting = self.postings[tok] = (array("I"), array("H"))
+                    posting[0].append(idx)
+                    posting[1].append(min(n, 65535))
+
+    def remove(self, ids):
+        with self._lock:
+            for doc_id in ids:
+                idx = self.pos.pop(doc_id, None)
+                if idx is not None:
+                    self.alive[idx] = 0
+                    self.total_len -= self.lengths[idx]
+
+    @property
+    def dead(self) -> int:
+        """打了删除标记、还占着倒排表的条数"""
+        return len(self.ids) - len(self.pos)
+
+    def entries(self) -> list:
+        """还在的全部记忆 [(id, 文本, 元数据)]"""
+        with self._lock:
+            return [(doc_id, *self.docs[idx]) for doc_id, idx in self.pos.items()]
+
+    def compact(self):
+        """删掉的条目多了就重建一遍，倒排表里不再带着它们"""
+        with self._lock:
+            fresh = KeywordIndex()
+            alive = [(doc_id, *self.docs[idx]) for doc_id, idx in self.pos.items()]
+            if alive:
+                fresh.add(*zip(*alive))
+            for name in ("ids", "pos", "docs", "lengths", "alive", "postings", "total_len"):
+                setattr(self, name, getattr(fresh, name))
+
+    def get(self, doc_id: str):
+        idx = self.pos.get(doc_id)
+        return self.docs[idx] if idx is not None else None
+
+    def search(self, query: str, k: int) -> list:
+        """返回 [(记忆 id, BM25 分数)]，分数从高到低"""
+        with self._lock:
+            n = len(self.pos)
+            if not n:
+                return []
+            avgdl = self.total_len / n or 1.0
+            scores = {}
+            for tok in set(tokenize(query)):
+                posting = self.postings.get(tok)
+                if posting is None:
+                    continue
+                docs, tfs = posting
+                if n >= self.MIN_DOCS_FOR_DF_CUTOFF and len(docs) > n * self.MAX_DF_RATIO:
+                    continue    # 库大了以后，几乎每条都有的词对排序没用，跳过省时间 (IDF 本来也很低)
+                idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+                for idx, tf in zip(docs, tfs):
+                    if not self.alive[idx]:
+                        continue
+                    norm = tf + self.K1 * (1 - self.B + self.B * self.lengths[idx] / avgdl)
+                    scores[idx] = scores.get(idx, 0.0) + idf * tf * (self.K1 + 1) / norm
+            top = heapq.nlargest(k, scores.items(), key=lambda x: x[1])
+            return [(self.ids[idx], score) for idx, score in top]
+
+
+# 没记下情绪的老经历，按字面猜一下是不是情绪强烈的事
+_EMOTIONAL_WORDS = re.compile(r"开心|高兴|难过|伤心|哭|笑|生气|气死|吵架|害怕|感动|激动|失恋|表白|生日|第一次|喜欢|讨厌|后悔|想念")
+
+
+class RecallIndex:
+    """
+    "突然想起"用的随机抽取索引 (主动发言时从经历里挑一条)
+    - 数组存 id 和权重，删除用末位交换，增删都是 O(1)
+    - 按权重抽样用拒绝采样：随机挑一个位置、按 权重/上限 的概率接受，期望几次就中
+    - 权重偏向 情绪强烈的、更久远的、很少被想起的；刚想起过的冷却一段时间
+    """
+    COOLDOWN = 3 * 86400   # 想起过的经历这段时间内基本不再抽到
+    MAX_TRIES = 64
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.ids = []
+        self.pos = {}
+        self.base = array("d")      # 不随回忆变化的那部分权重 (情绪 + 新旧)，范围 (0, 1]
+        self.recalls = array("I")   # 被想起的次数
+        self.last = array("d")      # 上次被想起的时间
+
+    def __len__(self):
+        return len(self.ids)
+
+    @staticmethod
+    def base_weight(doc: str, meta: dict, now: float) -> float:
+        emotion = meta.get("emotion")
+        if emotion:
+            emotional = 0.0 if emotion == "neutral" else 1.0
+        else:
+            emotional = 1.0 if _EMOTIONAL_WORDS.search(doc or "") else 0.0
+        age_days = max(0.0, now - episode_time(meta)) / 86400
+        age = min(1.0, math.log1p(age_days) / math.log1p(365))
+        return 0.4 + 0.3 * emotional + 0.3 * age
+
+    def add(self, ids, docs, metas, now: float = None):
+        now = now or time.time()
+        with self._lock:
+            for doc_id, doc, meta in zip(ids, docs, metas):
+                meta = meta or {}
+                if doc_id in self.pos or not doc:
+                    continue
+                self.pos[doc_id] = len(self.ids)
+                self.ids.append(doc_id)
+                self.base.append(self.base_weight(doc, meta, now))
+                self.recalls.append(int(meta.get("recalls", 0)))
+                self.last.append(float(meta.get("last_recalled", 0.0)))
+
+    def remove(self, ids):
+        with self._lock:
+            for doc_id in ids:
+                idx = self.pos.pop(doc_id, None)
+                if idx is None:
+                    continue
+                # 末位挪到空位上
+                tail = len(self.ids) - 1
+                if idx != tail:
+                    moved = self.ids[tail]
+                    self.ids[idx] = moved
+                    self.base[idx] = self.base[tail]
+                    self.recalls[idx] = self.recalls[tail]
+                    self.last[idx] = self.last[tail]
+                    self.pos[moved] = idx
+                self.ids.pop()
+                self.base.pop()
+                self.recalls.pop()
+                self.last.pop()
+
+    def weight(self, idx: int, now: float) -> float:
+        w = self.base[idx] / (1 + self.recalls[idx])
+        if now - self.last[idx] < self.COOLDOWN:
+            w *= 0.05
+        return w
+
+    def sample(self, weighted: bool = True, now: float = None):
+        """抽一条经历的 id；weighted=False 时均匀抽"""
+        now = now or time.time()
+        with self._lock:
+            n = len(self.ids)
+            if not n:
+                return None
+            if not weighted:
+                return self.ids[random.randrange(n)]
+            best, best_w = None, -1.0
+            for _ in range(self.MAX_TRIES):
+                idx = random.randrange(n)
+                w = self.weight(idx, now)
+                if random.random() < w:
+                    return self.ids[idx]
+                if w > best_w:
+                    best, best_w = idx, w
+            # 运气太差 (几乎全都刚想起过)：取试过的里面权重最高的
+            return self.ids[best]
+
+    def mark(self, doc_id: str, now: float = None):
+        """记一次被想起，返回 (次数, 时间) 供写回元数据"""
+        now = now or time.time()
+        with self._lock:
+            idx = self.pos.get(doc_id)
+            if idx is None:
+                return None
+            self.recalls[idx] += 1
+            self.last[idx] = now
+            return self.recalls[idx], now
+
+
+class HybridRetriever:
+    """
+    混合检索：向量召回一大池 + BM25 关键词召回一大池，
+    用 RRF (倒数排名融合) 合并，再按记忆的新旧做时间衰减
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.index = KeywordIndex()
+        self.recall = RecallIndex()     # 主动发言时随机想起的经历
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+
+    async def ensure_loaded(self):
+        """第一次用到时把集合里已有的记忆灌进关键词索引和随机回忆索引"""
+        if self._loaded:
+            return
+        async with self._load_lock:
+            if not self._loaded:
+                with metrics.span("keyword_index_load"):
+                    await asyncio.to_thread(self._load)
+                self._loaded = True
+
+    def _load(self, page: int = 5000):
+        offset = 0
+        while True:
+            batch = self.collection.get(limit=page, offset=offset, include=["documents", "metadatas"])
+            if not batch["ids"]:
+                break
+            self.index.add(batch["ids"], batch["documents"], batch["metadatas"])
+            self.recall.add(batch["ids"], batch["documents"], batch["metadatas"])
+            offset += len(batch["ids"])
+        print(f"🔎 关键词索引已建立: {len(self.index)} 条记忆")
+
+    def add(self, ids, docs, metas):
+        """新记忆写进 Chroma 之后调用，保持两边同步"""
+        self.index.add(ids, docs, metas)
+        self.recall.add(ids, docs, metas)
+
+    def remove(self, ids):
+        self.index.remove(ids)
+        self.recall.remove(ids)
+
+    def compact(self, max_dead_ratio: float = 0.25):
+        if self.index.dead > len(self.index.ids) * max_dead_ratio:
+            with metrics.span("keyword_index_compact"):
+                self.index.compact()
+
+    def _vector_candidates(self, query_vec, n: int):
+        results = self.collection.query(query_embeddings=[query_vec], n_results=n)
+        if not results["ids"] or not results["ids"][0]:
+            return [], {}
+        ids = results["ids"][0]
+        docs = {i: (d, m or {}) for i, d, m in zip(ids, results["documents"][0], results["metadatas"][0])}
+        return ids, docs
+
+    async def search(self, query_text: str, query_vec=None, k: int = None):
+        """
+        返回 [{"id", "content", "date", "score"}]
+        query_vec 为空 (比如 embedding 调用失败) 时只走关键词
+        """
+        await self.ensure_loaded()
+        k = k or Config.RETRIEVAL_TOP_K
+
+        async def vector():
+            if not query_vec:
+                return [], {}
+            with metrics.span("chroma_query", "chroma"):
+                return await asyncio.to_thread(self._vector_candidates, query_vec, Config.RETRIEVAL_VECTOR_POOL)
+
+        async def keyword():
+            with metrics.span("keyword_query"):
+                return await asyncio.to_thread(self.index.search, query_text, Config.RETRIEVAL_KEYWORD_POOL)
+
+        # 两路召回并行
+        (vector_ids, docs), keyword_hits = await asyncio.gather(vector(), keyword())
+        return self.fuse([vector_ids, [doc_id for doc_id, _ in keyword_hits]], docs, k)
+
+    def fuse(self, rankings: list, docs: dict, k: int, now: float = None):
+        """RRF 融合多路排名，再乘时间衰减 (半衰期 RETRIEVAL_HALF_LIFE_DAYS)"""
+        now = now or time.time()
+        rrf = {}
+        for ranking in rankings:
+            for rank, doc_id in enumerate(ranking):
+                rrf[doc_id] = rrf.get(doc_id, 0.0) + 1.0 / (Config.RETRIEVAL_RRF_K + rank + 1)
+
+        weight = Config.RETRIEVAL_RECENCY_WEIGHT
+        ranked = []
+        for doc_id, score in rrf.items():
+            entry = docs.get(doc_id) or self.index.get(doc_id)
+            if entry is None:
+                continue
+            doc, meta = entry
+            age_days = max(0.0, now - episode_time(meta)) / 86400
+            decay = 0.5 ** (age_days / Config.RETRIEVAL_HALF_LIFE_DAYS)
+            ranked.append({
+                "id": doc_id,
+                "content": doc,
+                "date": meta.get("date", "久远的回忆"),
+                "score": score * (1 - weight + weight * decay),
+            })
+        ranked.sort(key=lambda x: x["score"], reverse=True)
+        return ranked[:k]
@@ -0,0 +1,202 @@
+"""
+主脑路由：同时挂多个 OpenAI 兼容的后端，按实时延迟和出错率 (EWMA) 挑最快的健康后端
+- 带图的轮次只发给多模态后端
+- 主动发言优先用便宜 / 快的后端
+- 一个后端失败当场换下一个，用户看不到兜底台词；流式输出到一半断了，让下一个后端接着写
+"""
+import json
+import os
+import time
+from openai import AsyncOpenAI
+from config import Config
+from metrics import metrics
+import transport
+
+# 流式中途换后端时，让新后端从断开的地方接着输出
+CONTINUE_PROMPT = "(系统：上一条回复在这里被截断了。请从截断处直接接着输出剩下的 JSON 内容，不要重复已经输出的部分，不要加任何前缀或解释。)"
+
+
+class LLMBackend:
+    def __init__(self, name: str, client: AsyncOpenAI, model: str, vision: bool = False, cheap: bool = False):
+        self.name = name
+        self.client = client
+        self.model = model
+        self.vision = vision          # 能看图
+        self.cheap = cheap            # 便宜 / 快，主动发言优先用
+        self.latency_ms = None        # 整次请求耗时 (EWMA)
+        self.ttft_ms = None           # 流式首字耗时 (EWMA)
+        self.error_rate = 0.0         # 出错率 (EWMA)
+
+    @staticmethod
+    def _ewma(old, value):
+        alpha = Config.LLM_ROUTER_EWMA_ALPHA
+        return value if old is None else old + alpha * (value - old)
+
+    def observe(self, ok: bool = None, ms: float = None, ttft: float = None):
+        if ok is not None:
+            self.error_rate = self._ewma(self.error_rate, 0.0 if ok else 1.0)
+        if ms is not None:
+            self.latency_ms = self._ewma(self.latency_ms, ms)
+        if ttft is not None:
+            self.ttft_ms = self._ewma(self.ttft_ms, ttft)
+
+    def score(self, streaming: bool, rank: int) -> float:
+        """越小越好；还没测过的按先验值，配置靠前的略占优"""
+        ms = self.ttft_ms if streaming else self.latency_ms
+        if ms is None:
+            ms = Config.LLM_ROUTER_PRIOR_MS + rank * 100
+        return ms * (1 + Config.LLM_ROUTER_ERROR_PENALTY * self.error_rate)
+
+    def stats(self):
+        return {
+            "latency_ms": round(self.latency_ms or 0, 1),
+            "ttft_ms": round(self.ttft_ms or 0, 1),
+            "error_rate": round(self.error_rate, 3),
+            "circuit_open": int(transport.breaker(self.name).is_open),
+        }
+
+
+def load_backends() -> list:
+    """
+    LLM_BACKENDS 为 JSON 列表，每项 {"name", "base_url", "model", "api_key" 或 "api_key_env", "vision", "cheap"}
+    没配置时沿用原来的两个客户端：LLM_* (主脑，能看图) + PROFILE_LLM_* (DeepSeek，便宜)
+    """
+    if Config.LLM_BACKENDS:
+        specs = json.loads(Config.LLM_BACKENDS)
+    else:
+        specs = [{"name": "main", "base_url": Config.LLM_BASE_URL, "api_key": Config.LLM_API_KEY,
+                  "model": Config.LLM_MODEL, "vision": True}]
+        if Config.PROFILE_KEY and Config.PROFILE_BASE:
+            specs.append({"name": "intent", "base_url": Config.PROFILE_BASE, "api_key": Config.PROFILE_KEY,
+                          "model": Config.PROFILE_MODEL, "cheap": True})
+
+    backends = []
+    for spec in specs:
+        api_key = spec.get("api_key") or os.getenv(spec.get("api_key_env", ""), "")
+        client = AsyncOpenAI(api_key=api_key, base_url=spec.get("base_url"),
+                             http_client=transport.http_client, max_retries=0)
+        backends.append(LLMBackend(spec["name"], client, spec["model"],
+                                   bool(spec.get("vision")), bool(spec.get("cheap"))))
+    return backends
+
+
+class LLMRouter:
+    def __init__(self, backends: list):
+        self.backends = backends
+
+    def candidates(self, vision: bool = False, kind: str = "user", streaming: bool = False) -> list:
+        """按优先级排好的候选后端；熔断中的排最后 (到它时可能正好放试探请求)"""
+        pool = [(rank, b) for rank, b in enumerate(self.backends) if b.vision or not vision]
+        pool.sort(key=lambda x: (transport.breaker(x[1].name).is_open, x[1].score(streaming, x[0])))
+        if kind == "proactive":
+            pool.sort(key=lambda x: (transport.breaker(x[1].name).is_open, not x[1].cheap))
+        return [b for _, b in pool]
+
+    @staticmethod
+    def _budget(deadline: float, left: int) -> float:
+        """后面还有备选时，一个后端最多用掉剩余时间的一部分"""
+        remaining = max(0.1, deadline - time.monotonic())
+        return remaining if left <= 1 else remaining * Config.LLM_FAILOVER_SHARE
+
+    async def chat(self, messages: list, vision: bool = False, kind: str = "user",
+                   timeout: float = None, on_usage=None, **params) -> dict:
+        """
+        一次性 JSON 回复；失败 (包括返回的不是合法 JSON) 就换下一个后端，全失败才抛出
+        耗时按实际服务的后端记 (stage=llm, provider=后端名)
+        """
+        candidates = self.candidates(vision, kind)
+        if not candidates:
+            raise RuntimeError("没有可用的主脑后端 (需要看图时要配置 vision 后端)")
+        deadline = time.monotonic() + (timeout or Config.TIMEOUT_LLM)
+        errors = []
+        for i, backend in enumerate(candidates):
+            started = time.perf_counter()
+            try:
+                response = await transport.call("llm", lambda: backend.client.chat.completions.create(
+                    model=backend.model, messages=messages, **params
+                ), timeout=self._budget(deadline, len(candidates) - i), provider=backend.name)
+                result = json.loads(response.choices[0].message.content)
+            except Exception as e:
+                metrics.observe("llm", backend.name, (time.perf_counter() - started) * 1000, error=True)
+                backend.observe(ok=False)
+                errors.append(f"{backend.name}: {e}")
+                metrics.incr(f"llm_failover_{backend.name}")
+                print(f"⚠️ 主脑后端 {backend.name} 失败，换下一个: {e}")
+                continue
+            ms = (time.perf_counter() - started) * 1000
+            metrics.observe("llm", backend.name, ms)
+            backend.observe(ok=True, ms=ms)
+            metrics.incr(f"llm_routed_{backend.name}")
+            if on_usage:
+                on_usage(response.usage)
+            return result
+        raise RuntimeError("所有主脑后端都失败了: " + "; ".join(errors))
+
+    async def stream(self, messages: list, vision: bool = False, kind: str = "user",
+                     timeout: float = None, on_usage=None, **params):
+        """
+        逐段 yield 文本；后端出错就换下一个，已经输出过内容的让下一个接着写
+        耗时按实际服务的后端记 (stage=llm_stream)；建连之后断掉的也计入该后端的熔断
+        """
+        candidates = self.candidates(vision, kind, streaming=True)
+        if not candidates:
+            raise RuntimeError("没有可用的主脑后端 (需要看图时要配置 vision 后端)")
+        deadline = time.monotonic() + (timeout or Config.TIMEOUT_LLM)
+        emitted, errors = "", []
+        for i, backend in enumerate(candidates):
+            request, extra = messages, dict(params)
+            if emitted:
+                request = messages + [
+                    {"role": "assistant", "content": emitted},
+                    {"role": "user", "content": CONTINUE_PROMPT},
+                ]
+                extra.pop("response_format", None)   # 接着写的只是 JSON 的后半段
+                metrics.incr("llm_midstream_failover")
+            started = time.perf_counter()
+            first = True
+            stream = None
+            try:
+                stream = await transport.call("llm_stream", lambda: backend.client.chat.completions.create(
+                    model=backend.model, messages=request, stream=True,
+                    stream_options={"include_usage": True}, timeout=Config.TIMEOUT_LLM, **extra
+                ), timeout=self._budget(deadline, len(candidates) - i), provider=backend.name)
+                async for chunk in stream:
+                    # 最后一个 chunk 只带 usage，没有 choices
+                    if getattr(chunk, "usage", None) and on_usage:
+                        on_usage(chunk.usage)
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        if first:
+                            ttft = (time.perf_counter() - started) * 1000
+                            metrics.observe("llm_stream_first", backend.name, ttft)
+                            backend.observe(ttft=ttft)
+                            first = False
+                        emitted += delta
+                        yield delta
+            except Exception as e:
+                metrics.observe("llm_stream", backend.name, (time.perf_counter() - started) * 1000, error=True)
+                if stream is not None and transport.is_retryable(e):
+                    # 建连那一步由 transport.call 记过了，读流中途断开要自己记
+                    transport.breaker(backend.name).record(False)
+                backend.observe(ok=False)
+                errors.append(f"{backend.name}: {e}")
+                metrics.incr(f"llm_failover_{backend.name}")
+                print(f"⚠️ 主脑后端 {backend.name} 流式失败 (已输出 {len(emitted)} 字)，换下一个: {e}")
+                continue
+            finally:
+                if stream is not None:
+                    await stream.close()
+            ms = (time.perf_counter() - started) * 1000
+            metrics.observe("llm_stream", backend.name, ms)
+            backend.observe(ok=True, ms=ms)
+            metrics.incr(f"llm_routed_{backend.name}")
+            return
+        raise RuntimeError("所有主脑后端都失败了: " + "; ".join(errors))
+
+    def stats(self):
+        return {b.name: b.stats() for b in self.backends}
+
+
+llm_router = LLMRouter(load_backends())
@@ -0,0 +1,47 @@
+import asyncio
+import time
+from metrics import metrics
+
+
+class DeadlineScheduler:
+    """
+    全进程共用的到期调度器 (主动发言用)
+    - 每个会话只登记一个"下次该说话"的时间点
+    - 有新活动就重新登记，旧的自动作废
+    - 到期只触发一次；底层用事件循环自带的定时器堆，没有到期任务时不会醒
+    """
+
+    def __init__(self):
+        self._handles = {}   # key -> (deadline, TimerHandle)
+
+    def schedule(self, key: str, deadline: float, callback):
+        """登记 / 改期。deadline 是 time.time() 时间戳，callback 为同步函数"""
+        old = self._handles.get(key)
+        if old:
+            if old[0] == deadline:
+                return
+            old[1].cancel()
+            metrics.incr("scheduler_rescheduled")
+        loop = asyncio.get_running_loop()
+        delay = max(0.0, deadline - time.time())
+        handle = loop.call_later(delay, self._fire, key, callback)
+        self._handles[key] = (deadline, handle)
+
+    def cancel(self, key: str):
+        old = self._handles.pop(key, None)
+        if old:
+            old[1].cancel()
+
+    def _fire(self, key: str, callback):
+        self._handles.pop(key, None)
+        metrics.incr("scheduler_fired")
+        try:
+            callback()
+        except Exception as e:
+            print(f"❌ 调度回调出错 ({key}): {e}")
+
+    def __len__(self):
+        return len(self._handles)
+
+
+scheduler = DeadlineScheduler()
@@ -1,33 +1,53 @@
+import asyncio
 import base64
-import io
 from openai import AsyncOpenAI
 from config import Config
+from cache import get_tts_cache, get_embedding_cache
+from metrics import traced, metrics
+import transport
+from router import llm_router
+from intent import classifier as intent_classifier
 import json
 
-#  主脑客户端 (Gemini)
+#  主脑客户端 (Gemini)：生成摘要用；对话轮次走 router.llm_router (可配多个后端)
+# 客户端共用 transport 里的连接池；重试由 transport.call 统一做，SDK 自带的关掉
 client_main = AsyncOpenAI(
     api_key=Config.LLM_API_KEY,
-    base_url=Config.LLM_BASE_URL
-)
-
-# 意图客户端 (DeepSeek) (暂时废弃)
-client_intent = AsyncOpenAI(
-    api_key=Config.PROFILE_KEY,
-    base_url=Config.PROFILE_BASE
+    base_url=Config.LLM_BASE_URL,
+    http_client=transport.http_client,
+    max_retries=0
 )
 
 # 语音客户端 (SiliconFlow)
 client_audio = AsyncOpenAI(
     api_key=Config.SILICON_KEY,
-    base_url=Config.SILICON_BASE
+    base_url=Config.SILICON_BASE,
+    http_client=transport.http_client,
+    max_retries=0
 )
 
+def record_prompt_usage(usage):
+    """记录服务端返回的 prompt 缓存命中 token 数 (不同服务商字段名不一样)"""
+    if not usage:
+        return
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) if details else None
+    if cached is None:
+        cached = getattr(usage, "prompt_cache_hit_tokens", 0) or 0   # DeepSeek
+    metrics.incr("llm_prompt_tokens", prompt_tokens)
+    metrics.incr("llm_cached_tokens", cached)
+    print(f"💾 Prompt 缓存命中 {cached}/{prompt_tokens} tokens")
+
 class AIService:
     @staticmethod
-    async def chat_with_neuro_brain(messages: list,image_base64: str = None, timeout=30.0):
+    async def chat_with_neuro_brain(messages: list,image_base64: str = None, timeout: float = None,
+                                    fallback: bool = True, kind: str = "user"):
         """
         ✅ 核心方法：主脑接口
         一次性完成 [思考 -> 回复 -> 记忆操作]
+        由路由挑后端 (带图只走能看图的，kind="proactive" 优先便宜的)，一个失败自动换下一个
+        fallback=False 时出错直接抛出 (推测执行不能把兜底台词当成结果)
         """
         try:
             # 强制要求 JSON 模式
@@ -48,19 +68,20 @@ class AIService:
                 ]
                 # 替换原来的纯文本消息
                 messages[-1]["content"] = new_content
-            response = await client_main.chat.completions.create(
-                model=Config.LLM_MODEL,
-                messages=messages,
+            return await llm_router.chat(
+                messages,
+                vision=bool(image_base64),
+                kind=kind,
+                timeout=timeout,
+                on_usage=record_prompt_usage,
                 temperature=0.7, 
                 max_tokens=4096,
-                timeout=timeout,
                 response_format={"type": "json_object"} 
             )
-            content = response.choices[0].message.content
-           
-            return json.loads(content)
         except Exception as e:
             print(f"❌ 主脑思考失败: {e}")
+            if not fallback:
+                raise
             # 兜底返回，防止 main.py 崩溃
             return {
                 "reply": "（大脑短路中...）",
@@ -70,83 +91,200 @@ class AIService:
             }
 
     @staticmethod
-    async def analyze_intent(text: str):
-        """
-        使用 DeepSeek 快速分析用户意图 (勿扰/普通对话)
+    async def stream_neuro_brain(messages: list, image_base64: str = None, timeout: float = None, kind: str = "user"):
         """
-        system_prompt = """
-        你是一个意图分析器。分析用户的输入，返回 JSON 格式：
-        {"action": "silence"} - 如果用户表示忙、别吵、安静。
-        {"action": "chat"} - 普通聊天。
+        主脑接口 (流式版)
+        逐段 yield 模型输出的 JSON 文本，由调用方增量解析 reply
         """
+        yielded = False
         try:
-            response = await client_intent.chat.completions.create(
-                model="deepseek-chat",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": text}
-                ],
-                response_format={"type": "json_object"} # 强制 JSON
-            )
-            return response.choices[0].message.content
-        except:
-            return '{"action": "chat"}'
+            if image_base64:
+                content_text = messages[-1]["content"]
+                messages[-1]["content"] = [
+                    {"type": "text", "text": content_text},
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:image/jpeg;base64,{image_base64}"
+                        }
+                    }
+                ]
+            # 后端中途断了由路由换下一个接着写，这里只有全部失败才会进 except
+            async for delta in llm_router.stream(
+                messages,
+                vision=bool(image_base64),
+                kind=kind,
+                timeout=timeout,
+                on_usage=record_prompt_usage,
+                temperature=0.7,
+                max_tokens=4096,
+                response_format={"type": "json_object"}
+            ):
+                yielded = True
+                yield delta
+        except Exception as e:
+            print(f"❌ 主脑流式思考失败: {e}")
+            # 还没输出任何内容时，走和非流式一样的兜底回复
+            if not yielded:
+                yield json.dumps({
+                    "reply": "（大脑短路中...）",
+                    "emotion": "dizzy",
+                    "memory_operation": {},
+                    "thought": f"API调用出错: {str(e)}"
+                }, ensure_ascii=False)
 
     @staticmethod
+    @traced("summarize", lambda: Config.SUMMARY_MODEL)
+    async def summarize_dialogue(previous_summary: str, messages: list):
+        """把旧的对话折叠进滚动摘要 (后台调用，不在回复的关键路径上)"""
+        dialogue = "\n".join(f"{m['role']}: {m['content']}" for m in messages if isinstance(m.get("content"), str))
+        response = await transport.call("summary", lambda: client_main.chat.completions.create(
+            model=Config.SUMMARY_MODEL,
+            messages=[
+                {"role": "system", "content": "你负责压缩桌宠和用户的聊天记录。把【已有摘要】和【新对话】合并成一段不超过200字的中文摘要，保留用户提到的事情、情绪和未完成的话题，不要编造。只输出摘要本身。"},
+                {"role": "user", "content": f"【已有摘要】\n{previous_summary or '无'}\n\n【新对话】\n{dialogue}"}
+            ],
+            temperature=0.3,
+            max_tokens=400
+        ))
+        return (response.choices[0].message.content or previous_summary).strip()
+
+    @staticmethod
+    @traced("consolidate", lambda: Config.SUMMARY_MODEL)
+    async def summarize_episodes(period: str, episodes: list):
+        """把同一段时间里的零碎经历合并成一条 (后台整理用，失败直接抛出，原始经历保持不动)"""
+        lines = "\n".join(f"- ({date}) {text}" for date, text in episodes)
+        response = await transport.call("summary", lambda: client_main.chat.completions.create(
+            model=Config.SUMMARY_MODEL,
+            messages=[
+                {"role": "system", "content": "你负责整理桌宠对用户的长期记忆。把同一段时间里的零碎经历合并成一段不超过150字的中文回忆，保留人名、地点、具体事件和用户的情绪，去掉重复的内容，不要编造。只输出回忆本身。"},
+                {"role": "user", "content": f"【时间段】{period}\n【经历】\n{lines}"}
+            ],
+            temperature=0.3,
+            max_tokens=300
+        ))
+        summary = (response.choices[0].message.content or "").strip()
+        if not summary:
+            raise ValueError("摘要为空")
+        return summary
+
+    @staticmethod
+    @traced("intent", "local")
+    def analyze_intent(text: str):
+        """
+        本地意图识别 (见 intent.py)，毫秒级，不联网
+        返回 {"action", "confidence", "vision", "retrieval", "llm"}
+        """
+        return intent_classifier.classify(text)
+
+    @staticmethod
+    @traced("tts", lambda: Config.TTS_MODEL)
     async def text_to_speech(text: str, emotion: str = "happy"):
         """
         调用 SiliconFlow CosyVoice2 生成语音
+        返回 mp3 原始字节，编码方式 (二进制帧 / Base64) 由发送端决定
         """
        
         prompt_text = f"<{emotion}>{text}" 
         
         try:
-            response = await client_audio.audio.speech.create(
-                model=Config.TTS_MODEL,
-                voice=Config.TTS_VOICE,
-                input=prompt_text,
-                response_format="mp3" 
-            )
-            
-            # 获取二进制数据
-            audio_bytes = response.content
-            # 转 Base64 发给前端
-            return base64.b64encode(audio_bytes).decode('utf-8')
+            # 先查缓存，重复的台词不再花钱合成
+            tts_cache = get_tts_cache()
+            cache_key = tts_cache.make_key(text, emotion)
+            audio_bytes = await asyncio.to_thread(tts_cache.get, cache_key)
+            if audio_bytes is None:
+                with metrics.span("tts_remote", Config.TTS_MODEL):
+                    response = await transport.call("tts", lambda: client_audio.audio.speech.create(
+                        model=Config.TTS_MODEL,
+                        voice=Config.TTS_VOICE,
+                        input=prompt_text,
+                        response_format="mp3" 
+                    ))
+                
+                # 获取二进制数据
+                audio_bytes = response.content
+                await asyncio.to_thread(tts_cache.put, cache_key, audio_bytes)
+            return audio_bytes
         except Exception as e:
             print(f"❌ TTS 失败: {e}")
             return None
 
     @staticmethod
-    async def speech_to_text(audio_base64: str):
+    async def warmup_tts(phrases: list):
+        """提前合成常用台词 (兜底回复等)，让它们之后直接命中缓存"""
+        for text, emotion in phrases:
+            await AIService.text_to_speech(text, emotion)
+        print(f"🔊 TTS 缓存预热完成: {get_tts_cache().get_stats()}")
+
+    @staticmethod
+    @traced("stt", lambda: Config.STT_MODEL)
+    async def speech_to_text(audio, filename: str = "input.webm"):
         
      #   调用 SenseVoice 识别 WebM/WAV 音频
+     #   audio 可以是二进制帧带来的 bytes/memoryview，也可以是旧协议的 Base64 字符串
         
         try:
-            #  解码 Base64 -> Bytes
-            audio_bytes = base64.b64decode(audio_base64)
-            
-            # 包装成类似文件的对象 (name 属性很重要，要是 .webm)
-            audio_file = io.BytesIO(audio_bytes)
-            audio_file.name = "input.webm" 
-
-            #  发送请求
-            transcript = await client_audio.audio.transcriptions.create(
+            if isinstance(audio, str):
+                #  解码 Base64 -> Bytes
+                audio = base64.b64decode(audio)
+            elif isinstance(audio, memoryview):
+                audio = audio.tobytes()
+
+            #  发送请求 (文件名很重要，后缀要和格式对上，比如 .webm / .wav)
+            transcript = await transport.call("stt", lambda: client_audio.audio.transcriptions.create(
                 model=Config.STT_MODEL,
-                file=audio_file
-            )
+                file=(filename, audio)
+            ))
             return transcript.text
         except Exception as e:
             print(f"❌ STT 失败: {e}")
             return ""
     @staticmethod
+    @traced("embedding_remote", lambda: Config.EMBEDDING_MODEL)
+    async def embed_remote(texts: list):
+        """
+        远程向量化一批文本，不查缓存，出错直接抛出
+        缓存 / 分批 / 本地模型切换见 embeddings.py
+        """
+        response = await transport.call("embedding", lambda: client_audio.embeddings.create(
+            model=Config.EMBEDDING_MODEL,
+            input=texts
+        ))
+        return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+
+    @staticmethod
+    async def get_embeddings(texts: list):
+        """
+        批量向量化，返回与 texts 一一对应的向量列表 (失败的位置为 None)
+        交给当前的向量化后端 (带缓存 / 分批，远程或本地见 embeddings.py)
+        """
+        from embeddings import embed_texts   # embeddings.py 反过来依赖 AIService，这里延迟导入
+        return await embed_texts(texts)
+
+    @staticmethod
     async def get_embedding(text: str):
         #向量化
-        try:
-            # 只有确实需要存经历时才调这个
-            if not text: return None
-            response = await client_audio.embeddings.create(
-                model="Qwen/Qwen3-Embedding-8B",
-                input=text
-            )
-            return response.data[0].embedding
-        except: return None
\ No newline at end of file
+        from embeddings import embed_text
+        return await embed_text(text)
+
+    @staticmethod
+    async def warmup_connections():
+        """启动时先把到各服务商的连接建好"""
+        await transport.warmup([Config.LLM_BASE_URL, Config.PROFILE_BASE, Config.SILICON_BASE])
+
+    @staticmethod
+    async def close():
+        await transport.aclose()
+
+    @staticmethod
+    def get_llm_stats():
+        """主脑各后端的实时延迟 / 出错率"""
+        return llm_router.stats()
+
+    @staticmethod
+    def get_cache_stats():
+        """TTS / 向量缓存的命中统计"""
+        return {
+            "tts": get_tts_cache().get_stats(),
+            "embedding": get_embedding_cache().get_stats(),
+        }
\ No newline at end of file
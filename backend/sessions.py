@@ -0,0 +1,142 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+
+
+_SAFE_ID = re.compile(r"[A-Za-z0-9](?:[A-Za-z0-9_-]{0,46}[A-Za-z0-9])?")
+
+
+def sanitize_session_id(raw: str) -> str:
+    """
+    客户端传来的 id 转成能当文件名和集合名的 key
+    - 本身就安全的原样用 (老会话的文件和集合不用迁移)
+    - 其余 (中文、带符号的) 用 可读前缀.原始 id 的哈希，不同的 id 不会撞到一起
+    """
+    if not raw:
+        return "default"
+    if _SAFE_ID.fullmatch(raw):
+        return raw
+    digest = hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+    prefix = re.sub(r"[^A-Za-z0-9]", "", raw)[:24] or "u"
+    # "." 不会出现在原样使用的 id 里，带哈希的 key 和它们也撞不上
+    return f"{prefix}.{digest}"
+
+
+class Session:
+    """
+    一个用户 (client id) 对应一个会话
+    - brain: 独立的 NeuroBrain (状态机/历史/无聊计时/记忆命名空间)
+    - senders: 这个用户当前打开的所有连接的发送函数
+    """
+
+    def __init__(self, session_id: str, brain):
+        self.session_id = session_id
+        self.brain = brain
+        self.senders = set()
+        self.turn_task = None        # 正在进行的一轮 (用户输入 / 主动发言)，可被打断
+        self.turn_id = None
+        self.turn_kind = None
+        self.last_seen = time.time()
+
+    async def broadcast(self, type_str, payload, audio: bytes = None):
+        """同一用户开了多个窗口时，所有窗口都收到"""
+        for send in list(self.senders):
+            await send(type_str, dict(payload), audio=audio)
+
+
+class SessionManager:
+    """
+    会话表：按 client id 取会话，闲置的会话存盘后从内存里踢掉
+    """
+    SAVE_TIMEOUT = 10   # 存盘前最多等这么久 (被打断的轮次收尾 / 后台摘要)
+
+    def __init__(self, brain_factory, state_dir: str, idle_timeout: float):
+        self.brain_factory = brain_factory
+        self.state_dir = state_dir
+        self.idle_timeout = idle_timeout
+        self.sessions = {}
+        self._lock = asyncio.Lock()
+        os.makedirs(self.state_dir, exist_ok=True)
+
+    def _state_path(self, session_id: str) -> str:
+        return os.path.join(self.state_dir, f"{session_id}.json")
+
+    def _load_state(self, session_id: str):
+        path = self._state_path(session_id)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"⚠️ 会话状态读取失败 {session_id}: {e}")
+            return None
+
+    def _save_state(self, session_id: str, state: dict):
+        path = self._state_path(session_id)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _create(self, session_id: str):
+        # 建 brain 会打开 Chroma 集合、读事实文件，放线程池里做
+        brain = self.brain_factory(session_id)
+        state = self._load_state(session_id)
+        if state:
+            brain.load_state(state)
+            print(f"♻️ 会话 {session_id} 从磁盘恢复")
+        return Session(session_id, brain)
+
+    async def attach(self, raw_id: str, send) -> Session:
+        session_id = sanitize_session_id(raw_id)
+        async with self._lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                session = await asyncio.to_thread(self._create, session_id)
+                self.sessions[session_id] = session
+        session.senders.add(send)
+        session.last_seen = time.time()
+        return session
+
+    def detach(self, session: Session, send):
+        session.senders.discard(send)
+        session.last_seen = time.time()
+
+    async def evict_idle(self):
+        """没有连接且闲置超时的会话：状态存盘，释放内存"""
+        now = time.time()
+        async with self._lock:
+            idle = [
+                s for s in self.sessions.values()
+                if not s.senders and now - s.last_seen > self.idle_timeout
+            ]
+            for session in idle:
+                await self._evict(session)
+
+    async def _evict(self, session: Session):
+        # 先让正在进行的一轮和后台摘要收尾，再存盘 (否则刚移出历史的消息可能两边都没有)
+        if session.turn_task and not session.turn_task.done():
+            session.turn_task.cancel()
+            await asyncio.wait([session.turn_task], timeout=self.SAVE_TIMEOUT)
+        await session.brain.context.wait_summary(self.SAVE_TIMEOUT)
+        try:
+            await asyncio.to_thread(self._save_state, session.session_id, session.brain.to_state())
+        except Exception as e:
+            print(f"⚠️ 会话状态保存失败 {session.session_id}: {e}")
+        await session.brain.close()
+        self.sessions.pop(session.session_id, None)
+        print(f"💤 会话 {session.session_id} 闲置，已存盘释放")
+
+    async def run_sweeper(self, interval: float = 60):
+        while True:
+            await asyncio.sleep(interval)
+            await self.evict_idle()
+
+    async def save_all(self):
+        async with self._lock:
+            for session in list(self.sessions.values()):
+                await self._evict(session)
@@ -0,0 +1,143 @@
+import asyncio
+import difflib
+import os
+import re
+import time
+from config import Config
+from metrics import metrics
+
+
+def normalize_transcript(text: str) -> str:
+    """比较识别结果用：去掉标点和空白，统一大小写"""
+    return re.sub(r"[\W_]+", "", text or "").casefold()
+
+
+def similarity(a: str, b: str) -> float:
+    a, b = normalize_transcript(a), normalize_transcript(b)
+    if not a or not b:
+        return 0.0
+    return difflib.SequenceMatcher(None, a, b).ratio()
+
+
+class Speculation:
+    """
+    用户还在说话时，拿中间识别结果的稳定前缀提前准备这一轮
+    - 分两段：prepare(text) 拼提示词 / 检索记忆；respond(text, prepared) 提前调主脑 (可选)
+    - 前缀变化太大就取消重来；最终结果和猜测差太多就作废
+    - 最终结果和猜测接近但不是逐字相同：只用第一段，主脑那段直接取消 (回复反正要重新生成)
+    """
+
+    def __init__(self, prepare, respond=None):
+        self.prepare = prepare
+        self.respond = respond
+        self.text = None          # 正在推测的文本
+        self.task = None
+        self.started = None
+        self.finished_at = None
+        self._last_partial = ""
+
+    def on_partial(self, partial: str):
+        """收到一条中间结果；两次结果的公共前缀视为稳定"""
+        stable = os.path.commonprefix([self._last_partial, partial])
+        self._last_partial = partial
+        if len(normalize_transcript(stable)) < Config.SPECULATIVE_MIN_CHARS:
+            return
+        # 两次结果完全一样 = 用户多半已经停了，值得按整句重新推测 (最终结果逐字命中才能复用主脑回复)
+        settled = stable == partial and normalize_transcript(stable) != normalize_transcript(self.text)
+        if self.task is not None and not settled \
+                and similarity(stable, self.text) >= Config.SPECULATIVE_MATCH_RATIO:
+            return
+        if self.task is not None:
+            metrics.incr("speculation_restarted")
+            self._drop(self.task)
+        self._start(stable)
+
+    def _start(self, text: str):
+        self.text = text
+        self.started = time.perf_counter()
+        self.finished_at = None
+        self.task = asyncio.create_task(self._stages(text))
+        self.task.add_done_callback(self._on_done)
+        metrics.incr("speculation_started")
+
+    async def _stages(self, text: str):
+        """第一段做完就返回；第二段 (主脑) 另开 task 接着跑，take 时再决定等它还是取消"""
+        prepared = await self.prepare(text)
+        reply = asyncio.create_task(self.respond(text, prepared)) if self.respond else None
+        return prepared, reply
+
+    @staticmethod
+    def _drop(task):
+        """取消一次推测，连同已经开始的主脑那段"""
+        task.cancel()
+        if task.done() and not task.cancelled() and task.exception() is None:
+            reply = task.result()[1]
+            if reply:
+                reply.cancel()
+
+    def _on_done(self, task):
+        if task is self.task:
+            self.finished_at = time.perf_counter()
+
+    async def take(self, final_text: str):
+        """
+        拿到最终识别结果时调用
+        和推测文本足够接近就返回准备好的结果 (附带 exact: 是否逐字相同；result: 逐字相同时的主脑回复)
+        否则取消并返回 None
+        """
+        task, self.task = self.task, None
+        if task is None:
+            return None
+        if similarity(final_text, self.text) < Config.SPECULATIVE_MATCH_RATIO:
+            self._drop(task)
+            metrics.incr("speculation_miss")
+            print(f"🎲 推测作废: 「{self.text}」 vs 「{final_text}」")
+            return None
+        asked = time.perf_counter()
+        # self.task 已经清空，之后完成的话 _on_done 不会记时间，这里自己记
+        finished_at = self.finished_at if task.done() else None
+        try:
+            # 用 wait 而不是直接 await：推测任务被取消不会连带打断这一轮
+            await asyncio.wait([task])
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        if finished_at is None:
+            finished_at = time.perf_counter()
+        if task.cancelled() or task.exception() is not None:
+            print(f"⚠️ 推测任务没有结果: {'已取消' if task.cancelled() else task.exception()}")
+            metrics.incr("speculation_miss")
+            return None
+        prepared, reply = task.result()
+        # 领先多少：推测比最终结果早跑完的时间 (负数表示最终结果出来后还等了这么久)
+        lead_ms = (asked - finished_at) * 1000
+        metrics.observe("speculation_lead", None, lead_ms)
+        metrics.incr("speculation_hit")
+        exact = normalize_transcript(final_text) == normalize_transcript(self.text)
+        result = None
+        if exact:
+            metrics.incr("speculation_exact")
+            result = await self._await_reply(reply)
+        elif reply:
+            reply.cancel()   # 不是逐字相同，主脑回复用不上，不必等它
+        return {**prepared, "result": result, "exact": exact}
+
+    @staticmethod
+    async def _await_reply(reply):
+        if reply is None:
+            return None
+        try:
+            await asyncio.wait([reply])
+        except asyncio.CancelledError:
+            reply.cancel()
+            raise
+        if reply.cancelled() or reply.exception() is not None:
+            print(f"⚠️ 推测的主脑回复没有结果: {'已取消' if reply.cancelled() else reply.exception()}")
+            return None
+        return reply.result()
+
+    def cancel(self):
+        if self.task is not None:
+            self._drop(self.task)
+            metrics.incr("speculation_cancelled")
+            self.task = None
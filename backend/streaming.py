@@ -0,0 +1,143 @@
+import json
+
+
+class JsonFieldStreamer:
+    """
+    增量解析主脑流式返回的 JSON
+    只关心顶层的字符串字段 (reply / emotion)，边收边吐出增量文本
+    """
+
+    def __init__(self, fields=("reply",)):
+        self.fields = set(fields)
+        self.buffer = ""          # 完整原文，流结束后整体 json.loads
+        self.values = {}          # 已解析完成的顶层字符串字段
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._unicode = None      # \uXXXX 收集中
+        self._high = None         # 等下一个 \uDCxx 配对的高位代理 (emoji 等 BMP 以外的字符)
+        self._is_key = False
+        self._expect_key = False
+        self._key = None
+        self._str = []            # 当前字符串内容
+
+    def feed(self, chunk: str):
+        """喂入一段增量文本，返回 [(字段名, 新增文本), ...]"""
+        self.buffer += chunk
+        out = []
+        for ch in chunk:
+            if self._in_string:
+                piece = self._consume_string_char(ch)
+                if piece and not self._is_key and self._depth == 1 and self._key in self.fields:
+                    out.append((self._key, piece))
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._is_key = self._depth == 1 and self._expect_key
+                self._str = []
+            elif ch in "{[":
+                self._depth += 1
+                self._expect_key = ch == "{" and self._depth == 1
+            elif ch in "}]":
+                self._depth -= 1
+            elif ch == "," and self._depth == 1:
+                self._expect_key = True
+            elif ch == ":" and self._depth == 1:
+                self._expect_key = False
+        return out
+
+    def _consume_string_char(self, ch: str):
+        if self._unicode is not None:
+            self._unicode += ch
+            if len(self._unicode) < 4:
+                return ""
+            try:
+                code = int(self._unicode, 16)
+            except ValueError:
+                code = None
+            self._unicode = None
+            if code is not None and 0xDC00 <= code <= 0xDFFF and self._high is not None:
+                # 代理对合成一个字符 (json.dumps 默认把 emoji 转义成两个 \u)
+                piece = chr(0x10000 + ((self._high - 0xD800) << 10) + (code - 0xDC00))
+                self._high = None
+                return self._append(piece)
+            lone = self._take_high()
+            if code is not None and 0xD800 <= code <= 0xDBFF:
+                self._high = code
+                return self._append(lone)
+            if code is None:
+                piece = ""
+            elif 0xDC00 <= code <= 0xDFFF:
+                piece = "\ufffd"   # 落单的低位代理，编码不了，换成替换字符
+            else:
+                piece = chr(code)
+            return self._append(lone + piece)
+
+        if self._escape:
+            self._escape = False
+            if ch == "u":
+                self._unicode = ""
+                return ""
+            piece = {"n": "\n", "t": "\t", "r": "", "b": "", "f": ""}.get(ch, ch)
+            return self._append(self._take_high() + piece)
+
+        if ch == "\\":
+            self._escape = True
+            return ""
+
+        if ch == '"':
+            lone = self._append(self._take_high())
+            self._in_string = False
+            text = "".join(self._str)
+            if self._is_key:
+                self._key = text
+            elif self._depth == 1 and self._key:
+                self.values[self._key] = text
+            return lone
+
+        return self._append(self._take_high() + ch)
+
+    def _take_high(self) -> str:
+        """没等到低位代理的高位代理：换成替换字符"""
+        if self._high is None:
+            return ""
+        self._high = None
+        return "\ufffd"
+
+    def _append(self, piece: str) -> str:
+        if piece:
+            self._str.append(piece)
+        return piece
+
+    def result(self):
+        """流结束后解析完整 JSON，失败时用已抽取的字段兜底"""
+        try:
+            return json.loads(self.buffer)
+        except Exception:
+            print("⚠️ 流式 JSON 不完整，使用已解析字段")
+            return dict(self.values)
+
+
+class SentenceSplitter:
+    """把流式的回复文本切成一句一句，送去 TTS"""
+
+    ENDINGS = "。！？!?；;～~…\n"
+
+    def __init__(self, min_len: int = 4):
+        self.min_len = min_len
+        self._buf = ""
+
+    def feed(self, text: str):
+        sentences = []
+        for ch in text:
+            self._buf += ch
+            if ch in self.ENDINGS and len(self._buf.strip()) >= self.min_len:
+                sentences.append(self._buf.strip())
+                self._buf = ""
+        return sentences
+
+    def flush(self):
+        tail = self._buf.strip()
+        self._buf = ""
+        return [tail] if tail else []
@@ -0,0 +1,147 @@
+import asyncio
+import io
+import os
+import wave
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from config import Config
+from services import AIService
+from metrics import traced
+
+
+def pcm_to_wav(pcm: bytes, sample_rate: int) -> bytes:
+    """16bit 单声道 PCM 包成 WAV，给只收文件的远程接口用"""
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm)
+    return buf.getvalue()
+
+
+class STTBackend:
+    """语音识别后端接口"""
+    name = "base"
+    partials = False   # 是否适合边说边出中间结果 (远程按次计费且慢，不做)
+
+    async def transcribe(self, audio, filename: str = "input.webm") -> str:
+        """整段录音 (webm/wav 等封装格式) -> 文字"""
+        raise NotImplementedError
+
+    async def transcribe_pcm(self, pcm: bytes, sample_rate: int) -> str:
+        """16bit 单声道 PCM -> 文字 (流式识别用)"""
+        raise NotImplementedError
+
+
+class RemoteSTT(STTBackend):
+    """SiliconFlow SenseVoice 远程识别 (原来的方式)"""
+    name = "remote"
+
+    async def transcribe(self, audio, filename: str = "input.webm") -> str:
+        return await AIService.speech_to_text(audio, filename=filename)
+
+    async def transcribe_pcm(self, pcm: bytes, sample_rate: int) -> str:
+        return await AIService.speech_to_text(pcm_to_wav(pcm, sample_rate), filename="input.wav")
+
+
+class LocalSTT(STTBackend):
+    """
+    本地 CPU 识别：sherpa-onnx 加载 SenseVoice (int8 ONNX)，完全离线
+    模型目录里需要 model.int8.onnx (或 model.onnx) 和 tokens.txt
+    """
+    name = "local"
+    partials = True
+
+    def __init__(self, model_dir: str, num_threads: int):
+        import sherpa_onnx
+
+        model = os.path.join(model_dir, "model.int8.onnx")
+        if not os.path.exists(model):
+            model = os.path.join(model_dir, "model.onnx")
+        self.recognizer = sherpa_onnx.OfflineRecognizer.from_sense_voice(
+            model=model,
+            tokens=os.path.join(model_dir, "tokens.txt"),
+            num_threads=num_threads,
+            use_itn=True,
+        )
+        # 解码是纯 CPU 计算，用独立线程池，不挤占其它阻塞任务
+        self.executor = ThreadPoolExecutor(max_workers=Config.LOCAL_STT_WORKERS, thread_name_prefix="stt")
+        # 封装格式 (webm) 本地解不了，整段上传时交给远程
+        self.fallback = RemoteSTT()
+
+    def _decode(self, pcm: bytes, sample_rate: int) -> str:
+        samples = np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+        stream = self.recognizer.create_stream()
+        stream.accept_waveform(sample_rate, samples)
+        self.recognizer.decode_stream(stream)
+        return stream.result.text.strip()
+
+    async def transcribe(self, audio, filename: str = "input.webm") -> str:
+        return await self.fallback.transcribe(audio, filename)
+
+    @traced("stt_local", "sherpa-onnx")
+    async def transcribe_pcm(self, pcm: bytes, sample_rate: int) -> str:
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self.executor, self._decode, pcm, sample_rate)
+        except Exception as e:
+            print(f"❌ 本地 STT 失败: {e}")
+            return ""
+
+
+class SpeechStream:
+    """
+    一次说话的流式状态：攒 PCM、判断说话结束 (能量 VAD + 尾部静音)、决定何时出中间结果
+    """
+
+    def __init__(self, sample_rate: int = 16000):
+        self.sample_rate = sample_rate
+        self.pcm = bytearray()
+        self.speech_started = False
+        self.silence_ms = 0.0
+        self.finished = False
+        self._last_partial_len = 0
+
+    def feed(self, frame: bytes) -> bool:
+        """喂一帧 PCM，返回是否检测到说话结束"""
+        if self.finished or not frame:
+            return False
+        self.pcm += frame
+        samples = np.frombuffer(frame[:len(frame) - len(frame) % 2], dtype=np.int16)
+        if not samples.size:
+            return False
+        frame_ms = samples.size * 1000 / self.sample_rate
+        rms = float(np.sqrt(np.mean(samples.astype(np.float32) ** 2)))
+        if rms >= Config.STT_VAD_THRESHOLD:
+            self.speech_started = True
+            self.silence_ms = 0.0
+        elif self.speech_started:
+            self.silence_ms += frame_ms
+        return self.speech_started and self.silence_ms >= Config.STT_ENDPOINT_SILENCE_MS
+
+    def partial_due(self) -> bool:
+        """距上次出中间结果又攒够了一段新音频"""
+        interval_bytes = self.sample_rate * 2 * Config.STT_PARTIAL_INTERVAL_MS // 1000
+        return self.speech_started and len(self.pcm) - self._last_partial_len >= interval_bytes
+
+    def snapshot(self) -> bytes:
+        self._last_partial_len = len(self.pcm)
+        return bytes(self.pcm)
+
+
+_backend = None
+
+def get_stt_backend() -> STTBackend:
+    """按配置选识别后端；本地模型不可用时退回远程"""
+    global _backend
+    if _backend is None:
+        if Config.STT_BACKEND == "local":
+            try:
+                _backend = LocalSTT(Config.LOCAL_STT_MODEL_DIR, Config.LOCAL_STT_THREADS)
+                print(f"🎙️ 本地 STT 已加载: {Config.LOCAL_STT_MODEL_DIR}")
+            except Exception as e:
+                print(f"⚠️ 本地 STT 加载失败，改用远程: {e}")
+        if _backend is None:
+            _backend = RemoteSTT()
+    return _backend
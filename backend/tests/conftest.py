@@ -0,0 +1,9 @@
+import os
+import sys
+
+# 后端模块都是平铺导入的 (from config import Config)，测试也从 backend/ 下导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# router / services 导入时就会按配置建客户端，没有 key 时 openai 会直接报错
+os.environ.setdefault("LLM_API_KEY", "test")
+os.environ.setdefault("SILICON_API_KEY", "test")
@@ -0,0 +1,42 @@
+import base64
+import io
+import pytest
+from PIL import Image, ImageDraw
+from config import Config
+from capture import ScreenCapturer
+
+
+def decoded_size(encoded: str):
+    return Image.open(io.BytesIO(base64.b64decode(encoded))).size
+
+
+@pytest.fixture
+def capturer(monkeypatch):
+    monkeypatch.setattr(Config, "CAPTURE_REGION", "changes")
+    blank = Image.new("RGB", (1920, 1080), "white")
+    changed = blank.copy()
+    ImageDraw.Draw(changed).rectangle((100, 100, 300, 300), fill="black")
+    frames = [blank, changed, changed]
+    return ScreenCapturer(grab=lambda: frames.pop(0))
+
+
+def test_change_mode_sends_crop_but_reuses_full_frame(capturer):
+    full = capturer.capture()
+    crop = capturer.capture()
+    reused = capturer.capture()
+    assert decoded_size(full)[0] == Config.CAPTURE_MAX_WIDTH
+    assert decoded_size(crop)[0] < Config.CAPTURE_MAX_WIDTH
+    # 没变化时复用的是整屏，不是上次裁出来的局部
+    assert reused != crop
+    assert decoded_size(reused) == decoded_size(full)
+
+
+def test_unchanged_screen_is_encoded_once(monkeypatch):
+    monkeypatch.setattr(Config, "CAPTURE_REGION", "screen")
+    frame = Image.new("RGB", (1280, 720), "white")
+    c = ScreenCapturer(grab=lambda: frame)
+    encoded = []
+    real_encode = c._encode
+    monkeypatch.setattr(c, "_encode", lambda image: encoded.append(image) or real_encode(image))
+    assert c.capture() == c.capture()
+    assert len(encoded) == 1
@@ -0,0 +1,43 @@
+import asyncio
+import datetime
+from types import SimpleNamespace
+from config import Config
+from consolidation import CONSOLIDATED_KEY, consolidate, week_groups
+
+NOW = datetime.datetime(2024, 6, 1).timestamp()
+DAY = 86400
+
+
+def entry(i, days_ago, **meta):
+    return (f"e{i}", f"经历{i}", {"timestamp": NOW - days_ago * DAY, **meta})
+
+
+def test_week_groups_only_merge_old_full_weeks(monkeypatch):
+    monkeypatch.setattr(Config, "CONSOLIDATION_MIN_AGE_DAYS", 14)
+    monkeypatch.setattr(Config, "CONSOLIDATION_MIN_GROUP", 3)
+    old_week = [entry(i, 60 + i * 0.1) for i in range(3)]
+    sparse_week = [entry(10, 90)]
+    recent = [entry(20 + i, 2) for i in range(5)]
+    summary = [entry(30, 60, kind="summary")]
+    groups = week_groups(old_week + sparse_week + recent + summary, NOW)
+    assert [[e[0] for _, e in g] for g in groups] == [["e2", "e1", "e0"]]
+
+
+class FakeCollection:
+    def __init__(self, metadata):
+        self.metadata = metadata
+
+    def modify(self, metadata):
+        self.metadata = metadata
+
+
+def test_run_time_is_stored_in_collection_metadata():
+    col = FakeCollection({"embedding_model": "m"})
+
+    async def ready():
+        pass
+    memory = SimpleNamespace(ready=ready, vectors_ok=False, episodic_col=col, last_consolidation=0.0)
+
+    asyncio.run(consolidate(memory, now=NOW))
+    assert col.metadata == {"embedding_model": "m", CONSOLIDATED_KEY: NOW}
+    assert memory.last_consolidation == NOW
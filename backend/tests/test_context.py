@@ -0,0 +1,84 @@
+import asyncio
+from config import Config
+from context import ContextWindow, count_message_tokens
+
+
+def messages(n):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"第{i}条消息" + "内容" * 20}
+            for i in range(n)]
+
+
+def total(history):
+    return sum(count_message_tokens(m) for m in history)
+
+
+def test_compact_trims_to_ratio_then_only_appends():
+    async def main():
+        calls = []
+
+        async def summarizer(previous, batch):
+            calls.append(len(batch))
+            return previous + f"[{len(batch)}]"
+
+        budget = total(messages(10))
+        window = ContextWindow(summarizer, history_budget=budget)
+        history = window.compact(messages(11))
+        assert total(history) <= budget * Config.HISTORY_COMPACT_RATIO
+        kept = len(history)
+        # 之后几轮没超预算：历史只追加，开头不变
+        first = history[0]
+        history = window.compact(history + messages(2))
+        assert history[0] is first and len(history) == kept + 2
+        await asyncio.sleep(0)
+        await window._task
+        return calls, window
+
+    calls, window = asyncio.run(main())
+    assert calls and window.summary and not window._pending
+
+
+def test_fit_keeps_most_recent_history():
+    window = ContextWindow(None, total_budget=200)
+    system, current = {"role": "system", "content": "人设"}, {"role": "user", "content": "你好"}
+    msgs, stats = window.fit(system, messages(20), current)
+    assert msgs[0] is system and msgs[-1] is current
+    assert msgs[-2]["content"].startswith("第19条")
+    assert stats["total"] <= 200
+
+
+def test_pending_kept_until_summary_succeeds():
+    async def main():
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def summarizer(previous, batch):
+            started.set()
+            await release.wait()
+            return "摘要"
+
+        window = ContextWindow(summarizer, history_budget=total(messages(4)))
+        window.compact(messages(6))
+        await started.wait()
+        # 摘要还在跑的时候存盘：移出历史的消息要在状态里
+        in_flight = window.to_state()["pending"]
+        release.set()
+        await window.wait_summary(1)
+        return in_flight, window
+
+    in_flight, window = asyncio.run(main())
+    assert in_flight and window.summary == "摘要" and window._pending == []
+
+
+def test_summary_failure_keeps_pending():
+    async def main():
+        async def summarizer(previous, batch):
+            raise RuntimeError("boom")
+
+        window = ContextWindow(summarizer, history_budget=total(messages(4)))
+        window.compact(messages(6))
+        pending = list(window._pending)
+        await window.wait_summary(1)
+        return pending, window
+
+    pending, window = asyncio.run(main())
+    assert pending and window._pending == pending and window.summary == ""
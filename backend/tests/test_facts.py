@@ -0,0 +1,40 @@
+import json
+import os
+from facts import FactStore, fact_topic
+
+
+def test_upsert_keeps_history(tmp_path):
+    store = FactStore(str(tmp_path / "facts.db"))
+    assert store.upsert("u", {"城市": "北京", "宠物.名字": "旺财"}) == 2
+    assert store.upsert("u", {"城市": "北京"}) == 0          # 没变不记新版本
+    assert store.upsert("u", {"城市": "上海"}) == 1
+    assert store.get("u", ["城市"]) == {"城市": "上海"}
+    assert [h["value"] for h in store.history("u", "城市")] == ["北京", "上海"]
+    assert store.by_topic("u", "宠物") == {"宠物.名字": "旺财"}
+    assert store.load("other") == {}
+
+
+def test_load_keeps_first_seen_order(tmp_path):
+    store = FactStore(str(tmp_path / "facts.db"))
+    store.upsert("u", {"a": 1}, now=1.0)
+    store.upsert("u", {"b": 2}, now=2.0)
+    store.upsert("u", {"a": 3}, now=3.0)
+    assert list(store.load("u").items()) == [("a", 3), ("b", 2)]
+
+
+def test_import_json_once_without_touching_file(tmp_path):
+    path = tmp_path / "user_facts.json"
+    path.write_text(json.dumps({"名字": "小明", "生日": "5月1日"}, ensure_ascii=False), encoding="utf-8")
+    store = FactStore(str(tmp_path / "facts.db"))
+    assert store.import_json("u", str(path)) == 2
+    assert os.path.exists(path)
+    store.upsert("u", {"名字": "大明"})
+    # 第二次启动不再导入，不会把改过的值盖回去
+    assert store.import_json("u", str(path)) == 0
+    assert store.load("u") == {"名字": "大明", "生日": "5月1日"}
+
+
+def test_fact_topic():
+    assert fact_topic("宠物.名字") == "宠物"
+    assert fact_topic("pet_name") == "pet"
+    assert fact_topic("生日") == "生日"
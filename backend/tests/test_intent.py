@@ -0,0 +1,49 @@
+import pytest
+from intent import classifier
+
+
+@pytest.mark.parametrize("text, action", [
+    ("闭嘴", "silence"),
+    ("别吵了", "silence"),
+    ("你好", "greeting"),
+    ("谢谢", "thanks"),
+    ("拜拜", "bye"),
+])
+def test_fast_path_for_plain_phrases(text, action):
+    result = classifier.classify(text)
+    assert result["action"] == action
+    assert not result["llm"]
+    assert not result["retrieval"]
+
+
+@pytest.mark.parametrize("text", [
+    # 否定
+    "不要闭嘴", "我不想安静", "不要闭嘴嘛", "你别安静",
+    # 客套话后面跟着要记住的事
+    "闭嘴，我说我是秦始皇", "谢谢，我叫李雷", "谢谢你帮我记住生日", "谢谢，我叫韩梅梅", "晚安，明天八点叫我",
+])
+def test_negations_and_compound_turns_go_to_llm(text):
+    assert classifier.classify(text)["llm"]
+
+
+@pytest.mark.parametrize("text", ["晚安啦我好累", "别说话了，我今天很难过", "早上吃了包子"])
+def test_low_confidence_turns_keep_retrieval(text):
+    assert classifier.classify(text)["retrieval"]
+
+
+def test_confident_ack_skips_retrieval():
+    result = classifier.classify("好的")
+    assert result["action"] == "ack"
+    assert result["llm"]
+    assert not result["retrieval"]
+
+
+@pytest.mark.parametrize("text, vision", [
+    ("帮我看看这个报错", True),
+    ("看看我的屏幕", True),
+    ("你看我多厉害", False),
+    ("这是什么", False),
+    ("今天好累啊", False),
+])
+def test_vision_only_for_screen_requests(text, vision):
+    assert classifier.classify(text)["vision"] is vision
@@ -0,0 +1,43 @@
+import pytest
+import proactive
+from config import Config
+from proactive import ProactivePool
+
+KEY = ((3, 1), "", False)
+
+
+@pytest.fixture(autouse=True)
+def pool_config(monkeypatch):
+    monkeypatch.setattr(Config, "PROACTIVE_POOL_SIZE", 1)
+    monkeypatch.setattr(Config, "PROACTIVE_POOL_TTL", 900)
+
+
+def test_take_matching_candidate_once():
+    pool = ProactivePool()
+    assert pool.needs_fill(KEY)
+    pool.add(KEY, {"reply": "在吗？"})
+    assert not pool.needs_fill(KEY)
+    assert pool.take(KEY) == {"reply": "在吗？"}
+    assert pool.take(KEY) is None
+
+
+def test_context_change_invalidates():
+    pool = ProactivePool()
+    pool.add(KEY, {"reply": "在吗？"})
+    assert pool.take(((4, 2), "", False)) is None
+    # 作废的候选不会在上下文变回来后复活
+    assert pool.take(KEY) is None
+
+
+def test_dnd_change_invalidates():
+    pool = ProactivePool()
+    pool.add(KEY, {"reply": "在吗？"})
+    assert pool.take(((3, 1), "", True)) is None
+
+
+def test_expired_candidate_dropped(monkeypatch):
+    pool = ProactivePool()
+    pool.add(KEY, {"reply": "在吗？"})
+    now = proactive.time.time()
+    monkeypatch.setattr(proactive.time, "time", lambda: now + Config.PROACTIVE_POOL_TTL + 1)
+    assert pool.take(KEY) is None
@@ -0,0 +1,87 @@
+import random
+from retrieval import HybridRetriever, KeywordIndex, RecallIndex
+
+NOW = 1_700_000_000.0
+
+
+def build(docs):
+    index = KeywordIndex()
+    index.add([f"d{i}" for i in range(len(docs))], docs, [{} for _ in docs])
+    return index
+
+
+def test_single_episode_is_found():
+    index = build(["周末和小明去爬山"])
+    assert [doc_id for doc_id, _ in index.search("爬山", 5)] == ["d0"]
+
+
+def test_common_term_in_small_store_is_found():
+    index = build(["周末去爬山", "明天去爬山", "晚饭吃了火锅"])
+    assert {doc_id for doc_id, _ in index.search("爬山", 5)} == {"d0", "d1"}
+
+
+def test_removed_episode_not_returned():
+    index = build(["周末去爬山", "晚饭吃了火锅"])
+    index.remove(["d0"])
+    assert index.search("爬山", 5) == []
+
+
+def test_rrf_prefers_docs_found_by_both_rankings():
+    retriever = HybridRetriever(None)
+    docs = {d: (d, {"timestamp": NOW}) for d in ("a", "b", "c")}
+    ranked = retriever.fuse([["a", "b"], ["b", "c"]], docs, 3, now=NOW)
+    assert [r["id"] for r in ranked] == ["b", "a", "c"]
+
+
+def test_rrf_decays_older_memories():
+    retriever = HybridRetriever(None)
+    docs = {"old": ("old", {"timestamp": NOW - 365 * 86400}), "new": ("new", {"timestamp": NOW})}
+    # 排名完全对称，只差新旧
+    ranked = retriever.fuse([["old", "new"], ["new", "old"]], docs, 2, now=NOW)
+    assert [r["id"] for r in ranked] == ["new", "old"]
+
+
+def test_rrf_falls_back_to_keyword_index_for_docs():
+    retriever = HybridRetriever(None)
+    retriever.index.add(["k"], ["晚饭吃了火锅"], [{"date": "2024-01-01"}])
+    ranked = retriever.fuse([[], ["k", "gone"]], {}, 5, now=NOW)
+    assert [(r["id"], r["content"], r["date"]) for r in ranked] == [("k", "晚饭吃了火锅", "2024-01-01")]
+
+
+def build_recall(n, now=NOW):
+    recall = RecallIndex()
+    ids = [f"r{i}" for i in range(n)]
+    metas = [{"timestamp": now - 30 * 86400, "recalls": i} for i in range(n)]
+    recall.add(ids, [f"经历{i}" for i in range(n)], metas, now=now)
+    return recall
+
+
+def test_recall_remove_swaps_tail_into_hole():
+    recall = build_recall(4)
+    recall.remove(["r1", "missing"])
+    assert recall.ids == ["r0", "r3", "r2"]
+    assert all(recall.pos[doc_id] == i for i, doc_id in enumerate(recall.ids))
+    # 挪过去的那条带着自己的计数
+    assert list(recall.recalls) == [0, 3, 2]
+    recall.remove(["r2"])   # 删末位不用挪
+    assert recall.ids == ["r0", "r3"] and len(recall.base) == 2
+
+
+def test_recall_add_skips_duplicates_and_empty_docs():
+    recall = build_recall(2)
+    recall.add(["r0", "r9"], ["重复", ""], [{}, {}], now=NOW)
+    assert len(recall) == 2
+
+
+def test_recall_sampling_avoids_recently_recalled():
+    random.seed(0)
+    recall = build_recall(2)
+    recall.recalls[1] = 0
+    assert recall.mark("r0", now=NOW) == (1, NOW)
+    assert recall.mark("missing", now=NOW) is None
+    picks = [recall.sample(now=NOW + 60) for _ in range(200)]
+    assert picks.count("r1") > picks.count("r0") * 5
+
+
+def test_recall_sample_empty():
+    assert RecallIndex().sample() is None
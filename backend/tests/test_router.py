@@ -0,0 +1,114 @@
+import asyncio
+import json
+from types import SimpleNamespace
+import httpx
+import pytest
+import transport
+from config import Config
+from metrics import metrics
+from router import CONTINUE_PROMPT, LLMBackend, LLMRouter
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def chunk(text):
+    return SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+
+class FakeStream:
+    def __init__(self, parts, error=None):
+        self.parts = parts
+        self.error = error
+        self.closed = False
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        for part in self.parts:
+            yield chunk(part)
+        if self.error:
+            raise self.error
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeClient:
+    """只实现 client.chat.completions.create，记下每次收到的 messages"""
+
+    def __init__(self, reply=None, parts=None, error=None):
+        self.reply = reply
+        self.parts = parts
+        self.error = error
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, model, messages, stream=False, **params):
+        self.requests.append(messages)
+        if stream:
+            return FakeStream(self.parts or [], self.error)
+        if self.error:
+            raise self.error
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=self.reply))], usage=None)
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(transport, "breakers", {})
+
+
+def test_chat_fails_over_to_next_backend():
+    bad = FakeClient(reply="不是 JSON")
+    good = FakeClient(reply=json.dumps({"reply": "你好"}))
+    router = LLMRouter([LLMBackend("a", bad, "m"), LLMBackend("b", good, "m")])
+
+    assert run(router.chat([{"role": "user", "content": "hi"}])) == {"reply": "你好"}
+    assert len(bad.requests) == 1 and len(good.requests) == 1
+    assert router.backends[0].error_rate > 0
+    assert router.backends[1].latency_ms is not None
+
+
+def test_chat_raises_when_all_backends_fail():
+    router = LLMRouter([LLMBackend("a", FakeClient(error=ValueError("boom")), "m")])
+    with pytest.raises(RuntimeError, match="a: boom"):
+        run(router.chat([{"role": "user", "content": "hi"}]))
+
+
+def test_stream_continues_on_next_backend_after_midstream_failure():
+    broken = FakeClient(parts=['{"reply": "你'], error=httpx.ReadError("reset"))
+    backup = FakeClient(parts=['好"}'])
+    router = LLMRouter([LLMBackend("a", broken, "m"), LLMBackend("b", backup, "m")])
+    messages = [{"role": "user", "content": "hi"}]
+
+    async def collect():
+        return "".join([part async for part in router.stream(messages)])
+
+    assert run(collect()) == '{"reply": "你好"}'
+    # 接手的后端看到已经输出的部分 + 接着写的提示
+    assert backup.requests[0][-2:] == [
+        {"role": "assistant", "content": '{"reply": "你'},
+        {"role": "user", "content": CONTINUE_PROMPT},
+    ]
+    # 读流中途断开也计入熔断
+    assert transport.breaker("a").failures == 1
+    assert transport.breaker("b").failures == 0
+    assert ("llm_stream_first", "a") in metrics.samples
+    assert ("llm_stream_first", "b") in metrics.samples
+
+
+def test_candidates_put_open_circuit_last(monkeypatch):
+    monkeypatch.setattr(Config, "CIRCUIT_FAILURES", 1)
+    a, b = LLMBackend("a", FakeClient(), "m"), LLMBackend("b", FakeClient(), "m")
+    router = LLMRouter([a, b])
+    assert router.candidates() == [a, b]
+    transport.breaker("a").record(False)
+    assert router.candidates() == [b, a]
+
+
+def test_vision_turns_only_go_to_vision_backends():
+    a, b = LLMBackend("a", FakeClient(), "m"), LLMBackend("b", FakeClient(), "m", vision=True)
+    assert LLMRouter([a, b]).candidates(vision=True) == [b]
+
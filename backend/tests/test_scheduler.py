@@ -0,0 +1,56 @@
+import asyncio
+import time
+from scheduler import DeadlineScheduler
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_fires_once_at_deadline():
+    async def main():
+        s, fired = DeadlineScheduler(), []
+        s.schedule("a", time.time() + 0.02, lambda: fired.append("a"))
+        assert fired == [] and len(s) == 1
+        await asyncio.sleep(0.06)
+        return fired, len(s)
+
+    assert run(main()) == (["a"], 0)
+
+
+def test_reschedule_replaces_old_deadline():
+    async def main():
+        s, fired = DeadlineScheduler(), []
+        s.schedule("a", time.time() + 0.02, lambda: fired.append("old"))
+        s.schedule("a", time.time() + 0.05, lambda: fired.append("new"))
+        assert len(s) == 1
+        await asyncio.sleep(0.035)
+        early = list(fired)
+        await asyncio.sleep(0.05)
+        return early, fired
+
+    assert run(main()) == ([], ["new"])
+
+
+def test_cancel_and_past_deadline():
+    async def main():
+        s, fired = DeadlineScheduler(), []
+        s.schedule("a", time.time() + 0.01, lambda: fired.append("a"))
+        s.cancel("a")
+        s.cancel("missing")
+        s.schedule("b", time.time() - 5, lambda: fired.append("b"))   # 已经过期的马上触发
+        await asyncio.sleep(0.03)
+        return fired, len(s)
+
+    assert run(main()) == (["b"], 0)
+
+
+def test_callback_error_does_not_break_other_keys():
+    async def main():
+        s, fired = DeadlineScheduler(), []
+        s.schedule("bad", time.time(), lambda: 1 / 0)
+        s.schedule("good", time.time(), lambda: fired.append("good"))
+        await asyncio.sleep(0.02)
+        return fired
+
+    assert run(main()) == ["good"]
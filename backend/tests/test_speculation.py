@@ -0,0 +1,101 @@
+import asyncio
+from speculation import Speculation
+
+TEXT = "今天天气怎么样"
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_take_after_speculation_finished():
+    async def main():
+        spec = Speculation(lambda text: asyncio.sleep(0, {"prompt": text}))
+        spec._start(TEXT)
+        await asyncio.sleep(0.01)
+        return await spec.take(TEXT)
+
+    assert run(main()) == {"prompt": TEXT, "result": None, "exact": True}
+
+
+def test_take_while_speculation_still_running():
+    async def prepare(text):
+        await asyncio.sleep(0.05)
+        return {"prompt": text}
+
+    async def main():
+        spec = Speculation(prepare)
+        spec._start(TEXT)
+        return await spec.take(TEXT)
+
+    assert run(main()) == {"prompt": TEXT, "result": None, "exact": True}
+
+
+def test_take_cancelled_speculation_falls_back():
+    async def main():
+        spec = Speculation(lambda text: asyncio.sleep(10))
+        spec._start(TEXT)
+        asyncio.get_running_loop().call_later(0.01, spec.task.cancel)
+        return await spec.take(TEXT)
+
+    assert run(main()) is None
+
+
+def test_take_failed_speculation_falls_back():
+    async def prepare(text):
+        raise RuntimeError("boom")
+
+    async def main():
+        spec = Speculation(prepare)
+        spec._start(TEXT)
+        return await spec.take(TEXT)
+
+    assert run(main()) is None
+
+
+def test_take_mismatch_cancels():
+    async def main():
+        spec = Speculation(lambda text: asyncio.sleep(10))
+        spec._start(TEXT)
+        task = spec.task
+        result = await spec.take("帮我订一张去上海的机票")
+        await asyncio.sleep(0)
+        return result, task.cancelled()
+
+    assert run(main()) == (None, True)
+
+
+def test_exact_hit_waits_for_reply_stage():
+    async def respond(text, prepared):
+        await asyncio.sleep(0.02)
+        return {"reply": "晴天"}
+
+    async def main():
+        spec = Speculation(lambda text: asyncio.sleep(0, {"prompt": text}), respond)
+        spec._start(TEXT)
+        return await spec.take(TEXT)
+
+    assert run(main())["result"] == {"reply": "晴天"}
+
+
+def test_near_hit_skips_reply_stage():
+    started = {}
+
+    async def respond(text, prepared):
+        started["task"] = asyncio.current_task()
+        await asyncio.sleep(10)
+
+    async def main():
+        spec = Speculation(lambda text: asyncio.sleep(0, {"prompt": text}), respond)
+        spec._start(TEXT)
+        await asyncio.sleep(0.01)
+        loop = asyncio.get_running_loop()
+        begin = loop.time()
+        prepared = await spec.take("今天天气怎么样啊")
+        elapsed = loop.time() - begin
+        await asyncio.sleep(0)
+        return prepared, elapsed, started["task"].cancelled()
+
+    prepared, elapsed, cancelled = run(main())
+    assert prepared == {"prompt": TEXT, "result": None, "exact": False}
+    assert elapsed < 1 and cancelled
@@ -0,0 +1,42 @@
+import json
+import pytest
+from streaming import JsonFieldStreamer, SentenceSplitter
+
+
+def stream(payload: str, size: int):
+    streamer = JsonFieldStreamer(("reply", "emotion"))
+    pieces = []
+    for i in range(0, len(payload), size):
+        pieces.extend(text for field, text in streamer.feed(payload[i:i + size]) if field == "reply")
+    return "".join(pieces), streamer
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, 1000])
+def test_reply_streamed_across_chunk_boundaries(size):
+    data = {"thought": "嗯", "reply": "你好！\n今天\"不错\"吧？", "emotion": "happy", "memory_operation": {"reply": "x"}}
+    text, streamer = stream(json.dumps(data, ensure_ascii=False), size)
+    assert text == data["reply"]
+    assert streamer.values["emotion"] == "happy"
+    assert streamer.result() == data
+
+
+@pytest.mark.parametrize("size", [1, 2, 5, 1000])
+def test_escaped_emoji_becomes_one_character(size):
+    data = {"reply": "哈哈😀好耶", "emotion": "happy"}
+    text, _ = stream(json.dumps(data), size)   # ensure_ascii: 😀 -> \ud83d\ude00
+    assert text == "哈哈😀好耶"
+    text.encode("utf-8")
+
+
+def test_lone_surrogates_replaced():
+    text, _ = stream('{"reply": "a\\ud83db\\ude00c\\ud83d"}', 1)
+    assert text == "a�b�c�"
+    text.encode("utf-8")
+
+
+def test_sentence_splitter():
+    splitter = SentenceSplitter(min_len=4)
+    out = splitter.feed("好。今天天气不错！我们出去")
+    assert out == ["好。今天天气不错！"]
+    assert splitter.feed("玩吧") == []
+    assert splitter.flush() == ["我们出去玩吧"]
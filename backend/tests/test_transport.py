@@ -0,0 +1,99 @@
+import asyncio
+import httpx
+import pytest
+import transport
+from config import Config
+from transport import CircuitBreaker, CircuitOpenError, Policy
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(transport, "breakers", {})
+    monkeypatch.setattr(Config, "RETRY_BASE_DELAY", 0)
+    monkeypatch.setitem(transport.POLICIES, "tts", Policy("audio", 5, 2))
+
+
+def flaky(failures: int, error=None):
+    """前 failures 次抛错，之后返回 "ok"；calls 记调用次数"""
+    calls = []
+
+    async def factory():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise error or httpx.ConnectError("refused")
+        return "ok"
+    return factory, calls
+
+
+def test_network_errors_are_retried():
+    factory, calls = flaky(2)
+    assert run(transport.call("tts", factory)) == "ok"
+    assert len(calls) == 3
+    assert transport.breaker("audio").failures == 0
+
+
+def test_gives_up_after_policy_retries():
+    factory, calls = flaky(5)
+    with pytest.raises(httpx.ConnectError):
+        run(transport.call("tts", factory))
+    assert len(calls) == 3
+    assert transport.breaker("audio").failures == 3
+
+
+def test_request_errors_are_not_retried_or_counted():
+    factory, calls = flaky(1, ValueError("bad request"))
+    with pytest.raises(ValueError):
+        run(transport.call("tts", factory))
+    assert len(calls) == 1
+    assert transport.breaker("audio").failures == 0
+
+
+def test_provider_overrides_policy_breaker():
+    factory, _ = flaky(0)
+    run(transport.call("tts", factory, provider="backup"))
+    assert "backup" in transport.breakers
+
+
+def test_hedged_call_uses_first_answer_and_cancels_the_other(monkeypatch):
+    monkeypatch.setitem(transport.POLICIES, "tts", Policy("audio", 5, 0, hedge_after=0.01))
+    started, cancelled = [], []
+
+    async def factory():
+        started.append(1)
+        if len(started) == 1:
+            try:
+                await asyncio.sleep(5)   # 第一份卡住
+            except asyncio.CancelledError:
+                cancelled.append(1)
+                raise
+        return f"answer {len(started)}"
+
+    assert run(transport.call("tts", factory)) == "answer 2"
+    assert cancelled == [1]
+
+
+def test_breaker_opens_then_lets_one_probe_through(monkeypatch):
+    monkeypatch.setattr(Config, "CIRCUIT_FAILURES", 2)
+    monkeypatch.setattr(Config, "CIRCUIT_RESET_SECONDS", 30)
+    clock = [1000.0]
+    monkeypatch.setattr(transport.time, "time", lambda: clock[0])
+    breaker = CircuitBreaker("x")
+
+    breaker.record(False)
+    breaker.check()                   # 还没到阈值
+    breaker.record(False)
+    assert breaker.is_open
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+    clock[0] += 30
+    breaker.check()                   # half-open：放一个试探
+    with pytest.raises(CircuitOpenError):
+        breaker.check()               # 试探还没回来，其他请求照样拒绝
+    breaker.record(True)
+    assert not breaker.is_open
+    breaker.check()
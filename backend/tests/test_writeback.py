@@ -0,0 +1,97 @@
+import asyncio
+import json
+from types import SimpleNamespace
+import pytest
+import writeback
+from metrics import metrics
+from writeback import EpisodeWriter
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class FakeMemory:
+    """只提供 EpisodeWriter 用到的 ready / vectors_ok / 集合 / 检索索引"""
+
+    def __init__(self, vectors_ok=True):
+        self.vectors_ok = vectors_ok
+        self.written = []
+        self.episodic_col = SimpleNamespace(add=lambda ids, **kw: self.written.extend(ids))
+        self.retriever = SimpleNamespace(add=lambda ids, docs, metas: None)
+
+    async def ready(self):
+        pass
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return str(tmp_path / "default.jsonl")
+
+
+def read_journal(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def fake_embeddings(monkeypatch, vectors: dict):
+    async def embed_texts(texts):
+        return [vectors.get(text, []) for text in texts]
+    monkeypatch.setattr(writeback, "embed_texts", embed_texts)
+
+
+def test_journal_replays_unfinished_entries(journal):
+    with open(journal, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"add": {"id": "a", "text": "写完的", "meta": {}}}) + "\n")
+        f.write(json.dumps({"add": {"id": "b", "text": "没写完的", "meta": {}}}) + "\n")
+        f.write(json.dumps({"done": ["a"]}) + "\n")
+        f.write('{"add": {"id": "c", "te')   # 写到一半断电
+    writer = EpisodeWriter(FakeMemory(), journal)
+    assert writer.pending == [("b", "没写完的", {})]
+    # 日志压缩成只剩没写完的
+    assert read_journal(journal) == [{"add": {"id": "b", "text": "没写完的", "meta": {}}}]
+
+
+def test_flush_skips_near_duplicates_and_clears_journal(journal, monkeypatch):
+    fake_embeddings(monkeypatch, {"今天去爬山": [1.0, 0.0], "今天去爬山了": [0.99, 0.01], "晚饭吃火锅": [0.0, 1.0]})
+    memory = FakeMemory()
+    writer = EpisodeWriter(memory, journal)
+
+    async def main():
+        await writer.enqueue(["今天去爬山", "今天去爬山了", "晚饭吃火锅"])
+        return await writer.flush()
+
+    assert run(main()) is True
+    assert len(memory.written) == 2 and writer.pending == []
+    assert read_journal(journal) == []
+    assert len(writer.recent) == 2
+
+
+def test_failed_embeddings_stay_queued(journal, monkeypatch):
+    fake_embeddings(monkeypatch, {"能向量化": [1.0, 0.0]})
+    memory = FakeMemory()
+    writer = EpisodeWriter(memory, journal)
+
+    async def main():
+        await writer.enqueue(["能向量化", "向量化失败"])
+        return await writer.flush()
+
+    assert run(main()) is False
+    assert [text for _, text, _ in writer.pending] == ["向量化失败"]
+    # 重启后还能从日志里恢复
+    assert [text for _, text, _ in EpisodeWriter(memory, journal).pending] == ["向量化失败"]
+
+
+def test_unusable_vectors_defer_to_next_start(journal, monkeypatch):
+    fake_embeddings(monkeypatch, {})
+    writer = EpisodeWriter(FakeMemory(vectors_ok=False), journal)
+    before = metrics.counters.get("episodes_deferred", 0)
+
+    async def main():
+        await writer.enqueue(["先记着"])
+        return await writer.flush()
+
+    assert run(main()) is True
+    assert writer.pending == []
+    assert metrics.counters["episodes_deferred"] == before + 1
+    assert [text for _, text, _ in EpisodeWriter(FakeMemory(), journal).pending] == ["先记着"]
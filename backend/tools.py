@@ -1,27 +1,22 @@
-import base64
-import io
-import pyautogui
-from PIL import Image
+import asyncio
+import contextvars
+from capture import screen_capturer
+from metrics import traced
 
 class ToolBox:
     @staticmethod
+    @traced("screenshot")
     def capture_screen_base64():
-        """截取屏幕，压缩并转为 Base64 (适配 Gemini API)"""
+        """截取屏幕，压缩并转为 Base64 (适配 Gemini API)；画面没变时复用上次的编码结果"""
         try:
-            #  截图
-            screenshot = pyautogui.screenshot()
-            
-            #  压缩 
-            width, height = screenshot.size
-            if width > 640:
-                scale = 640 / width
-                screenshot = screenshot.resize((640, int(height * scale)))
-            
-            #  转 Base64
-            buffered = io.BytesIO()
-            screenshot.save(buffered, format="JPEG", quality=70)
-            img_str = base64.b64encode(buffered.getvalue()).decode("utf-8")
-            return img_str
+            return screen_capturer.capture()
         except Exception as e:
             print(f"❌ 截图失败: {e}")
-            return None
\ No newline at end of file
+            return None
+
+    @staticmethod
+    async def capture_screen_base64_async():
+        """在截图专用的工作线程里跑，避免阻塞事件循环 (带上当前轮次的上下文，截图耗时才记得进这一轮)"""
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+        return await loop.run_in_executor(screen_capturer.executor, ctx.run, ToolBox.capture_screen_base64)
@@ -0,0 +1,214 @@
+"""
+网络层：所有服务商客户端共用的 httpx 连接池 + 调用策略
+- 连接池调大、长连接、能用就开 HTTP/2，启动时先把连接建好 (warmup)
+- 每类接口单独的超时 (整次调用的总预算，含重试)
+- 网络类错误 (超时 / 连不上 / 429 / 5xx) 带抖动的指数退避重试
+- 熔断：同一服务商连续失败太多次就暂时直接报错，不再每次干等超时
+- 对冲 (hedging)：延迟敏感的调用等了一段时间还没回来，就再发一份，谁先回来用谁
+"""
+import asyncio
+import random
+import time
+from dataclasses import dataclass
+from urllib.parse import urlsplit
+import httpx
+import openai
+from config import Config
+from metrics import metrics
+
+try:
+    import h2  # noqa: F401  装了 h2 才能开 HTTP/2
+    HTTP2 = Config.HTTP2
+except ImportError:
+    HTTP2 = False
+
+
+def _make_client() -> httpx.AsyncClient:
+    options = dict(
+        http2=HTTP2,
+        limits=httpx.Limits(
+            max_connections=Config.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=Config.HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=Config.HTTP_KEEPALIVE_EXPIRY,
+        ),
+        # 总超时由调用策略控制，这里只限制建连
+        timeout=httpx.Timeout(None, connect=Config.HTTP_CONNECT_TIMEOUT),
+    )
+    if Config.PROXY:
+        try:
+            return httpx.AsyncClient(proxy=Config.PROXY, **options)
+        except TypeError:
+            return httpx.AsyncClient(proxies=Config.PROXY, **options)   # httpx < 0.26
+    return httpx.AsyncClient(**options)
+
+
+# 全进程共用一个连接池 (不同服务商的连接在池里按域名区分)
+http_client = _make_client()
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    熔断器 (每个服务商一个)
+    closed: 正常；连续失败 CIRCUIT_FAILURES 次 -> open: 直接报错
+    open 过了 CIRCUIT_RESET_SECONDS -> half-open: 放一个请求试试，成功就恢复
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing_since = 0.0   # half-open 试探请求发出的时间
+
+    @property
+    def is_open(self) -> bool:
+        return self.failures >= Config.CIRCUIT_FAILURES
+
+    def check(self):
+        if not self.is_open:
+            return
+        now = time.time()
+        # 试探的请求被取消了没回音，过一个周期再放一个
+        if now - self.opened_at >= Config.CIRCUIT_RESET_SECONDS and now - self.probing_since >= Config.CIRCUIT_RESET_SECONDS:
+            self.probing_since = now   # half-open：这一个请求去试
+            return
+        metrics.incr(f"circuit_rejected_{self.name}")
+        raise CircuitOpenError(f"{self.name} 熔断中，暂停请求")
+
+    def record(self, ok: bool):
+        self.probing_since = 0.0
+        if ok:
+            self.failures = 0
+            return
+        self.failures += 1
+        if self.failures >= Config.CIRCUIT_FAILURES:
+            if self.failures == Config.CIRCUIT_FAILURES:
+                print(f"🔌 {self.name} 连续失败 {self.failures} 次，熔断 {Config.CIRCUIT_RESET_SECONDS}s")
+                metrics.incr(f"circuit_opened_{self.name}")
+            self.opened_at = time.time()
+
+
+breakers = {name: CircuitBreaker(name) for name in ("main", "intent", "audio")}
+
+
+def breaker(name: str) -> CircuitBreaker:
+    """按名字取熔断器，新的服务商 (比如主脑路由里配置的后端) 第一次用到时创建"""
+    if name not in breakers:
+        breakers[name] = CircuitBreaker(name)
+    return breakers[name]
+
+
+@dataclass
+class Policy:
+    provider: str        # 对应哪个熔断器
+    timeout: float       # 整次调用的总预算 (秒)，含重试
+    retries: int
+    hedge_after: float = 0.0   # 等这么久还没回来就再发一份；0 = 不对冲
+
+
+POLICIES = {
+    "llm": Policy("main", Config.TIMEOUT_LLM, Config.RETRY_MAX, Config.HEDGE_LLM_AFTER),
+    "llm_stream": Policy("main", Config.TIMEOUT_LLM, Config.RETRY_MAX, Config.HEDGE_LLM_AFTER),
+    "summary": Policy("main", Config.TIMEOUT_SUMMARY, Config.RETRY_MAX),
+    "tts": Policy("audio", Config.TIMEOUT_TTS, Config.RETRY_MAX, Config.HEDGE_TTS_AFTER),
+    "stt": Policy("audio", Config.TIMEOUT_STT, Config.RETRY_MAX),
+    "embedding": Policy("audio", Config.TIMEOUT_EMBEDDING, Config.RETRY_MAX),
+}
+
+
+def is_retryable(e: BaseException) -> bool:
+    """网络层面的失败才重试 / 计入熔断；参数错、鉴权错重试也没用"""
+    if isinstance(e, (asyncio.TimeoutError, httpx.TransportError, openai.APIConnectionError, openai.RateLimitError)):
+        return True
+    return isinstance(e, openai.APIStatusError) and e.status_code >= 500
+
+
+def _discard(task: asyncio.Task):
+    """对冲输掉的那份：没完成的取消，已经拿到的流式响应关掉，连接还给池子"""
+    if not task.done():
+        task.cancel()
+    elif not task.cancelled() and task.exception() is None:
+        close = getattr(task.result(), "close", None)
+        if close and asyncio.iscoroutinefunction(close):
+            asyncio.create_task(close())
+
+
+async def _hedged(endpoint: str, factory, hedge_after: float):
+    first = asyncio.create_task(factory())
+    done, _ = await asyncio.wait({first}, timeout=hedge_after)
+    if done:
+        return first.result()
+    metrics.incr(f"http_hedged_{endpoint}")
+    second = asyncio.create_task(factory())
+    pending, winner, error = {first, second}, None, None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    winner = task
+                    if task is second:
+                        metrics.incr(f"http_hedge_wins_{endpoint}")
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in (first, second):
+            if task is not winner:
+                _discard(task)
+
+
+async def call(endpoint: str, factory, timeout: float = None, provider: str = None):
+    """
+    按接口策略调用 factory (无参、每次返回一个新协程)
+    超时 / 网络错误自动重试，全部失败后抛出最后一次的异常
+    provider 覆盖策略里默认的服务商 (熔断按它算)
+    """
+    policy = POLICIES[endpoint]
+    circuit = breaker(provider or policy.provider)
+    deadline = time.monotonic() + (timeout or policy.timeout)
+    attempt = 0
+    while True:
+        circuit.check()
+        remaining = deadline - time.monotonic()
+        try:
+            if policy.hedge_after and policy.hedge_after < remaining:
+                result = await asyncio.wait_for(_hedged(endpoint, factory, policy.hedge_after), remaining)
+            else:
+                result = await asyncio.wait_for(factory(), remaining)
+            circuit.record(True)
+            return result
+        except Exception as e:
+            if not is_retryable(e):
+                circuit.record(True)   # 服务商有回应 (只是请求本身有问题)，不算它挂了
+                raise
+            circuit.record(False)
+            # 全抖动退避：0.5~1.5 倍的 base * 2^n
+            delay = Config.RETRY_BASE_DELAY * (2 ** attempt) * random.uniform(0.5, 1.5)
+            if attempt >= policy.retries or deadline - time.monotonic() < delay + 1.0:
+                raise
+            attempt += 1
+            metrics.incr(f"http_retries_{endpoint}")
+            print(f"🔁 {endpoint} 第 {attempt} 次重试 ({type(e).__name__}: {e})")
+            await asyncio.sleep(delay)
+
+
+async def warmup(base_urls: list):
+    """启动时先对每个服务商建好连接 (TCP + TLS + HTTP/2)，第一轮对话不用再等握手"""
+    async def touch(url):
+        parts = urlsplit(url)
+        try:
+            await http_client.get(f"{parts.scheme}://{parts.netloc}/", timeout=Config.HTTP_CONNECT_TIMEOUT)
+        except Exception as e:
+            print(f"⚠️ 预热连接失败 {parts.netloc}: {e}")
+    urls = {url for url in base_urls if url}
+    started = time.perf_counter()
+    await asyncio.gather(*(touch(url) for url in urls))
+    print(f"🔗 连接预热完成: {len(urls)} 个服务商, {(time.perf_counter() - started) * 1000:.0f}ms, HTTP/2={'开' if HTTP2 else '关'}")
+
+
+async def aclose():
+    await http_client.aclose()
@@ -0,0 +1,182 @@
+import asyncio
+import datetime
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+import numpy as np
+from config import Config
+from embeddings import embed_texts
+from metrics import metrics
+
+
+class EpisodeWriter:
+    """
+    经历的后台写入队列 (write-behind)
+    - 主流程只负责入队 (追加一行日志)，回复不用等向量化和 Chroma
+    - 攒一小批再一起向量化、一起写库
+    - 和最近写过的经历太像 (余弦相似度超过阈值) 的直接跳过
+    - 日志 (journal) 先落盘，进程挂了重启后补写
+    """
+
+    def __init__(self, memory, journal_path: str):
+        self.memory = memory             # 所属的 MemorySystem (提供集合和关键词索引)
+        self.journal_path = journal_path
+        self.pending = []                # [(id, 文本, 元数据)]
+        self.recent = deque(maxlen=Config.EPISODE_DEDUP_WINDOW)   # 最近写入的向量 (已归一化)
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._journal_lock = threading.Lock()
+        self._task = None
+        self._load_journal()
+
+    # === 日志 ===
+    def _load_journal(self):
+        if not os.path.exists(self.journal_path):
+            return
+        added, done = {}, set()
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue   # 写到一半断电的最后一行
+                if "add" in record:
+                    added[record["add"]["id"]] = record["add"]
+                elif "done" in record:
+                    done.update(record["done"])
+        self.pending = [(r["id"], r["text"], r["meta"]) for i, r in added.items() if i not in done]
+        if self.pending:
+            print(f"♻️ 从日志恢复 {len(self.pending)} 条还没写入的经历")
+        self._compact_journal()
+
+    def _append_journal(self, records: list):
+        with self._journal_lock:
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _compact_journal(self):
+        """日志只保留还没写入的条目"""
+        with self._journal_lock:
+            pending = list(self.pending)
+            tmp_path = f"{self.journal_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for doc_id, text, meta in pending:
+                    f.write(json.dumps({"add": {"id": doc_id, "text": text, "meta": meta}}, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.journal_path)
+
+    # === 入队 ===
+    async def enqueue(self, texts: list, emotion: str = None):
+        now = datetime.datetime.now()
+        meta = {"timestamp": time.time(), "date": now.strftime("%Y-%m-%d")}
+        if emotion:
+            meta["emotion"] = emotion
+        items = [(str(uuid.uuid4()), text, dict(meta)) for text in texts if text]
+        if not items:
+            return
+        # 先进内存队列再写日志：压缩日志时能看到它，不会被漏掉 (重复的 add 按 id 去重)
+        self.pending.extend(items)
+        await asyncio.to_thread(self._append_journal, [
+            {"add": {"id": doc_id, "text": text, "meta": meta}} for doc_id, text, meta in items
+        ])
+        metrics.incr("episodes_queued", len(items))
+        if len(self.pending) >= Config.EPISODE_BATCH_SIZE:
+            self._wakeup.set()
+        self.start()
+
+    def start(self):
+        if self.pending and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        backoff = Config.EPISODE_FLUSH_INTERVAL
+        while self.pending:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=backoff)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if await self.flush():
+                backoff = Config.EPISODE_FLUSH_INTERVAL
+            else:
+                # 向量化失败：留在队列里，退避后重试
+                backoff = min(backoff * 2, 300)
+
+    # === 落库 ===
+    def _is_duplicate(self, vec, batch_vecs: list) -> bool:
+        candidates = list(self.recent) + batch_vecs
+        if not candidates:
+            return False
+        return float(np.max(np.stack(candidates) @ vec)) >= Config.EPISODE_DEDUP_THRESHOLD
+
+    async def flush(self) -> bool:
+        """把队列里的经历批量写进库，返回是否全部写完"""
+        async with self._flush_lock:
+            if not self.pending:
+                return True
+            # 写完之前条目一直留在 pending 里，中途被取消也不会丢
+            batch = list(self.pending)
+            await self.memory.ready()
+            if not self.memory.vectors_ok:
+                # 向量和当前模型对不上 (迁移失败)：这个进程里写不进去，不再重试
+                # 不记 done，条目留在日志里，下次启动迁移成功后补写
+                print(f"⚠️ 向量库不可用，跳过 {len(batch)} 条经历 (留在日志里，下次启动补写)")
+                metrics.incr("episodes_deferred", len(batch))
+                handled = {item[0] for item in batch}
+                self.pending = [item for item in self.pending if item[0] not in handled]
+                return True
+
+            vectors = await embed_texts([text for _, text, _ in batch])
+            failed, rows, skipped, batch_vecs = [], [], [], []
+            for item, vec in zip(batch, vectors):
+                if not vec:
+                    failed.append(item)
+                    continue
+                unit = np.asarray(vec, dtype=np.float32)
+                unit /= np.linalg.norm(unit) or 1.0
+                if self._is_duplicate(unit, batch_vecs):
+                    skipped.append(item[0])
+                    continue
+                rows.append((item, vec))
+                batch_vecs.append(unit)
+
+            if rows:
+                ids = [item[0] for item, _ in rows]
+                docs = [item[1] for item, _ in rows]
+                metas = [item[2] for item, _ in rows]
+                with metrics.span("episode_flush", "chroma"):
+                    await asyncio.to_thread(
+                        self.memory.episodic_col.add,
+                        ids=ids, documents=docs, metadatas=metas, embeddings=[vec for _, vec in rows]
+                    )
+                await asyncio.to_thread(self.memory.retriever.add, ids, docs, metas)
+                self.recent.extend(batch_vecs)
+
+            done = [item[0] for item, _ in rows] + skipped
+            handled = set(done)
+            self.pending = [item for item in self.pending if item[0] not in handled]
+            await asyncio.to_thread(self._append_journal, [{"done": done}])
+            if not self.pending:
+                # 全部写完，日志清空，不让它一直变长
+                await asyncio.to_thread(self._compact_journal)
+
+            metrics.incr("episodes_written", len(rows))
+            metrics.incr("episodes_deduplicated", len(skipped))
+            print(f"📅 经历写入 {len(rows)} 条 (跳过重复 {len(skipped)}，待重试 {len(failed)})")
+            return not failed
+
+    async def close(self):
+        """退出前把队列写完 (写不完的留在日志里，下次启动补写)"""
+        if self._task:
+            self._task.cancel()
+        try:
+            await self.flush()
+        except Exception as e:
+            print(f"⚠️ 经历写入失败，留在日志里下次补写: {e}")
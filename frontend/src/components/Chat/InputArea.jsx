@@ -10,7 +10,11 @@ const InputArea = ({
     onFileUpload, 
     disabled,
     isAiSpeaking,
-    onRecordStart 
+    onRecordStart,
+    onStreamStart,
+    onAudioFrame,
+    onStreamEnd,
+    voiceStopSignal
   }) => {
     
     // ✅ 新增：让组件自己管理输入框的内容
@@ -63,6 +67,10 @@ const InputArea = ({
             <VoiceInput 
                 onAudioCaptured={handleAudioCaptured} 
                 onRecordStart={onRecordStart}
+                onStreamStart={onStreamStart}
+                onAudioFrame={onAudioFrame}
+                onStreamEnd={onStreamEnd}
+                stopSignal={voiceStopSignal}
                 disabled={disabled}
                 isAiSpeaking={isAiSpeaking} 
             />
@@ -98,6 +106,10 @@ const InputArea = ({
     disabled: PropTypes.bool.isRequired,
     isAiSpeaking: PropTypes.bool, 
     onRecordStart: PropTypes.func,
+    onStreamStart: PropTypes.func,
+    onAudioFrame: PropTypes.func,
+    onStreamEnd: PropTypes.func,
+    voiceStopSignal: PropTypes.number,
   };
   
   export default InputArea;
\ No newline at end of file
@@ -1,10 +1,16 @@
 import React, { useState, useRef, useEffect } from 'react';
 
-export default function VoiceInput({ onAudioCaptured, onRecordStart, disabled }) {
+// 流式模式的采样率 (后端本地识别按 16k 单声道 PCM 处理)
+const STREAM_SAMPLE_RATE = 16000;
+
+export default function VoiceInput({ onAudioCaptured, onRecordStart, onStreamStart, onAudioFrame, onStreamEnd, stopSignal, disabled }) {
   const [isRecording, setIsRecording] = useState(false);
   const mediaRecorderRef = useRef(null);
   const audioChunksRef = useRef([]);
   const streamRef = useRef(null); // 新增：保存流引用以便清理
+  const audioContextRef = useRef(null); // 流式模式：边说边发 PCM 帧
+  // 传了 onAudioFrame 就走流式，否则还是松开后整段上传
+  const streaming = Boolean(onAudioFrame);
 
   // ✅ 安全清理：组件卸载时强制停止录音，释放麦克风
   useEffect(() => {
@@ -12,8 +18,18 @@ export default function VoiceInput({ onAudioCaptured, onRecordStart, disabled })
       if (streamRef.current) {
         streamRef.current.getTracks().forEach(track => track.stop());
       }
+      if (audioContextRef.current) {
+        audioContextRef.current.close();
+      }
     };
   }, []);
+
+  // 后端检测到说完了 (stopSignal 变化)，自动停止录音
+  useEffect(() => {
+    if (stopSignal && isRecording) {
+      stopRecording();
+    }
+  }, [stopSignal]);
   useEffect(() => {
     const handleKeyDown = (e) => {
         // 防止长按重复触发
@@ -50,6 +66,11 @@ export default function VoiceInput({ onAudioCaptured, onRecordStart, disabled })
           onRecordStart(); 
       }
 
+      if (streaming) {
+        startStreaming(stream);
+        return;
+      }
+
       // ⚠️ 注意：Chrome/Electron 默认录制 WebM
       const mediaRecorder = new MediaRecorder(stream, { mimeType: 'audio/webm' });
       
@@ -82,7 +103,38 @@ export default function VoiceInput({ onAudioCaptured, onRecordStart, disabled })
     }
   };
 
+  // 流式：16k 单声道，每 64ms 一帧 16bit PCM
+  const startStreaming = (stream) => {
+    const audioContext = new AudioContext({ sampleRate: STREAM_SAMPLE_RATE });
+    audioContextRef.current = audioContext;
+    const source = audioContext.createMediaStreamSource(stream);
+    const processor = audioContext.createScriptProcessor(1024, 1, 1);
+    processor.onaudioprocess = (event) => {
+      const input = event.inputBuffer.getChannelData(0);
+      const pcm = new Int16Array(input.length);
+      for (let i = 0; i < input.length; i++) {
+        const s = Math.max(-1, Math.min(1, input[i]));
+        pcm[i] = s < 0 ? s * 0x8000 : s * 0x7fff;
+      }
+      onAudioFrame(pcm.buffer);
+    };
+    source.connect(processor);
+    processor.connect(audioContext.destination);
+
+    if (onStreamStart) onStreamStart(audioContext.sampleRate);
+    setIsRecording(true);
+  };
+
   const stopRecording = () => {
+    if (audioContextRef.current && isRecording) {
+      audioContextRef.current.close();
+      audioContextRef.current = null;
+      streamRef.current?.getTracks().forEach(track => track.stop());
+      streamRef.current = null;
+      setIsRecording(false);
+      if (onStreamEnd) onStreamEnd();
+      return;
+    }
     if (mediaRecorderRef.current && isRecording) {
       mediaRecorderRef.current.stop();
       setIsRecording(false);
@@ -6,17 +6,22 @@ export function useAudioQueue(live2dRef) {
   const isPlayingRef = useRef(false);
   const currentAudioRef = useRef(null);
 
-  // === 内部工具：播放 Base64 音频 ===
-  const playAudioBlob = (base64Data) => {
+  // === 内部工具：播放音频 (二进制帧的 ArrayBuffer 或 旧协议的 Base64) ===
+  const playAudioBlob = (audioData) => {
     return new Promise((resolve, reject) => {
       try {
-        const byteCharacters = atob(base64Data);
-        const byteNumbers = new Array(byteCharacters.length);
-        for (let i = 0; i < byteCharacters.length; i++) {
-          byteNumbers[i] = byteCharacters.charCodeAt(i);
+        let blob;
+        if (audioData instanceof ArrayBuffer) {
+          // 二进制协议：直接包成 Blob，不用再解码
+          blob = new Blob([audioData], { type: 'audio/mpeg' });
+        } else {
+          const byteCharacters = atob(audioData);
+          const byteArray = new Uint8Array(byteCharacters.length);
+          for (let i = 0; i < byteCharacters.length; i++) {
+            byteArray[i] = byteCharacters.charCodeAt(i);
+          }
+          blob = new Blob([byteArray], { type: 'audio/mpeg' });
         }
-        const byteArray = new Uint8Array(byteNumbers);
-        const blob = new Blob([byteArray], { type: 'audio/mpeg' });
         const url = URL.createObjectURL(blob);
 
         const audio = new Audio(url);
@@ -56,8 +61,8 @@ export function useAudioQueue(live2dRef) {
       setSubtitle(item.text);
 
       // 3. 播放音频或模拟阅读
-      if (item.audio_base64) {
-        await playAudioBlob(item.audio_base64);
+      if (item.audio || item.audio_base64) {
+        await playAudioBlob(item.audio || item.audio_base64);
       } else {
         await new Promise(r => setTimeout(r, 1000 + item.text.length * 100));
       }
@@ -12,13 +12,28 @@ export function useNeuroSocket(url, onMessage) {
 
   useEffect(() => {
     const ws = new WebSocket(url);
+    ws.binaryType = 'arraybuffer';
     wsRef.current = ws;
+    // 二进制协议：控制帧 (payload.binary = true) 后面紧跟一帧原始音频
+    let pendingPacket = null;
 
     ws.onopen = () => console.log("✅ Neuro Link Connected");
     
     ws.onmessage = (event) => {
       try {
-        const packet = JSON.parse(event.data);
+        let packet;
+        if (event.data instanceof ArrayBuffer) {
+          if (!pendingPacket) return;
+          packet = pendingPacket;
+          packet.payload.audio = event.data;
+          pendingPacket = null;
+        } else {
+          packet = JSON.parse(event.data);
+          if (packet.payload?.binary) {
+            pendingPacket = packet;
+            return;
+          }
+        }
         if (onMessageRef.current) {
           onMessageRef.current(packet);
         }
@@ -36,11 +51,24 @@ export function useNeuroSocket(url, onMessage) {
     };
   }, [url]);
 
-  const sendPacket = useCallback((packet) => {
+  // binary 不为空时按二进制协议发送：先发控制帧，再发原始数据
+  const sendPacket = useCallback((packet, binary) => {
+    if (wsRef.current?.readyState === WebSocket.OPEN) {
+      if (binary) {
+        wsRef.current.send(JSON.stringify({ ...packet, payload: { ...packet.payload, binary: true } }));
+        wsRef.current.send(binary);
+      } else {
+        wsRef.current.send(JSON.stringify(packet));
+      }
+    }
+  }, []);
+
+  // 单独的二进制帧 (流式语音的 PCM 数据)
+  const sendBinary = useCallback((data) => {
     if (wsRef.current?.readyState === WebSocket.OPEN) {
-      wsRef.current.send(JSON.stringify(packet));
+      wsRef.current.send(data);
     }
   }, []);
 
-  return { sendPacket };
+  return { sendPacket, sendBinary };
 }
\ No newline at end of file
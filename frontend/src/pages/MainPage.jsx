@@ -10,10 +10,15 @@ import '../App.css';
 import { useAudioQueue } from '../hooks/useAudioQueue';
 import { useNeuroSocket } from '../hooks/useNeuroSocket';
 
-const WS_URL = 'ws://127.0.0.1:8000/ws';
+// audio=binary：音频走二进制帧，不再 Base64
+const WS_URL = 'ws://127.0.0.1:8000/ws?audio=binary';
 const MSG_TYPE = {
   TEXT_INPUT: "text_input",
   AUDIO_INPUT: "audio_input",
+  AUDIO_STREAM_START: "audio_stream_start",
+  AUDIO_STREAM_END: "audio_stream_end",
+  PARTIAL_TRANSCRIPT: "partial_transcript",
+  CAPABILITIES: "capabilities",
   INTERRUPT: "interrupt",
   STATE_UPDATE: "state_update",
   AUDIO_CHUNK: "audio_chunk",
@@ -26,9 +31,15 @@ export default function MainPage() {
   const [messages, setMessages] = useState([]);
   const [neuroState, setNeuroState] = useState("idle");
   const [sidebarOpen, setSidebarOpen] = useState(false);
+  const [partialText, setPartialText] = useState("");   // 边说边出的识别结果
+  const [voiceStopSignal, setVoiceStopSignal] = useState(0);
+  // 后端用本地识别 (能出中间结果) 时才流式发 PCM，默认整段 WebM 上传
+  const [sttStreaming, setSttStreaming] = useState(false);
   
   const live2dRef = useRef(null);
   const fileInputRef = useRef(null);
+  // 当前有效的轮次：被打断轮次迟到的音频按 turn_id 丢弃
+  const activeTurnRef = useRef(null);
 
   // === 1. 使用音频 Hook (逻辑外包) ===
   const { subtitle, isPlaying, queueAudioChunk, stopAudio } = useAudioQueue(live2dRef);
@@ -36,21 +47,56 @@ export default function MainPage() {
   // === 2. 定义收到消息的处理逻辑 ===
   const handleServerPacket = useCallback((packet) => {
     const { type, payload } = packet;
+    const turnId = payload?.turn_id;
 
     switch (type) {
       case MSG_TYPE.STATE_UPDATE:
+        // 新一轮开始 (thinking) 时认它为当前轮；旧轮次的状态不再理会
+        if (payload.state === "thinking" && turnId) activeTurnRef.current = turnId;
+        if (turnId && turnId !== activeTurnRef.current) break;
         setNeuroState(payload.state);
         break;
       
       case MSG_TYPE.AUDIO_CHUNK:
+        if (turnId && turnId !== activeTurnRef.current) {
+          console.log("🗑️ 丢弃被打断轮次的音频", turnId);
+          break;
+        }
         setNeuroState("idle"); 
         // 收到音频，直接丢给 Hook 处理
         queueAudioChunk(payload);
-        setMessages(prev => [...prev, { type: 'assistant', content: payload.text }]);
+        // 流式回复：seq > 0 的句子接到上一条 AI 消息后面
+        setMessages(prev => {
+          const last = prev[prev.length - 1];
+          if (payload.seq > 0 && last && last.type === 'assistant') {
+            return [...prev.slice(0, -1), { ...last, content: last.content + payload.text }];
+          }
+          return [...prev, { type: 'assistant', content: payload.text }];
+        });
         break;
         
+      case MSG_TYPE.PARTIAL_TRANSCRIPT:
+        if (payload.final) {
+          // 后端判定说完了：停止录音，识别结果由 text_input 回显
+          setPartialText("");
+          setVoiceStopSignal(n => n + 1);
+        } else {
+          setPartialText(payload.text);
+        }
+        break;
+
+      case MSG_TYPE.CAPABILITIES:
+        setSttStreaming(Boolean(payload.stt_streaming));
+        break;
+
+      case MSG_TYPE.TEXT_INPUT:
+        // 语音识别结果回显
+        setMessages(prev => [...prev, { type: 'user', content: payload.text }]);
+        break;
+
       case MSG_TYPE.CANCELED:
-        console.log("🛑 打断确认");
+        console.log("🛑 打断确认", turnId);
+        setNeuroState("idle");
         break;
         
       case MSG_TYPE.ERROR:
@@ -64,12 +110,13 @@ export default function MainPage() {
   }, [queueAudioChunk]);
 
   // === 3. 使用 Socket Hook (逻辑外包) ===
-  const { sendPacket } = useNeuroSocket(WS_URL, handleServerPacket);
+  const { sendPacket, sendBinary } = useNeuroSocket(WS_URL, handleServerPacket);
 
   // === 4. 用户交互逻辑 (保持原来的功能) ===
   
   // 触发打断
   const interruptNeuro = () => {
+    activeTurnRef.current = null; // 之后到达的旧音频全部丢弃
     stopAudio(); // 停止前端
     sendPacket({ type: MSG_TYPE.INTERRUPT }); // 停止后端
   };
@@ -86,32 +133,42 @@ export default function MainPage() {
     });
   };
 
+  // 流式语音：开始 / 每帧 PCM / 结束
+  const handleStreamStart = (sampleRate) => {
+    setPartialText("");
+    sendPacket({ type: MSG_TYPE.AUDIO_STREAM_START, payload: { sample_rate: sampleRate } });
+  };
+
+  const handleStreamEnd = () => {
+    sendPacket({ type: MSG_TYPE.AUDIO_STREAM_END });
+  };
+
   // 发送文件 (逻辑没变，只是复用了 sendPacket)
   const handleUpload = (file) => {
     if (!file) return;
     interruptNeuro();
 
+    if (file.type.startsWith('audio/')) {
+      // 音频直接发原始字节
+      setMessages(prev => [...prev, { type: 'user', content: `📂 ${file.name}` }]);
+      file.arrayBuffer().then(buffer => {
+        sendPacket({ type: MSG_TYPE.AUDIO_INPUT, payload: { format: file.type } }, buffer);
+      });
+      return;
+    }
+
     const reader = new FileReader();
     reader.onload = () => {
       const base64Full = reader.result;
       const base64Data = base64Full.split(',')[1];
-      const mimeType = file.type;
-
-      let msgType = MSG_TYPE.TEXT_INPUT;
-      let payload = {};
 
-      if (mimeType.startsWith('audio/')) {
-        msgType = MSG_TYPE.AUDIO_INPUT;
-        payload = { audio_base64: base64Data, format: mimeType };
-      } else {
-        payload = { 
-          text: `[上传了文件: ${file.name}]`, 
-          image_base64: base64Data 
-        };
-      }
+      const payload = { 
+        text: `[上传了文件: ${file.name}]`, 
+        image_base64: base64Data 
+      };
 
       setMessages(prev => [...prev, { type: 'user', content: `📂 ${file.name}` }]);
-      sendPacket({ type: msgType, payload });
+      sendPacket({ type: MSG_TYPE.TEXT_INPUT, payload });
     };
     reader.readAsDataURL(file);
   };
@@ -128,6 +185,8 @@ export default function MainPage() {
              <div className="status-indicator">
                <LoadingDots /> <span style={{marginLeft:8}}>思考中...</span>
              </div>
+          ) : partialText ? (
+             <div className="subtitle-text">🎙️ {partialText}</div>
           ) : (
              subtitle && <div className="subtitle-text">{subtitle}</div>
           )}
@@ -143,6 +202,10 @@ export default function MainPage() {
       <InputArea 
         onSendMessage={handleSendMessage}
         onRecordStart={interruptNeuro} 
+        onStreamStart={handleStreamStart}
+        onAudioFrame={sttStreaming ? sendBinary : undefined}
+        onStreamEnd={handleStreamEnd}
+        voiceStopSignal={voiceStopSignal}
         fileInputRef={fileInputRef}
         onFileUpload={handleUpload}
         disabled={false}